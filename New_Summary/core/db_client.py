@@ -3,11 +3,20 @@ Supabase 資料庫客戶端 - 用於從 stories 和 cleaned_news 表拉取並組
 """
 
 import os
+import sys
 import logging
 from typing import Dict, List, Optional, Any, Set
-from supabase import create_client, Client
+from supabase import Client
 from datetime import datetime
 
+# 共用的 supabase_repo 位於專案根目錄
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _REPO_ROOT not in sys.path:
+    sys.path.append(_REPO_ROOT)
+
+from supabase_repo import get_client, execute
+from local_mirror import read_table, invalidate
+
 logger = logging.getLogger(__name__)
 
 class SupabaseClient:
@@ -27,7 +36,7 @@ class SupabaseClient:
         if not self.url or not self.key:
             raise ValueError("請設定 SUPABASE_URL 和 SUPABASE_KEY 環境變數")
         
-        self.client: Client = create_client(self.url, self.key)
+        self.client: Client = get_client(self.url, self.key)
         
         # 用來追蹤本次執行中有摘要更新的 story_ids
         self.updated_story_ids: Set[str] = set()
@@ -43,19 +52,18 @@ class SupabaseClient:
             組合後的資料列表，格式類似原 JSON
         """
         try:
-            # 1. 拉取所有 stories
-            stories_response = self.client.table('stories').select('*').execute()
-            stories = stories_response.data
+            # 1. 拉取所有 stories（stories、single_news、cleaned_news 都從本機鏡像讀取，首次讀取時增量同步）
+            stories = read_table('stories', 'story_id, story_title, story_url, category, crawl_date', client=self.client)
             
             logger.info(f"從 stories 表拉取到 {len(stories)} 筆資料")
             
             # 2. 如果需要篩選，先拉取現有的 single_news 記錄
             existing_single_news = {}
             if filter_processed:
-                single_news_response = self.client.table('single_news').select('story_id, total_articles').execute()
+                single_news_rows = read_table('single_news', 'story_id, total_articles', client=self.client)
                 existing_single_news = {
                     item['story_id']: item['total_articles'] 
-                    for item in single_news_response.data
+                    for item in single_news_rows
                 }
                 logger.info(f"從 single_news 表拉取到 {len(existing_single_news)} 筆現有記錄")
             
@@ -64,9 +72,9 @@ class SupabaseClient:
             for idx, story in enumerate(stories, 1):
                 story_id = story.get('story_id')
                 
-                # 2. 根據 story_id 拉取對應的 cleaned_news
-                articles_response = self.client.table('cleaned_news').select('*').eq('story_id', story_id).execute()
-                articles = articles_response.data
+                # 2. 根據 story_id 拉取對應的 cleaned_news（不取壓縮的 raw_html 封存欄位）
+                articles = read_table('cleaned_news', 'article_id, article_title, article_url, content, media',
+                                      client=self.client, story_id=story_id)
                 
                 current_article_count = len(articles)
                 logger.info(f"Story {story_id} 對應到 {current_article_count} 篇文章")
@@ -146,21 +154,13 @@ class SupabaseClient:
                 'generated_date': processed_data.get('processed_at', '') or str(datetime.now().isoformat(sep=' ', timespec='minutes'))
             }
             
-            # 檢查是否已存在
-            existing = self.client.table('single_news').select('story_id').eq('story_id', story_id).execute()
-            
-            if existing.data:
-                # 更新現有記錄
-                response = self.client.table('single_news').update(insert_data).eq('story_id', story_id).execute()
-                logger.info(f"更新 single_news 記錄: {story_id}")
-                # 記錄此 story_id 已更新，需要重新生成 terms
-                self.updated_story_ids.add(story_id)
-            else:
-                # 插入新記錄
-                response = self.client.table('single_news').insert(insert_data).execute()
-                logger.info(f"插入新的 single_news 記錄: {story_id}")
-                # 記錄此 story_id 為新的，需要生成 terms
-                self.updated_story_ids.add(story_id)
+            # story_id 有唯一約束（migrations/002），新增或更新一次完成
+            response = execute(self.client.table('single_news').upsert(insert_data, on_conflict='story_id'))
+            logger.info(f"寫入 single_news 記錄: {story_id}")
+            # 同一行程之後的步驟（例如困難關鍵字）讀 single_news 前要先同步這筆寫入
+            invalidate('single_news')
+            # 記錄此 story_id 已新增或更新，需要重新生成 terms
+            self.updated_story_ids.add(story_id)
             
             return True
             
@@ -185,7 +185,7 @@ class SupabaseClient:
         """測試資料庫連線"""
         try:
             # 簡單查詢測試連線
-            response = self.client.table('stories').select('story_id').limit(1).execute()
+            response = execute(self.client.table('stories').select('story_id').limit(1))
             logger.info("Supabase 連線測試成功")
             return True
         except Exception as e:
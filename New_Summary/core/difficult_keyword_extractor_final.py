@@ -48,6 +48,7 @@ class DiffKeywordConfig:
         'term_map_fields': ['story_id', 'term'],
         'term_table': 'term',
         'term_fields': ['term', 'definition', 'example'],
+        'bulk_load_min_rows': 1000,  # 達到此筆數且設定了 SUPABASE_DB_URL 時改用 COPY 批次載入
     }
     
     # 輸出設定
@@ -123,8 +124,12 @@ class DiffKeywordProcessor:
             raise EnvironmentError("錯誤：找不到 SUPABASE_URL 或 SUPABASE_KEY，請在 .env 檔案中設定")
         
         try:
-            from supabase import create_client
-            self.supabase_client = create_client(supabase_url, supabase_key)
+            # 共用的 supabase_repo 位於專案根目錄
+            repo_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            if repo_root not in sys.path:
+                sys.path.append(repo_root)
+            from supabase_repo import get_client
+            self.supabase_client = get_client(supabase_url, supabase_key)
             logger.info(f"✓ Supabase 連線 ({supabase_url}) 初始化成功")
         except Exception as e:
             logger.error(f"✗ 初始化 Supabase 時發生錯誤: {e}")
@@ -148,67 +153,75 @@ class DiffKeywordProcessor:
             
         return cleaned_text.strip()
 
-    def fetch_combined_data(self, limit: Optional[int] = None, story_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
-        """讀取並合併 single_news 和 term_map 資料"""
+    def fetch_combined_data(self, limit: Optional[int] = None, story_ids: Optional[List[str]] = None,
+                            raise_errors: bool = False) -> List[Dict[str, Any]]:
+        """讀取並合併 single_news 和 term_map 資料；raise_errors=True 時讀取 single_news 失敗會拋出例外而非回傳空 list"""
         logger.info("=== 讀取合併資料 ===")
         
         # 讀取 single_news 資料
         logger.info("讀取 single_news 資料...")
         try:
+            from local_mirror import read_table  # 位於專案根目錄，_setup_supabase 已加入 sys.path
+            from supabase_repo import TableRepo
+            
             table_name = self.db_config['table_name']
             fields = ','.join(self.db_config['select_fields'])
             
-            query = self.supabase_client.table(table_name).select(fields)
             if story_ids:
-                query = query.in_('story_id', story_ids)
-            
-            if limit:
-                query = query.limit(limit)
-                logger.info(f"限制讀取前 {limit} 筆")
+                # 認領到的故事直接讀 Supabase：讀取發生在認領之後，內容不會比重新排入佇列的那次改寫舊
+                # （本機鏡像可能停在改寫之前），而且一批只有幾十筆
+                logger.info(f"讀取指定的 {len(story_ids)} 個故事")
+                news_data = TableRepo(table_name, self.supabase_client).select_in(
+                    fields, 'story_id', story_ids, order_by='story_id'
+                )
+                if limit:
+                    news_data = news_data[:limit]
             else:
-                logger.info("讀取所有資料")
-            
-            resp = query.execute()
-            
-            if getattr(resp, 'error', None):
-                logger.error(f"讀取 {table_name} 失敗: {resp.error}")
-                return []
-            
-            news_data = resp.data or []
+                if limit:
+                    logger.info(f"限制讀取前 {limit} 筆")
+                else:
+                    logger.info("讀取所有資料")
+                # single_news 從本機鏡像讀取（增量同步），鏡像無法使用時改讀 Supabase
+                news_data = read_table(table_name, fields, limit=limit, client=self.supabase_client)
             logger.info(f"成功讀取 {len(news_data)} 筆新聞資料")
             
         except Exception as e:
             logger.error(f"讀取新聞資料時發生錯誤: {e}")
+            if raise_errors:
+                raise
             return []
         
         # 讀取 term_map 資料
         logger.info("讀取 term_map 資料...")
         try:
+            from supabase_repo import TableRepo
+            
             table_name = self.db_config['term_map_table']
             fields = ','.join(self.db_config['term_map_fields'])
             
-            query = self.supabase_client.table(table_name).select(fields)
-            resp = query.execute()
-            
-            if getattr(resp, 'error', None):
-                logger.error(f"讀取 {table_name} 失敗: {resp.error}")
-                term_map = {}
+            repo = TableRepo(table_name, self.supabase_client)
+            if story_ids:
+                # 只讀取指定故事的 term_map
+                rows = repo.select_in(fields, 'story_id', story_ids)
             else:
-                rows = resp.data or []
-                logger.info(f"成功讀取 {len(rows)} 筆 term_map 資料")
-                
-                # 組織成 story_id -> terms 的字典
-                term_map = {}
-                for row in rows:
-                    story_id = row.get('story_id')
-                    term = row.get('term')
-                    
-                    if story_id and term:
-                        if story_id not in term_map:
-                            term_map[story_id] = []
-                        term_map[story_id].append(term)
+                # 分頁串流讀取，(story_id, term) 唯一，可作為穩定的分頁順序
+                rows = repo.iter_rows(fields, order_by='story_id,term')
+            
+            # 組織成 story_id -> terms 的字典
+            term_map = {}
+            row_count = 0
+            for row in rows:
+                row_count += 1
+                story_id = row.get('story_id')
+                term = row.get('term')
                 
-                logger.info(f"組織 term_map: {len(term_map)} 個不同的 story_id")
+                if story_id and term:
+                    if story_id not in term_map:
+                        term_map[story_id] = []
+                    term_map[story_id].append(term)
+            
+            logger.info(f"成功讀取 {row_count} 筆 term_map 資料")
+            logger.info(f"組織 term_map: {len(term_map)} 個不同的 story_id")
             
         except Exception as e:
             logger.error(f"讀取 term_map 資料時發生錯誤: {e}")
@@ -289,6 +302,24 @@ class DiffKeywordProcessor:
         time.sleep(self.api_config['call_delay_seconds'])
         return result
 
+    def _bulk_load(self, table_name: str, rows: List[Dict[str, str]]) -> bool:
+        """資料量大且可直接連線 Postgres 時以 COPY 寫入，成功回傳 True；否則交由 REST 分批寫入"""
+        if len(rows) < self.db_config['bulk_load_min_rows']:
+            return False
+        try:
+            import bulk_loader  # 位於專案根目錄，_setup_supabase 已加入 sys.path
+        except ImportError:
+            return False
+        if not bulk_loader.available():
+            return False
+        try:
+            written = bulk_loader.bulk_upsert(table_name, rows)
+            logger.info(f"✓ 以 COPY 批次載入 {table_name}: {len(rows)} 筆，實際寫入 {written} 筆")
+            return True
+        except Exception as e:
+            logger.warning(f"COPY 批次載入 {table_name} 失敗，改用 REST 分批寫入: {e}")
+            return False
+
     def insert_term_map_data(self, new_combinations: List[Dict[str, str]]) -> bool:
         """將新的 term_map 組合插入資料庫"""
         if not new_combinations:
@@ -298,10 +329,15 @@ class DiffKeywordProcessor:
         logger.info("=== 開始插入 term_map 資料 ===")
         logger.info(f"準備插入 {len(new_combinations)} 筆資料到 {self.db_config['term_map_table']} 表")
         
+        if self._bulk_load(self.db_config['term_map_table'], new_combinations):
+            return True
+        
         success_count = 0
         error_count = 0
         
         try:
+            from supabase_repo import execute  # 對暫時性錯誤自動重試
+
             table_name = self.db_config['term_map_table']
             
             # 批次插入
@@ -310,7 +346,10 @@ class DiffKeywordProcessor:
                 batch = new_combinations[i:i + batch_size]
                 
                 try:
-                    resp = self.supabase_client.table(table_name).insert(batch).execute()
+                    # (story_id, term) 有唯一約束，重複的組合直接略過
+                    resp = execute(self.supabase_client.table(table_name).upsert(
+                        batch, on_conflict='story_id,term', ignore_duplicates=True
+                    ))
                     
                     if getattr(resp, 'error', None):
                         logger.error(f"批次 {i//batch_size + 1} 插入失敗: {resp.error}")
@@ -343,10 +382,15 @@ class DiffKeywordProcessor:
         logger.info("=== 開始插入 term 資料 ===")
         logger.info(f"準備插入 {len(new_terms)} 筆資料到 {self.db_config['term_table']} 表")
         
+        if self._bulk_load(self.db_config['term_table'], new_terms):
+            return True
+        
         success_count = 0
         error_count = 0
         
         try:
+            from supabase_repo import execute  # 對暫時性錯誤自動重試
+
             table_name = self.db_config['term_table']
             
             # 批次插入
@@ -355,7 +399,10 @@ class DiffKeywordProcessor:
                 batch = new_terms[i:i + batch_size]
                 
                 try:
-                    resp = self.supabase_client.table(table_name).insert(batch).execute()
+                    # term 有唯一約束，已存在的詞彙直接略過
+                    resp = execute(self.supabase_client.table(table_name).upsert(
+                        batch, on_conflict='term', ignore_duplicates=True
+                    ))
                     
                     if getattr(resp, 'error', None):
                         logger.error(f"批次 {i//batch_size + 1} 插入失敗: {resp.error}")
@@ -383,18 +430,15 @@ class DiffKeywordProcessor:
         """檢查並準備需要插入到 term_map 的新組合"""
         logger.info("=== 檢查 term_map 重複性 ===")
         
-        # 先取得現有的所有 term_map 組合
+        # 只取得本次處理故事的現有 term_map 組合
         try:
-            table_name = self.db_config['term_map_table']
-            query = self.supabase_client.table(table_name).select('story_id,term')
-            resp = query.execute()
+            from supabase_repo import TableRepo
             
-            if getattr(resp, 'error', None):
-                print(f"讀取 {table_name} 失敗: {resp.error}")
-                return []
+            table_name = self.db_config['term_map_table']
+            rows = TableRepo(table_name, self.supabase_client).select_in('story_id,term', 'story_id', list(story_keywords))
             
             existing_combinations = set()
-            for row in resp.data or []:
+            for row in rows:
                 story_id = row.get('story_id')
                 term = row.get('term')
                 if story_id and term:
@@ -427,18 +471,15 @@ class DiffKeywordProcessor:
         """檢查並準備需要插入到 term 表的新關鍵字定義"""
         print("\n=== 檢查 term 表重複性 ===")
         
-        # 先取得現有的所有 term
+        # 先取得現有的所有 term（term 唯一，以 keyset 分頁串流讀取）
         try:
-            table_name = self.db_config['term_table']
-            query = self.supabase_client.table(table_name).select('term')
-            resp = query.execute()
+            from supabase_repo import TableRepo
             
-            if getattr(resp, 'error', None):
-                print(f"讀取 {table_name} 失敗: {resp.error}")
-                return []
+            table_name = self.db_config['term_table']
+            rows = TableRepo(table_name, self.supabase_client).iter_rows('term', order_by='term', keyset=True)
             
             existing_terms = set()
-            for row in resp.data or []:
+            for row in rows:
                 term = row.get('term')
                 if term:
                     existing_terms.add(term)
@@ -478,12 +519,32 @@ class DiffKeywordProcessor:
         logger.info("  困難關鍵字提取系統 - 可存入資料庫版本")
         logger.info("=" * 80)
 
-        # 1. 讀取並合併 Supabase single_news 和 term_map 資料
-        news_data = self.fetch_combined_data(limit, story_ids)
-        if not news_data:
-            logger.warning("未取得任何資料")
+        # 從 pipeline_state 認領 terms 階段待處理的故事（指定 story_ids 時只認領其中的故事），
+        # 不必下載整張 term_map 比對
+        from pipeline_queue import PipelineQueue, STAGE_TERMS
+        queue = PipelineQueue(STAGE_TERMS, client=self.supabase_client)
+        claimed_story_ids = queue.claim_all(limit, story_ids)
+        if not claimed_story_ids:
+            logger.info("沒有待產生困難關鍵字的故事")
             return
 
+        try:
+            news_data = self.fetch_combined_data(story_ids=claimed_story_ids, raise_errors=True)
+            # single_news 已刪除的故事無從處理，標記完成而非放回，免得永遠留在佇列
+            queue.complete_deleted(claimed_story_ids, [news['story_id'] for news in news_data],
+                                   table=self.db_config['table_name'])
+            success = self._process_stories(news_data) if news_data else False
+        except Exception:
+            queue.release(claimed_story_ids)
+            raise
+        if success:
+            # 只完成在認領之後從 Supabase 讀到內容的故事
+            queue.complete([news['story_id'] for news in news_data])
+        # 其餘（處理失敗的故事）放回佇列；已完成的不受影響
+        queue.release(claimed_story_ids)
+
+    def _process_stories(self, news_data: List[Dict[str, Any]]) -> bool:
+        """對 fetch_combined_data 讀到的故事提取關鍵字、生成解釋並寫入資料庫，全部寫入成功時回傳 True"""
         # 2. 提取所有關鍵字，並根據 story_id 組織
         logger.info("=== 階段一：從新聞中提取困難關鍵字 ===")
         story_keywords = {}
@@ -568,6 +629,7 @@ class DiffKeywordProcessor:
             logger.info(f"{status} 插入 term_map 表: {len(new_combinations)} 筆新組合")
         
         logger.info("=" * 80)
+        return term_success and term_map_success
 
 
 def main():
@@ -0,0 +1,115 @@
+"""DiffKeywordProcessor.run 與 pipeline_state 佇列的互動"""
+import os
+import sys
+from unittest import mock
+
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("tqdm")
+pytest.importorskip("google.genai")
+pytest.importorskip("supabase")
+
+NEW_SUMMARY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_ROOT = os.path.dirname(NEW_SUMMARY_ROOT)
+for path in (NEW_SUMMARY_ROOT, REPO_ROOT):
+    if path not in sys.path:
+        sys.path.append(path)
+
+import local_mirror  # noqa: E402
+import pipeline_queue  # noqa: E402
+import supabase_repo  # noqa: E402
+from core.difficult_keyword_extractor_final import DiffKeywordConfig, DiffKeywordProcessor  # noqa: E402
+
+
+class FakeQueue(pipeline_queue.PipelineQueue):
+    """記錄完成與放回的 story_id；complete_deleted 沿用實際實作"""
+    claimed = []
+
+    def __init__(self, stage, client=None, **kwargs):
+        super().__init__(stage, client=client, worker="test")
+        self.completed = []
+        self.released = []
+        FakeQueue.instance = self
+
+    def claim_all(self, limit=None, story_ids=None):
+        return list(self.claimed)
+
+    def complete(self, story_ids):
+        self.completed.extend(story_ids)
+
+    def release(self, story_ids):
+        self.released.extend(story_ids)
+
+
+def fake_repo(remote_rows):
+    """依表名回傳 Supabase 上的資料列"""
+    class FakeRepo:
+        def __init__(self, name, client=None):
+            self.name = name
+
+        def select_in(self, columns, column, values, **kwargs):
+            values = set(values)
+            return [row for row in remote_rows.get(self.name, []) if row[column] in values]
+
+        def iter_rows(self, columns, order_by, **filters):
+            return iter(remote_rows.get(self.name, []))
+
+    return FakeRepo
+
+
+def make_processor():
+    processor = DiffKeywordProcessor.__new__(DiffKeywordProcessor)
+    processor.client = object()
+    processor.supabase_client = object()
+    processor.api_config = DiffKeywordConfig.API_CONFIG
+    processor.proc_config = DiffKeywordConfig.PROCESSING_CONFIG
+    processor.db_config = DiffKeywordConfig.DB_CONFIG
+    return processor
+
+
+def run_with(claimed, mirror_rows, remote_rows):
+    processor = make_processor()
+    processed = []
+
+    def process(news_data):
+        processed.extend(news_data)
+        return True
+
+    FakeQueue.claimed = claimed
+    repo = fake_repo(remote_rows)
+    with mock.patch.object(pipeline_queue, "PipelineQueue", FakeQueue), \
+            mock.patch.object(pipeline_queue, "TableRepo", repo), \
+            mock.patch.object(supabase_repo, "TableRepo", repo), \
+            mock.patch.object(local_mirror, "read_table", return_value=mirror_rows), \
+            mock.patch.object(processor, "_process_stories", side_effect=process):
+        processor.run()
+    return processed, FakeQueue.instance
+
+
+def test_claimed_stories_use_summary_written_after_enqueue():
+    # 鏡像停在 long 改寫之前；認領的故事要用 Supabase 上改寫後的內容
+    stale = [{"story_id": "s1", "news_title": "t", "long": "舊摘要"}]
+    remote = {"single_news": [{"story_id": "s1", "news_title": "t", "long": "新摘要"}], "term_map": []}
+
+    processed, queue = run_with(["s1"], stale, remote)
+
+    assert [news["long"] for news in processed] == ["新摘要"]
+    assert queue.completed == ["s1"]
+
+
+def test_story_missing_from_stale_mirror_is_processed_not_released():
+    # 本次執行才寫入的故事還不在鏡像裡，仍要處理並完成
+    remote = {"single_news": [{"story_id": "s2", "news_title": "t", "long": "摘要"}], "term_map": []}
+
+    processed, queue = run_with(["s2"], [], remote)
+
+    assert [news["story_id"] for news in processed] == ["s2"]
+    assert queue.completed == ["s2"]
+
+
+def test_deleted_story_is_completed():
+    processed, queue = run_with(["gone"], [], {"single_news": [], "term_map": []})
+
+    assert processed == []
+    assert queue.completed == ["gone"]
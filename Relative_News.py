@@ -1,4 +1,7 @@
 from env import supabase, gemini_client
+from local_mirror import read_table
+from pipeline_queue import PipelineQueue, STAGE_RELATIVE_NEWS
+from supabase_repo import execute
 from pydantic import BaseModel
 from google import genai
 from typing import List
@@ -14,11 +17,13 @@ class RelativeItem(BaseModel):
 class RelativeNews(BaseModel):
     relatives: List[RelativeItem]
 
-response = supabase.table("single_news").select("story_id,category,short,generated_date").execute()
-constraints = supabase.table("relative_news").select("src_story_id").execute()
-constraints = constraints.data
+# single_news 從本機鏡像讀取（增量同步），不必每次下載整張表
+data = read_table("single_news", "story_id,category,short,generated_date", client=supabase)
+stories_by_id = {story["story_id"]: story for story in data}
 
-data = response.data
+# 只認領還沒產生相關新聞的故事，不必下載整張 relative_news 比對；
+# 每次只認領一批，處理完再認領下一批，租約不會在排隊等待時過期
+queue = PipelineQueue(STAGE_RELATIVE_NEWS, client=supabase)
 
 # m_data = json.dumps(data, indent=4)
 # with open("relative_json.json", "w") as f:
@@ -103,29 +108,48 @@ def filter_related_news(current_story: dict, all_stories: list[dict]) -> list[di
 #     .execute()
 # )
 
-for i, current_story in enumerate(data):
-    #constraints is a list like [{src_story_id},....]
-    if any(constraint["src_story_id"] == current_story["story_id"] for constraint in constraints):
-        print(f"Skipping {current_story['story_id']} as it already exists in constraints.")
-        continue
-    # 將當前新聞與其他新聞進行相關性篩選
-    other_stories = data[:i] + data[i+1:]  # 排除當前新聞
-    #確保 other_stories 中的category與current_story相同
-    other_stories = [story for story in other_stories if story["category"] == current_story["category"]]
-    related_news = filter_related_news(current_story, other_stories)
-
-    for j in range(len(related_news)):
-        related_story_id = related_news[j]["story_id"]
-        reason = related_news[j]["reason"]
-        response = (
-            supabase.table("relative_news")
-            .insert({
-                "id": str(uuid.uuid4()),  # 生成唯一 ID
-                "reason": reason,  # 插入相關原因
-                "src_story_id": current_story["story_id"],  # 當前新聞的 story_id
-                "dst_story_id": related_story_id  # 相關新聞的 story_id
-            })
-            .execute()
-        )
-    print(i)
-    time.sleep(15)
\ No newline at end of file
+# 失敗的故事在整輪結束後才放回佇列，避免同一輪又認領回來反覆重試
+failed_story_ids = []
+i = 0
+while True:
+    pending_story_ids = queue.claim()
+    if not pending_story_ids:
+        break
+    # 讀不到的故事：single_news 已刪除的標記完成，本機鏡像還沒有的放回佇列下次再處理
+    not_yet_synced = queue.complete_deleted(pending_story_ids, stories_by_id)
+    for story_id in pending_story_ids:
+        current_story = stories_by_id.get(story_id)
+        if current_story is None:
+            if story_id in not_yet_synced:
+                print(f"Skipping {story_id} as it is not in single_news yet.")
+                failed_story_ids.append(story_id)
+            continue
+        try:
+            # 將當前新聞與同分類的其他新聞進行相關性篩選
+            other_stories = [
+                story for story in data
+                if story["story_id"] != story_id and story["category"] == current_story["category"]
+            ]
+            related_news = filter_related_news(current_story, other_stories)
+
+            rows = [
+                {
+                    "id": str(uuid.uuid4()),  # 生成唯一 ID
+                    "reason": related["reason"],  # 插入相關原因
+                    "src_story_id": story_id,  # 當前新聞的 story_id
+                    "dst_story_id": related["story_id"]  # 相關新聞的 story_id
+                }
+                for related in related_news
+            ]
+            # 清掉先前中斷留下的結果並寫入整批，在同一個交易中完成（migrations/006）
+            execute(supabase.rpc("replace_relative_news", {"p_src_story_id": story_id, "p_rows": rows}))
+        except Exception as e:
+            print(f"Failed {story_id}: {e}")
+            failed_story_ids.append(story_id)
+            continue
+        queue.complete([story_id])
+        print(i)
+        i += 1
+        time.sleep(15)
+
+queue.release(failed_story_ids)
\ No newline at end of file
@@ -0,0 +1,79 @@
+"""比較文字密度抽取與舊的整個 body 退回方式
+
+以爬蟲的頁面存檔（page_archive/，可用 PAGE_ARCHIVE_DIR 指定）為離線語料，
+只統計選擇器都沒命中、原本會把整個 body 送去清洗的頁面：
+  python benchmark_extractor.py
+
+Gemini token 數為估計值：中日韓文字一字一個 token，其餘約四個字元一個 token。
+"""
+import re
+import time
+
+from bs4 import BeautifulSoup
+
+import test5_play as crawler
+
+CJK_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿豈-﫿]")
+
+
+def estimate_tokens(text):
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def measure(element):
+    """回傳 (HTML 位元組數, 純文字, 估計 token 數)"""
+    if element is None:
+        return 0, "", 0
+    text = element.get_text(separator="\n", strip=True)
+    return len(str(element).encode("utf-8")), text, estimate_tokens(text)
+
+
+def main():
+    entries = crawler.page_archive.entries()
+    if not entries:
+        print(f"存档中没有页面: {crawler.PAGE_ARCHIVE_DIR}")
+        return
+
+    pages = 0
+    body_bytes = density_bytes = 0
+    body_tokens = density_tokens = 0
+    short_pages = 0
+    density_seconds = 0.0
+
+    for entry in entries:
+        soup = BeautifulSoup(crawler.page_archive.read(entry), "html.parser")
+        if crawler.extract_structured_article(soup):
+            continue
+        # 只看預設選擇器，不受本機學到的網域排名影響
+        if any(crawler._select_content(soup, selector) for selector in crawler.DEFAULT_CONTENT_SELECTORS):
+            continue
+
+        started = time.perf_counter()
+        block = crawler.densest_content_block(soup)
+        density_seconds += time.perf_counter() - started
+
+        b_bytes, _, b_tokens = measure(soup.body)
+        d_bytes, d_text, d_tokens = measure(block if block is not None else soup.body)
+        pages += 1
+        body_bytes += b_bytes
+        body_tokens += b_tokens
+        density_bytes += d_bytes
+        density_tokens += d_tokens
+        if len(d_text) < crawler.MIN_VALID_CONTENT_CHARS:
+            short_pages += 1
+
+    print("=" * 60)
+    print(f"存档页面: {len(entries)}  退回 body 的页面: {pages}")
+    if not pages:
+        return
+    print(f"HTML 大小: body {body_bytes} bytes -> 文字密度 {density_bytes} bytes "
+          f"(减少 {(1 - density_bytes / body_bytes) * 100 if body_bytes else 0:.1f}%)")
+    print(f"估计 Gemini token: body {body_tokens} -> 文字密度 {density_tokens} "
+          f"(节省 {body_tokens - density_tokens})")
+    print(f"内文少于 {crawler.MIN_VALID_CONTENT_CHARS} 字的页面: {short_pages}")
+    print(f"文字密度抽取平均耗时: {density_seconds / pages * 1000:.1f} ms/页")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""以 HAR 重播離線執行 process_news_pipeline 並計時
+
+先用錄製模式正常跑一次爬蟲，產生 har_archives/<批次>/：
+  CRAWLER_HAR_MODE=record python test5_play.py
+
+再用本腳本重播（不連 Google、出版商或 Supabase）：
+  python benchmark_pipeline.py [category] [repeat]
+
+可用 CRAWLER_HAR_RUN 指定要重播的批次，預設為最新一批。
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+import statistics
+
+# 必須在 import 爬蟲之前設定，爬蟲在載入時讀取這些設定
+_state_dir = tempfile.mkdtemp(prefix="crawler_bench_")
+os.environ["CRAWLER_HAR_MODE"] = "replay"
+os.environ["STORAGE_STATE_PATH"] = os.path.join(_state_dir, "storage_state.json")
+os.environ["REDIRECT_CACHE_PATH"] = os.path.join(_state_dir, "redirect_cache.json")
+os.environ["STORY_FINGERPRINT_PATH"] = os.path.join(_state_dir, "story_fingerprints.json")
+os.environ["DOMAIN_STATS_PATH"] = os.path.join(_state_dir, "domain_stats.json")
+os.environ["SELECTOR_STATS_PATH"] = os.path.join(_state_dir, "selector_stats.json")
+os.environ["DEAD_LETTER_PATH"] = os.path.join(_state_dir, "dead_letters.json")
+os.environ["PAGE_ARCHIVE_DIR"] = os.path.join(_state_dir, "page_archive")
+os.environ["CRAWLER_METRICS_PATH"] = os.path.join(_state_dir, "crawler_metrics.jsonl")
+# 重播不會呼叫 Supabase 與 Gemini，但爬蟲在載入時就會建立 client
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+os.environ.setdefault("SUPABASE_KEY", "offline.benchmark.key")
+os.environ.setdefault("GEMINI_API_KEY", "offline-benchmark")
+
+import test5_play as crawler
+
+CATEGORY = sys.argv[1] if len(sys.argv) > 1 else "Politics"
+REPEAT = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+
+def run_once():
+    """重播一次完整管道，回傳 (秒數, 故事數, 文章數)"""
+    # 每次都從相同狀態開始：固定亂數種子（等待時間一致），清空跨執行快取
+    random.seed(0)
+    crawler.redirect_cache.clear()
+    crawler.story_fingerprints.clear()
+    crawler.domain_stats["domains"].clear()
+    crawler.domain_stats["media_domains"].clear()
+    crawler.selector_stats.clear()
+    crawler.dead_letters.entries.clear()
+
+    budget = crawler.CrawlBudget(crawler.CRAWL_TIME_BUDGET_SECONDS, crawler.CRAWL_PAGE_BUDGET)
+    started = time.perf_counter()
+    stories = crawler.process_news_pipeline(crawler.NEWS_CATEGORIES[CATEGORY], CATEGORY, budget)
+    elapsed = time.perf_counter() - started
+    return elapsed, len(stories), sum(len(story["articles"]) for story in stories)
+
+
+def main():
+    if CATEGORY not in crawler.NEWS_CATEGORIES:
+        print(f"未知的分類: {CATEGORY}")
+        raise SystemExit(1)
+
+    timings = []
+    for i in range(REPEAT):
+        elapsed, story_count, article_count = run_once()
+        timings.append(elapsed)
+        print(f"[{i + 1}/{REPEAT}] {elapsed:.2f} 秒，{story_count} 個故事，{article_count} 篇文章")
+
+    print("=" * 60)
+    print(f"分類: {CATEGORY}  重播批次: {crawler.har_replay.run_dir}")
+    print(f"中位數: {statistics.median(timings):.2f} 秒  最快: {min(timings):.2f} 秒  最慢: {max(timings):.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""以 COPY 直接寫入 Postgres 的批次載入，供大量回填使用
+
+PostgREST 每批只能送幾百筆 JSON，回填數萬筆時大多花在來回請求上。
+這裡改用直接連線（SUPABASE_DB_URL）：先 COPY 進交易內的暫存表，
+再以 INSERT ... ON CONFLICT 合併到正式表，整批在同一個交易中完成。
+
+衝突鍵沿用 migrations/002 建立的唯一約束；每張表的衝突處理與 REST 寫入端一致
+（摘要與圖片覆蓋舊資料，文章與詞彙對應已存在就略過）。
+
+命令列回填（JSONL 每行一筆，或單一 JSON 陣列）：
+  SUPABASE_DB_URL=postgresql://... python bulk_loader.py <table> <rows.jsonl>
+"""
+import os
+import sys
+import json
+import time
+import logging
+import itertools
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+from dotenv import load_dotenv
+
+try:
+    import psycopg
+    from psycopg import sql
+    from psycopg.types.json import Jsonb
+    PSYCOPG_AVAILABLE = True
+except ImportError:
+    PSYCOPG_AVAILABLE = False  # 未安裝 psycopg 時只能走 PostgREST
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+DB_URL = os.getenv("SUPABASE_DB_URL")
+
+# 表名 -> (衝突鍵, 衝突時是否以新資料覆蓋)
+MERGE_TARGETS = {
+    "cleaned_news": (("article_url",), False),
+    "single_news": (("story_id",), True),
+    "term": (("term",), False),
+    "term_map": (("story_id", "term"), False),
+    "keywords_map": (("story_id", "keyword"), False),
+    "generated_image": (("story_id",), True),
+}
+
+
+def available() -> bool:
+    """是否可以使用 COPY 批次載入（已安裝 psycopg 且設定了 SUPABASE_DB_URL）"""
+    return PSYCOPG_AVAILABLE and bool(DB_URL)
+
+
+def connect():
+    if not PSYCOPG_AVAILABLE:
+        raise RuntimeError("請先安裝 psycopg：pip install 'psycopg[binary]'")
+    if not DB_URL:
+        raise RuntimeError("請設定 SUPABASE_DB_URL（Postgres connection string）")
+    return psycopg.connect(DB_URL)
+
+
+def _copy_value(value: Any) -> Any:
+    # 與 PostgREST 相同，dict 以 JSON 寫入；list 交給 psycopg 轉成陣列
+    if isinstance(value, dict):
+        return Jsonb(value)
+    return value
+
+
+def bulk_upsert(table: str, rows: Iterable[Dict[str, Any]],
+                columns: Optional[Sequence[str]] = None, conn=None) -> int:
+    """將 rows 以 COPY 串流進暫存表並合併到 public.<table>，回傳實際寫入（新增或更新）的筆數
+
+    columns 未指定時使用第一筆資料的欄位；同一批中衝突鍵重複時以最後一筆為準。
+    conn 未指定時自行建立連線並在結束後關閉。
+    """
+    if table not in MERGE_TARGETS:
+        raise ValueError(f"不支援批次載入的資料表: {table}")
+    keys, overwrite = MERGE_TARGETS[table]
+
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return 0
+    columns = list(columns or first.keys())
+    missing = [key for key in keys if key not in columns]
+    if missing:
+        raise ValueError(f"{table} 批次載入缺少衝突鍵欄位: {', '.join(missing)}")
+
+    target = sql.Identifier("public", table)
+    stage = sql.Identifier(f"_bulk_{table}")
+    column_list = sql.SQL(", ").join(map(sql.Identifier, columns))
+    key_list = sql.SQL(", ").join(map(sql.Identifier, keys))
+    updates = [column for column in columns if column not in keys]
+    if overwrite and updates:
+        action = sql.SQL("do update set ") + sql.SQL(", ").join(
+            sql.SQL("{0} = excluded.{0}").format(sql.Identifier(column)) for column in updates
+        )
+    else:
+        action = sql.SQL("do nothing")
+
+    own_conn = conn is None
+    conn = conn or connect()
+    started = time.perf_counter()
+    copied = 0
+    try:
+        with conn.transaction():
+            # 暫存表沿用正式表的欄位型別，交易結束即刪除；_seq 記錄 COPY 的先後順序
+            conn.execute(sql.SQL(
+                "create temp table {stage} on commit drop as select {columns} from {target} with no data"
+            ).format(stage=stage, columns=column_list, target=target))
+            conn.execute(sql.SQL(
+                "alter table {stage} add column _seq bigint generated always as identity"
+            ).format(stage=stage))
+
+            with conn.cursor().copy(sql.SQL("copy {stage} ({columns}) from stdin").format(
+                stage=stage, columns=column_list
+            )) as copy:
+                for row in itertools.chain([first], rows):
+                    copy.write_row([_copy_value(row.get(column)) for column in columns])
+                    copied += 1
+
+            merged = conn.execute(sql.SQL(
+                "insert into {target} ({columns}) "
+                "select distinct on ({keys}) {columns} from {stage} order by {keys}, _seq desc "
+                "on conflict ({keys}) {action}"
+            ).format(target=target, columns=column_list, keys=key_list, stage=stage, action=action)).rowcount
+    finally:
+        if own_conn:
+            conn.close()
+
+    logger.info(f"COPY 批次載入 {table}: 送出 {copied} 筆，寫入 {merged} 筆，"
+                f"耗時 {time.perf_counter() - started:.2f} 秒")
+    return merged
+
+
+def read_rows(path: str) -> Iterable[Dict[str, Any]]:
+    """逐筆讀取 JSONL；檔案以 [ 開頭時視為單一 JSON 陣列"""
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        if head == "[":
+            f.seek(0)
+            yield from json.load(f)
+            return
+        f.seek(0)
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def main():
+    if len(sys.argv) < 3:
+        print(f"用法: python bulk_loader.py <{'|'.join(MERGE_TARGETS)}> <rows.jsonl>")
+        raise SystemExit(1)
+    table, path = sys.argv[1], sys.argv[2]
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    started = time.time()
+    merged = bulk_upsert(table, read_rows(path))
+    print(f"{table}: 写入 {merged} 笔，耗时 {time.time() - started:.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -22,8 +22,15 @@ if not GEMINI_API_KEY:
 	print("請先在 Picture_generate_system/.env 設定 GEMINI_API_KEY")
 	raise SystemExit(1)
 
+# 共用的 supabase_repo 位於專案根目錄
+_repo_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _repo_root not in sys.path:
+	sys.path.insert(0, _repo_root)
+
 try:
-	from supabase import create_client
+	from supabase_repo import get_client, TableRepo, execute
+	from local_mirror import read_table
+	from pipeline_queue import PipelineQueue, STAGE_CATEGORIES
 except Exception:
 	print("請先安裝 supabase-py：pip install supabase-py postgrest-py")
 	raise SystemExit(1)
@@ -37,18 +44,31 @@ except Exception:
 
 LIMIT = int(sys.argv[1]) if len(sys.argv) > 1 else None
 
-client = create_client(SUPABASE_URL, SUPABASE_KEY)
+client = get_client(SUPABASE_URL, SUPABASE_KEY)
+# 從 pipeline_state 認領還沒有分類的故事，不必下載整張 keywords_map 比對
+queue = PipelineQueue(STAGE_CATEGORIES, client=client)
 if LIMIT:
-    print(f"連線 Supabase: {SUPABASE_URL}，取前 {LIMIT} 筆 single_news 的 story_id,long")
-    resp = client.table('single_news').select('story_id,long').limit(LIMIT).execute()
+    print(f"連線 Supabase: {SUPABASE_URL}，認領最多 {LIMIT} 筆待分類的 single_news")
 else:
-    print(f"連線 Supabase: {SUPABASE_URL}，取所有 single_news 的 story_id,long")
-    resp = client.table('single_news').select('story_id,long').execute()
-if getattr(resp, 'error', None):
-	print("嘗試選取 (story_id,long) 發生錯誤，改為 select('*') 並降級處理：", resp.error)
-	resp = client.table('single_news').select('*').limit(LIMIT).execute()
+    print(f"連線 Supabase: {SUPABASE_URL}，認領所有待分類的 single_news")
+claimed_story_ids = queue.claim_all(LIMIT)
+if not claimed_story_ids:
+	print("沒有待分類的新聞")
+	raise SystemExit(0)
+
+# single_news 從本機鏡像讀取（增量同步），鏡像無法使用時 read_table 會改讀 Supabase
+try:
+	rows = read_table('single_news', 'story_id,long', client=client, story_id=claimed_story_ids)
+except Exception as e:
+	print("讀取 single_news (story_id,long) 發生錯誤：", e)
+	queue.release(claimed_story_ids)
+	raise SystemExit(1)
+
+# 讀不到的故事：single_news 已刪除的標記完成，鏡像中還沒有的放回佇列下次再處理
+found_story_ids = {r.get('story_id') for r in rows}
+queue.release(queue.complete_deleted(claimed_story_ids, found_story_ids))
+claimed_story_ids = [story_id for story_id in claimed_story_ids if story_id in found_story_ids]
 
-rows = resp.data or []
 if not rows:
 	print("未取得資料，請確認表名/權限")
 	raise SystemExit(0)
@@ -60,23 +80,25 @@ print(f"使用 Gemini 模型: {MODEL}")
 
 # Step 0: 讀取現有的關鍵字
 print("Step 0: 讀取現有的關鍵字...")
-existing_resp = client.table('keywords').select('keyword').execute()
-if getattr(existing_resp, 'error', None):
-	print(f"讀取現有關鍵字失敗: {existing_resp.error}")
-	existing_keywords = set()
-else:
-	existing_data = existing_resp.data or []
+try:
+	# keyword 唯一，以 keyset 分頁串流讀取，不受 PostgREST max-rows 截斷
+	existing_data = TableRepo('keywords', client).iter_rows('keyword', order_by='keyword', keyset=True)
 	existing_keywords = {item['keyword'] for item in existing_data if isinstance(item, dict) and item.get('keyword')}
 	print(f"已讀取 {len(existing_keywords)} 個現有關鍵字")
+except Exception as e:
+	print(f"讀取現有關鍵字失敗: {e}")
+	existing_keywords = set()
 
 # Step 0.5: 讀取已經處理過的 story_id 及其關鍵字數量
 print("Step 0.5: 讀取已經處理過的新聞及關鍵字數量...")
-processed_resp = client.table('keywords_map').select('story_id,keyword').execute()
-if getattr(processed_resp, 'error', None):
-	print(f"讀取已處理新聞失敗: {processed_resp.error}")
+keywords_map = TableRepo('keywords_map', client)
+try:
+	# 只讀取本次認領故事的對應關係
+	processed_data = keywords_map.select_in('story_id,keyword', 'story_id', claimed_story_ids)
+except Exception as e:
+	print(f"讀取已處理新聞失敗: {e}")
 	story_keyword_counts = {}
 else:
-	processed_data = processed_resp.data or []
 	# 統計每個 story_id 的關鍵字數量
 	from collections import defaultdict
 	story_keyword_counts = defaultdict(int)
@@ -206,8 +228,8 @@ if new_keywords:
 
 	for keyword in new_keywords:
 		try:
-			# 使用 insert（因為已確認是新關鍵字）
-			resp = client.table('keywords').insert({'keyword': keyword}).execute()
+			# keyword 有唯一約束，並行執行時重複的關鍵字直接略過
+			resp = execute(client.table('keywords').upsert({'keyword': keyword}, on_conflict='keyword', ignore_duplicates=True))
 			if getattr(resp, 'error', None):
 				print(f"插入關鍵字 '{keyword}' 失敗: {resp.error}")
 				fail_count += 1
@@ -233,17 +255,16 @@ print("注意：如果出現 RLS (Row Level Security) 錯誤，請檢查 Supabas
 # 先讀取現有的 story_id-keyword 組合
 existing_pairs = set()
 try:
-	existing_resp = client.table('keywords_map').select('story_id,keyword').execute()
-	if not getattr(existing_resp, 'error', None):
-		for item in existing_resp.data or []:
-			if isinstance(item, dict) and item.get('story_id') and item.get('keyword'):
-				existing_pairs.add((item['story_id'], item['keyword']))
+	for item in keywords_map.select_in('story_id,keyword', 'story_id', list(news_categories)):
+		if isinstance(item, dict) and item.get('story_id') and item.get('keyword'):
+			existing_pairs.add((item['story_id'], item['keyword']))
 	print(f"已讀取 {len(existing_pairs)} 個現有的 story_id-keyword 組合")
 except Exception as e:
 	print(f"讀取現有組合失敗: {e}")
 
 map_insert_count = 0
 map_fail_count = 0
+failed_story_ids = set()  # 有對應關係寫入失敗的故事放回佇列
 rls_error_count = 0
 duplicate_count = 0
 
@@ -260,12 +281,13 @@ for story_id, categories in news_categories.items():
 				'story_id': story_id,
 				'keyword': keyword
 			}
-			# 使用普通 insert，因為已經檢查過重複
-			resp = client.table('keywords_map').insert(payload).execute()
+			# (story_id, keyword) 有唯一約束，重複的組合直接略過
+			resp = execute(client.table('keywords_map').upsert(payload, on_conflict='story_id,keyword', ignore_duplicates=True))
 			if getattr(resp, 'error', None):
 				error_msg = str(resp.error)
 				if '42501' in error_msg or 'row-level security' in error_msg.lower():
 					rls_error_count += 1
+					failed_story_ids.add(story_id)
 					if rls_error_count == 1:  # 只印一次提示
 						print(f"RLS 權限錯誤：'{story_id} {keyword}' - 需要在 Supabase 設定 keywords_map 表的插入權限")
 				elif '23505' in error_msg or 'duplicate key' in error_msg.lower():
@@ -273,6 +295,7 @@ for story_id, categories in news_categories.items():
 					print(f"跳過重複組合: {story_id} {keyword}")
 				else:
 					print(f"插入對應關係 '{story_id} {keyword}' 失敗: {resp.error}")
+					failed_story_ids.add(story_id)
 				map_fail_count += 1
 			else:
 				map_insert_count += 1
@@ -283,6 +306,7 @@ for story_id, categories in news_categories.items():
 			error_msg = str(e)
 			if '42501' in error_msg or 'row-level security' in error_msg.lower():
 				rls_error_count += 1
+				failed_story_ids.add(story_id)
 				if rls_error_count == 1:
 					print(f"RLS 權限錯誤：需要在 Supabase Dashboard 設定 keywords_map 表權限")
 			elif '23505' in error_msg or 'duplicate key' in error_msg.lower():
@@ -290,6 +314,7 @@ for story_id, categories in news_categories.items():
 				print(f"跳過重複組合: {story_id} {keyword}")
 			else:
 				print(f"插入對應關係 '{story_id} {keyword}' 發生例外: {e}")
+				failed_story_ids.add(story_id)
 			map_fail_count += 1
 
 print(f"對應關係存入完成：成功 {map_insert_count} 筆，失敗 {map_fail_count} 筆，跳過重複 {duplicate_count} 筆")
@@ -300,5 +325,10 @@ if rls_error_count > 0:
 	print("2. 為 keywords_map 表新增插入政策，或暫時關閉 RLS")
 	print("3. 或改用 service_role key（需小心保管）")
 
+# 更新 pipeline_state：成功的標記完成，失敗的放回佇列
+queue.release(failed_story_ids)
+completed = queue.complete(story_id for story_id in claimed_story_ids if story_id not in failed_story_ids)
+print(f"pipeline_state：完成 {completed} 則，放回佇列 {len(failed_story_ids)} 則")
+
 print('完成')
 
@@ -19,18 +19,25 @@ if not SUPABASE_URL or not SUPABASE_KEY:
     print("請先在 Picture_generate_system/.env 設定 SUPABASE_URL 與 SUPABASE_KEY")
     raise SystemExit(1)
 
+# 共用的 supabase_repo 位於專案根目錄：往上找到含 supabase_repo.py 的目錄
+_repo_root = os.path.dirname(os.path.abspath(__file__))
+while not os.path.exists(os.path.join(_repo_root, 'supabase_repo.py')) and os.path.dirname(_repo_root) != _repo_root:
+    _repo_root = os.path.dirname(_repo_root)
+if _repo_root not in sys.path:
+    sys.path.insert(0, _repo_root)
+
 try:
-    from supabase import create_client
+    from supabase_repo import get_client, execute
 except Exception:
     print("請先安裝 supabase-py：pip install supabase-py postgrest-py")
     raise SystemExit(1)
 
 LIMIT = int(sys.argv[1]) if len(sys.argv) > 1 else 100
 
-client = create_client(SUPABASE_URL, SUPABASE_KEY)
+client = get_client(SUPABASE_URL, SUPABASE_KEY)
 print(f"連線到 Supabase: {SUPABASE_URL}，讀取最多 {LIMIT} 筆 generated_image")
 
-resp = client.table('generated_image').select('story_id,image').limit(LIMIT).execute()
+resp = execute(client.table('generated_image').select('story_id,image').limit(LIMIT))
 if getattr(resp, 'error', None):
     print("查詢 generated_image 時發生錯誤：", resp.error)
     raise SystemExit(1)
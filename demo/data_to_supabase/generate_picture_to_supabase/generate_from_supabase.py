@@ -5,7 +5,7 @@
 
 需求：在 Picture_generate_system/.env 設定 SUPABASE_URL 與 SUPABASE_KEY，並設定 GEMINI_API_KEY
 安裝套件：pip install supabase-py postgrest-py python-dotenv google-genai pillow
-若要直接使用 DB URL，可改用 SUPABASE_DB_URL 與 psycopg（此腳本目前使用 supabase REST）
+此腳本使用 supabase REST；大量回填 generated_image 時可設定 SUPABASE_DB_URL 並改用專案根目錄的 bulk_loader.py（COPY）
 """
 import os
 import sys
@@ -40,8 +40,17 @@ if not GEMINI_API_KEY:
     print("請在 Picture_generate_system/.env 設定 GEMINI_API_KEY")
     raise SystemExit(1)
 
+# 共用的 supabase_repo 位於專案根目錄：往上找到含 supabase_repo.py 的目錄
+_repo_root = os.path.dirname(os.path.abspath(__file__))
+while not os.path.exists(os.path.join(_repo_root, 'supabase_repo.py')) and os.path.dirname(_repo_root) != _repo_root:
+    _repo_root = os.path.dirname(_repo_root)
+if _repo_root not in sys.path:
+    sys.path.insert(0, _repo_root)
+
 try:
-    from supabase import create_client
+    from supabase_repo import get_client, execute
+    from local_mirror import read_table
+    from pipeline_queue import PipelineQueue, STAGE_IMAGE
 except Exception:
     print("請先安裝 supabase-py：pip install supabase-py postgrest-py")
     raise SystemExit(1)
@@ -53,7 +62,7 @@ except Exception:
     raise SystemExit(1)
 
 # 建立 Supabase 與 Gemini client
-sb = create_client(SUPABASE_URL, SUPABASE_KEY)
+sb = get_client(SUPABASE_URL, SUPABASE_KEY)
 
 LIMIT = int(sys.argv[1]) if len(sys.argv) > 1 else 1500
 
@@ -62,15 +71,26 @@ RETRY_TIMES = 3
 SLEEP_BETWEEN = 0.6
 
 print(f"Connecting to Supabase: {SUPABASE_URL}")
-print(f"Fetching up to {LIMIT} rows from table 'single_news'...")
+print(f"Claiming up to {LIMIT} stories without an image from pipeline_state...")
 
-# 先嘗試選取常見欄位
-resp = sb.table('single_news').select('story_id,news_title,long').limit(LIMIT).execute()
-if getattr(resp, 'error', None):
-    print("嘗試選取 (story_id,news_title,long) 發生錯誤，改為 select('*') 以檢視欄位：", resp.error)
-    resp = sb.table('single_news').select('*').limit(LIMIT).execute()
+# 從 pipeline_state 認領還沒有圖片的故事，不必逐筆查詢 generated_image
+queue = PipelineQueue(STAGE_IMAGE, client=sb)
+claimed_story_ids = queue.claim_all(LIMIT)
+if not claimed_story_ids:
+    print("沒有待生成圖片的故事")
+    raise SystemExit(0)
+
+# single_news 從本機鏡像讀取（增量同步），鏡像無法使用時 read_table 會改讀 Supabase
+try:
+    rows = read_table('single_news', 'story_id,news_title,long', client=sb, story_id=claimed_story_ids)
+except Exception as e:
+    print("讀取 single_news (story_id,news_title,long) 發生錯誤：", e)
+    queue.release(claimed_story_ids)
+    raise SystemExit(1)
+
+# 讀不到的故事：single_news 已刪除的標記完成，鏡像中還沒有的放回佇列下次再處理
+queue.release(queue.complete_deleted(claimed_story_ids, [r.get('story_id') for r in rows]))
 
-rows = resp.data or []
 if not rows:
     print("未取得任何 row，請確認表名或權限")
     raise SystemExit(0)
@@ -106,19 +126,13 @@ for i, r in enumerate(rows, start=1):
         # 從 content 取前段作為 title 的 fallback
         title = (content[:40] + '...') if len(content) > 40 else content
 
-    # 檢查是否已經生成過圖片
-    if story_id:
-        existing = sb.table('generated_image').select('story_id').eq('story_id', story_id).execute()
-        if existing.data:
-            print(f"第 {i} 筆（story_id={story_id}）已存在圖片，跳過")
-            continue
-
     prompt = core._prompt_photoreal_no_text(title or '', content or '', category='')
 
     img_bytes = core._gen_image_bytes_with_retry(gen_client, prompt, MODEL_ID, RETRY_TIMES, SLEEP_BETWEEN)
     if not img_bytes:
         print(f"第 {i} 筆（story_id={story_id}）生成失敗，跳過")
         fail_count += 1
+        queue.release([story_id])
         continue
 
     # 產生描述（短）
@@ -133,19 +147,22 @@ for i, r in enumerate(rows, start=1):
     'description': description,
     }
 
-    # 嘗試 upsert（若有 primary key conflict，請依據實際 schema 調整）
+    # story_id 有唯一約束（migrations/002），重跑時覆蓋同一故事的圖片
     try:
-        ins = sb.table('generated_image').insert(payload).execute()
+        ins = execute(sb.table('generated_image').upsert(payload, on_conflict='story_id'))
         if getattr(ins, 'error', None):
             print(f"寫入 generated_image 發生錯誤: {ins.error}")
             fail_count += 1
+            queue.release([story_id])
         else:
             insert_count += 1
+            queue.complete([story_id])
             print(f"已寫入 generated_image (story_id={story_id})")
             # 避免速率限制
             time.sleep(0.5)
     except Exception as e:
         print(f"寫入例外: {e}")
         fail_count += 1
+        queue.release([story_id])
 
 print(f"完成：寫入 {insert_count} 筆，失敗 {fail_count} 筆")
\ No newline at end of file
@@ -1,5 +1,6 @@
 from google import genai
-from supabase import create_client, Client
+from supabase import Client
+from supabase_repo import get_client
 from dotenv import load_dotenv
 import os
 
@@ -9,4 +10,4 @@ api_key = os.getenv("GEMINI_API_KEY")
 gemini_client = genai.Client(api_key=api_key)
 api_key_supabase = os.getenv("SUPABASE_KEY")
 supabase_url = os.getenv("SUPABASE_URL")
-supabase: Client = create_client(supabase_url, api_key_supabase)
\ No newline at end of file
+supabase: Client = get_client(supabase_url, api_key_supabase)
\ No newline at end of file
@@ -0,0 +1,310 @@
+"""Supabase 共用資料表的本機 SQLite 鏡像
+
+下游工作（相關新聞、分類、圖片、困難關鍵字、摘要）每個週期都要讀整張 single_news / stories。
+這裡以 updated_at 水位增量同步到本機 SQLite，每次只下載上次同步之後有變動的資料列，
+之後的讀取都走本機磁碟。
+
+- 每張表每個行程只在第一次讀取時同步；同一行程寫入鏡像表後要呼叫 invalidate()，
+  下一次讀取才會再增量同步，讀到剛寫入的資料
+- 同步後比對本機與遠端的資料列數，不一致（例如遠端刪除了資料）時整張表重新同步
+- 增量同步以 (updated_at, 主鍵) keyset 翻頁，水位往回重疊 SYNC_OVERLAP_SECONDS；
+  時間戳與提交相隔超過重疊時間的交易（極長的交易）會被漏掉，而筆數檢查只看得出漏掉的新增/刪除、
+  看不出漏掉的更新，因此排程中應定期（例如每天一次）執行 --full 整表重新同步
+- 需要 migrations/004 建立的 updated_at 欄位與觸發器
+- 設定 LOCAL_MIRROR=0、表不在鏡像範圍或同步失敗時，iter_table()/read_table() 改為分頁讀取 Supabase，
+  list 篩選值（例如認領到的 story_id）分段查詢
+
+手動同步並列出各表的本機/遠端筆數（--full 會清空後整表重新下載）：
+  python local_mirror.py [--full]
+"""
+import os
+import sys
+import json
+import sqlite3
+import logging
+import itertools
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from supabase_repo import IN_FILTER_CHUNK_SIZE, TableRepo, get_client, execute
+
+logger = logging.getLogger(__name__)
+
+MIRROR_DB_PATH = os.getenv(
+    "LOCAL_MIRROR_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "supabase_mirror.sqlite3"),
+)
+MIRROR_ENABLED = os.getenv("LOCAL_MIRROR", "1") != "0"
+WATERMARK_COLUMN = "updated_at"
+SYNC_PAGE_SIZE = 1000
+# 水位往回重疊一段時間，涵蓋較晚提交但時間戳較早的交易（updated_at 取的是交易開始的 now()）
+SYNC_OVERLAP_SECONDS = int(os.getenv("LOCAL_MIRROR_OVERLAP_SECONDS", 15 * 60))
+
+# 表名 -> (主鍵, 鏡像的欄位, 另外建索引的欄位)；壓縮的 raw_html 封存不進鏡像
+MIRROR_TABLES = {
+    "stories": ("story_id", ("story_id", "story_title", "story_url", "category", "crawl_date"), ()),
+    "single_news": ("story_id", ("story_id", "news_title", "category", "ultra_short", "short", "long",
+                                 "generated_date", "total_articles"), ()),
+    "cleaned_news": ("article_id", ("article_id", "story_id", "article_title", "article_url", "content",
+                                    "media"), ("story_id",)),
+}
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _parse_columns(columns: str) -> List[str]:
+    return [column.strip() for column in columns.split(",") if column.strip()]
+
+
+def _filter_value(value: Any) -> str:
+    """PostgREST or=() 條件中的值加上雙引號，時間戳中的 : + . 才不會被當成語法"""
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _rewind(watermark: Optional[str]) -> Optional[str]:
+    if not watermark:
+        return None
+    try:
+        return (datetime.fromisoformat(watermark) - timedelta(seconds=SYNC_OVERLAP_SECONDS)).isoformat()
+    except ValueError:
+        return watermark
+
+
+class LocalMirror:
+    """MIRROR_TABLES 的 SQLite 鏡像，每張表每個行程最多自動同步一次"""
+
+    def __init__(self, path: str = MIRROR_DB_PATH, client=None):
+        self.path = path
+        self._client = client
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        self._synced = set()
+        self._unavailable = set()
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_client()
+        return self._client
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is not None:
+            return self._conn
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("pragma journal_mode=wal")
+        conn.execute(
+            "create table if not exists _mirror_state ("
+            "table_name text primary key, columns text, watermark text, synced_at text)"
+        )
+        for table, (key, columns, indexes) in MIRROR_TABLES.items():
+            signature = json.dumps(list(columns))
+            state = conn.execute("select columns from _mirror_state where table_name = ?", (table,)).fetchone()
+            if state is not None and state["columns"] != signature:
+                # 鏡像欄位改了：丟掉舊表，下次同步整表重新下載
+                conn.execute(f"drop table if exists {_quote(table)}")
+                conn.execute("delete from _mirror_state where table_name = ?", (table,))
+            column_defs = ", ".join(
+                _quote(column) + (" primary key" if column == key else "")
+                for column in columns + (WATERMARK_COLUMN,)
+            )
+            conn.execute(f"create table if not exists {_quote(table)} ({column_defs})")
+            for column in indexes:
+                conn.execute(
+                    f"create index if not exists {_quote(f'{table}_{column}_idx')} "
+                    f"on {_quote(table)} ({_quote(column)})"
+                )
+            conn.execute(
+                "insert or ignore into _mirror_state (table_name, columns) values (?, ?)", (table, signature)
+            )
+        conn.commit()
+        self._conn = conn
+        return conn
+
+    def _watermark(self, table: str) -> Optional[str]:
+        row = self._db().execute("select watermark from _mirror_state where table_name = ?", (table,)).fetchone()
+        return row["watermark"] if row else None
+
+    def sync_table(self, table: str, full: bool = False) -> int:
+        """下載 updated_at 晚於水位的資料列寫入本機，回傳下載筆數"""
+        key, columns, _ = MIRROR_TABLES[table]
+        all_columns = columns + (WATERMARK_COLUMN,)
+        insert_sql = (
+            f"insert or replace into {_quote(table)} ({', '.join(map(_quote, all_columns))}) "
+            f"values ({', '.join('?' for _ in all_columns)})"
+        )
+        with self._lock:
+            db = self._db()
+            watermark = None if full else self._watermark(table)
+            since = _rewind(watermark)
+            newest = watermark
+            fetched = 0
+            last = None  # 上一頁最後一筆的 (updated_at, 主鍵)
+            try:
+                if full:
+                    db.execute(f"delete from {_quote(table)}")
+                while True:
+                    # 以 (updated_at, 主鍵) keyset 翻頁：同步期間有資料列被更新（移到排序尾端）也不會跳過其他列
+                    query = self.client.table(table).select(",".join(all_columns))
+                    if last is not None:
+                        stamp, last_key = map(_filter_value, last)
+                        query = query.or_(
+                            f"{WATERMARK_COLUMN}.gt.{stamp},"
+                            f"and({WATERMARK_COLUMN}.eq.{stamp},{key}.gt.{last_key})"
+                        )
+                    elif since:
+                        query = query.gt(WATERMARK_COLUMN, since)
+                    query = query.order(WATERMARK_COLUMN).order(key).limit(SYNC_PAGE_SIZE)
+                    rows = execute(query).data or []
+                    if not rows:
+                        break
+                    db.executemany(insert_sql, [tuple(row.get(column) for column in all_columns) for row in rows])
+                    fetched += len(rows)
+                    last = (rows[-1].get(WATERMARK_COLUMN), rows[-1].get(key))
+                    newest = last[0] or newest
+                db.execute(
+                    "update _mirror_state set watermark = ?, synced_at = ? where table_name = ?",
+                    (newest, datetime.now().isoformat(), table),
+                )
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+        return fetched
+
+    def counts(self, table: str) -> tuple:
+        """回傳 (本機筆數, 遠端筆數)"""
+        key = MIRROR_TABLES[table][0]
+        with self._lock:
+            local = self._db().execute(f"select count(*) from {_quote(table)}").fetchone()[0]
+        remote = execute(self.client.table(table).select(key, count="exact").limit(1)).count
+        return local, remote
+
+    def sync(self, tables: Optional[Iterable[str]] = None, full: bool = False) -> Dict[str, Dict[str, Any]]:
+        """同步並做筆數一致性檢查，回傳每張表的 {fetched, local, remote, resynced}"""
+        report = {}
+        for table in tables or MIRROR_TABLES:
+            fetched = self.sync_table(table, full=full)
+            local, remote = self.counts(table)
+            resynced = False
+            if remote is not None and local != remote and not full:
+                logger.warning(f"本機鏡像 {table} 筆數不一致（本機 {local}，遠端 {remote}），整表重新同步")
+                fetched = self.sync_table(table, full=True)
+                local, remote = self.counts(table)
+                resynced = True
+            if remote is not None and local != remote:
+                logger.warning(f"本機鏡像 {table} 重新同步後筆數仍不一致（本機 {local}，遠端 {remote}）")
+            self._synced.add(table)
+            report[table] = {"fetched": fetched, "local": local, "remote": remote, "resynced": resynced}
+            logger.info(f"本機鏡像 {table}: 下載 {fetched} 筆，本機 {local} / 遠端 {remote}")
+        return report
+
+    def ensure_synced(self, table: str):
+        if table in self._unavailable:
+            raise RuntimeError(f"本機鏡像 {table} 先前同步失敗")
+        if table in self._synced:
+            return
+        try:
+            self.sync([table])
+        except Exception:
+            self._unavailable.add(table)
+            raise
+
+    def invalidate(self, table: str):
+        """本行程寫入過 table，下一次讀取前重新增量同步"""
+        self._synced.discard(table)
+
+    def rows(self, table: str, columns: str, limit: Optional[int] = None, **filters) -> List[Dict[str, Any]]:
+        """從本機讀取；filters 的值為 list/tuple/set 時以 IN 比對，其餘以等號比對"""
+        mirrored = MIRROR_TABLES[table][1]
+        wanted = _parse_columns(columns)
+        missing = [column for column in wanted + list(filters) if column not in mirrored]
+        if missing:
+            raise KeyError(f"本機鏡像 {table} 沒有欄位: {', '.join(missing)}")
+
+        clauses, params = [], []
+        for column, value in filters.items():
+            if isinstance(value, (list, tuple, set)):
+                values = list(value)
+                if not values:
+                    return []
+                # 以單一 JSON 參數傳入，不受 SQLite 參數個數上限影響
+                clauses.append(f"{_quote(column)} in (select value from json_each(?))")
+                params.append(json.dumps(values))
+            else:
+                clauses.append(f"{_quote(column)} = ?")
+                params.append(value)
+        statement = f"select {', '.join(map(_quote, wanted))} from {_quote(table)}"
+        if clauses:
+            statement += " where " + " and ".join(clauses)
+        statement += " order by rowid"
+        if limit:
+            statement += f" limit {int(limit)}"
+        with self._lock:
+            return [dict(row) for row in self._db().execute(statement, params)]
+
+
+mirror = LocalMirror()
+
+
+def invalidate(*tables: str):
+    """寫入鏡像表之後呼叫，讓同一行程之後的讀取先同步新寫入的資料"""
+    for table in tables:
+        mirror.invalidate(table)
+
+
+def iter_table(table: str, columns: str, limit: Optional[int] = None, client=None,
+               order_by: Optional[str] = None, **filters) -> Iterator[Dict[str, Any]]:
+    """優先從本機鏡像讀取（首次讀取時先增量同步）；無法使用鏡像時改為分頁串流讀取 Supabase"""
+    if MIRROR_ENABLED and table in MIRROR_TABLES:
+        try:
+            mirror.ensure_synced(table)
+            rows = mirror.rows(table, columns, limit=limit, **filters)
+        except Exception as e:
+            logger.warning(f"本機鏡像 {table} 無法使用，改讀 Supabase: {e}")
+        else:
+            yield from rows
+            return
+
+    # 鏡像表以主鍵排序分頁；其他表需由呼叫端提供 order_by
+    order_by = order_by or MIRROR_TABLES.get(table, (None,))[0]
+    if not order_by:
+        raise ValueError(f"{table} 不在本機鏡像中，分頁讀取需要指定 order_by")
+    rows = _iter_remote(TableRepo(table, client), columns, order_by, filters)
+    yield from itertools.islice(rows, limit) if limit else rows
+
+
+def _iter_remote(repo: TableRepo, columns: str, order_by: str, filters: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """分頁讀取 Supabase；list 篩選值以 IN_FILTER_CHUNK_SIZE 分段，避免 in_() 的 URL 過長"""
+    chunked = next((column for column, value in filters.items() if isinstance(value, (list, tuple, set))), None)
+    if chunked is None:
+        yield from repo.iter_rows(columns, order_by, **filters)
+        return
+    values = list(filters[chunked])
+    for start in range(0, len(values), IN_FILTER_CHUNK_SIZE):
+        yield from repo.iter_rows(columns, order_by, **{**filters, chunked: values[start:start + IN_FILTER_CHUNK_SIZE]})
+
+
+def read_table(table: str, columns: str, limit: Optional[int] = None, client=None, **filters) -> List[Dict[str, Any]]:
+    """iter_table 的結果一次讀成 list"""
+    return list(iter_table(table, columns, limit=limit, client=client, **filters))
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    report = mirror.sync(full="--full" in sys.argv)
+    print("=" * 60)
+    for table, entry in report.items():
+        status = "一致" if entry["local"] == entry["remote"] else "不一致"
+        note = "（已整表重新同步）" if entry["resynced"] else ""
+        print(f"{table}: 下载 {entry['fetched']} 笔，本机 {entry['local']} / 远端 {entry['remote']} {status}{note}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+-- 一次判斷整批 (story_url, article_url, article_datetime) 的處理方式
+--
+-- 與 test5_play.check_story_exists_in_supabase 的邏輯相同：
+--   1. 取 story_url 最新（crawl_date 最大）的一筆故事，沒有就 create_new_story
+--   2. 缺 crawl_date 或無法解析、或距今超過 3 天 -> create_new_story
+--   3. 文章時間不晚於 crawl_date -> skip
+--   4. article_url 已在 cleaned_news -> skip，否則 add_to_existing_story
+-- 日期欄位存的是 "YYYY/MM/DD HH:MM[:SS]" 字串（台北時間），格式不符的值視為無法解析。
+--
+-- 呼叫方式：supabase.rpc("classify_story_links", {"links": [{"story_url": ..., "article_url": ..., "article_datetime": ...}, ...]})
+
+create or replace function public.classify_story_links(links jsonb)
+returns table (
+    idx integer,
+    story_url text,
+    article_url text,
+    should_skip boolean,
+    action_type text,
+    story jsonb,
+    reason text
+)
+language sql
+stable
+as $$
+    with input as (
+        select
+            (l.ordinality - 1)::integer as idx,
+            l.value ->> 'story_url' as story_url,
+            nullif(l.value ->> 'article_url', '') as article_url,
+            case
+                when l.value ->> 'article_datetime' ~ '^\d{4}/\d{1,2}/\d{1,2}( \d{1,2}:\d{2}(:\d{2})?)?$'
+                then (l.value ->> 'article_datetime')::timestamp
+            end as article_ts
+        from jsonb_array_elements(links) with ordinality as l(value, ordinality)
+    ),
+    latest as (
+        select distinct on (s.story_url)
+            s.story_url,
+            to_jsonb(s) as story,
+            s.story_id::text as story_id,
+            s.crawl_date::text as crawl_date,
+            case
+                when s.crawl_date::text ~ '^\d{4}[/-]\d{1,2}[/-]\d{1,2}'
+                then s.crawl_date::text::timestamp
+            end as crawl_ts
+        from public.stories s
+        where s.story_url in (select i.story_url from input i)
+        order by s.story_url, s.crawl_date desc
+    ),
+    decided as (
+        select
+            i.idx,
+            i.story_url,
+            i.article_url,
+            l.story,
+            l.story_id,
+            l.crawl_date,
+            l.crawl_ts,
+            i.article_ts,
+            extract(day from (now() at time zone 'Asia/Taipei') - l.crawl_ts)::integer as days_diff,
+            exists (
+                select 1 from public.cleaned_news c where c.article_url = i.article_url
+            ) as article_exists
+        from input i
+        left join latest l on l.story_url = i.story_url
+    )
+    select
+        d.idx,
+        d.story_url,
+        d.article_url,
+        case
+            when d.story is null or d.crawl_ts is null or d.days_diff > 3 then false
+            when d.article_ts is not null and d.article_ts <= d.crawl_ts then true
+            when d.article_url is not null and d.article_exists then true
+            else false
+        end as should_skip,
+        case
+            when d.story is null or d.crawl_ts is null or d.days_diff > 3 then 'create_new_story'
+            when d.article_ts is not null and d.article_ts <= d.crawl_ts then 'skip'
+            when d.article_url is not null and d.article_exists then 'skip'
+            else 'add_to_existing_story'
+        end as action_type,
+        case
+            when d.story is null or d.crawl_ts is null or d.days_diff > 3 then null
+            else d.story
+        end as story,
+        case
+            when d.story is null then '新故事'
+            when d.crawl_ts is null then '缺少爬取日期，创建新故事'
+            when d.days_diff > 3 then '超过时间限制 (' || d.days_diff || ' 天)，创建新故事'
+            when d.article_ts is not null and d.article_ts <= d.crawl_ts
+                then '文章时间 ' || to_char(d.article_ts, 'YYYY/MM/DD HH24:MI:SS') || ' 早于上次爬取时间 ' || d.crawl_date
+            when d.article_url is not null and d.article_exists then '文章已存在于故事 ' || d.story_id
+            when d.article_url is not null then '加入现有故事 ' || d.story_id || ' (新文章)'
+            else '使用现有故事 ' || d.story_id
+        end as reason
+    from decided d
+    order by d.idx;
+$$;
+
+grant execute on function public.classify_story_links(jsonb) to anon, authenticated, service_role;
@@ -0,0 +1,48 @@
+-- 熱門查詢所需的索引與唯一約束
+--
+-- 唯一約束讓寫入端可以直接 upsert（on_conflict）而不必先 select 再 insert。
+-- 純關聯表（term_map、keywords_map）的完全重複列會先刪除只留一筆；
+-- 其他表若已有重複資料，建立唯一索引會失敗，需先人工確認保留哪一筆，例如：
+--   select article_url, count(*) from public.cleaned_news group by 1 having count(*) > 1;
+
+-- stories：依 story_url 找最新一筆（order by crawl_date desc limit 1）
+create index if not exists stories_story_url_crawl_date_idx
+    on public.stories (story_url, crawl_date desc);
+
+-- cleaned_news：文章網址是否已存在、依故事取文章
+create unique index if not exists cleaned_news_article_url_key
+    on public.cleaned_news (article_url);
+create index if not exists cleaned_news_story_id_idx
+    on public.cleaned_news (story_id);
+
+-- single_news：每個故事一筆摘要
+create unique index if not exists single_news_story_id_key
+    on public.single_news (story_id);
+
+-- term / term_map：詞彙定義與故事對應
+create unique index if not exists term_term_key
+    on public.term (term);
+
+delete from public.term_map a
+    using public.term_map b
+    where a.ctid > b.ctid and a.story_id = b.story_id and a.term = b.term;
+create unique index if not exists term_map_story_id_term_key
+    on public.term_map (story_id, term);
+
+-- keywords / keywords_map：分類標籤與故事對應
+create unique index if not exists keywords_keyword_key
+    on public.keywords (keyword);
+
+delete from public.keywords_map a
+    using public.keywords_map b
+    where a.ctid > b.ctid and a.story_id = b.story_id and a.keyword = b.keyword;
+create unique index if not exists keywords_map_story_id_keyword_key
+    on public.keywords_map (story_id, keyword);
+
+-- generated_image：每個故事一張圖
+create unique index if not exists generated_image_story_id_key
+    on public.generated_image (story_id);
+
+-- relative_news：已產生過相關新聞的來源故事
+create index if not exists relative_news_src_story_id_idx
+    on public.relative_news (src_story_id);
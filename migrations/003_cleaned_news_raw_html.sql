@@ -0,0 +1,4 @@
+-- cleaned_news 的壓縮原始 HTML 封存欄位（test5_play.save_article_to_supabase 寫入）
+-- raw_html 為 base64 的壓縮內容，raw_html_codec 為 "zstd" 或 "gzip"
+alter table public.cleaned_news add column if not exists raw_html text;
+alter table public.cleaned_news add column if not exists raw_html_codec text;
@@ -0,0 +1,35 @@
+-- 本機鏡像（local_mirror.py）增量同步用的 updated_at 水位
+--
+-- 新增時取預設值 now()，更新時由觸發器改寫；鏡像只下載 updated_at 晚於上次水位的資料列。
+-- 既有資料列在加欄位時會拿到同一個時間戳，第一次同步會整表下載。
+
+create or replace function public.set_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at := now();
+    return new;
+end;
+$$;
+
+-- stories
+alter table public.stories add column if not exists updated_at timestamptz not null default now();
+create index if not exists stories_updated_at_idx on public.stories (updated_at);
+drop trigger if exists stories_set_updated_at on public.stories;
+create trigger stories_set_updated_at before update on public.stories
+    for each row execute function public.set_updated_at();
+
+-- single_news
+alter table public.single_news add column if not exists updated_at timestamptz not null default now();
+create index if not exists single_news_updated_at_idx on public.single_news (updated_at);
+drop trigger if exists single_news_set_updated_at on public.single_news;
+create trigger single_news_set_updated_at before update on public.single_news
+    for each row execute function public.set_updated_at();
+
+-- cleaned_news
+alter table public.cleaned_news add column if not exists updated_at timestamptz not null default now();
+create index if not exists cleaned_news_updated_at_idx on public.cleaned_news (updated_at);
+drop trigger if exists cleaned_news_set_updated_at on public.cleaned_news;
+create trigger cleaned_news_set_updated_at before update on public.cleaned_news
+    for each row execute function public.set_updated_at();
@@ -0,0 +1,123 @@
+-- 下游工作佇列：每個故事在每個階段的處理狀態
+--
+-- 下游工作不再下載整張結果表做反向比對，改成從這裡認領待處理的 story_id（pipeline_queue.py）：
+--   relative_news  Relative_News.py 產生相關新聞
+--   categories     generate_categories_from_single_news.py 產生分類關鍵字
+--   image          generate_from_supabase.py 產生新聞圖片
+--   terms          DiffKeywordProcessor 產生困難關鍵字
+--
+-- single_news 新增時四個階段都排入 pending；摘要（long）改寫時 terms 重新排入。
+-- 認領後超過租約時間仍未完成（工作中斷）的故事可再被認領。
+
+create table if not exists public.pipeline_state (
+    story_id text not null,
+    stage text not null,
+    status text not null default 'pending' check (status in ('pending', 'claimed', 'done')),
+    claimed_by text,
+    claimed_at timestamptz,
+    done_at timestamptz,
+    updated_at timestamptz not null default now(),
+    primary key (story_id, stage)
+);
+
+create index if not exists pipeline_state_open_idx
+    on public.pipeline_state (stage, updated_at)
+    where status <> 'done';
+
+-- single_news 寫入時排入各階段
+create or replace function public.enqueue_pipeline_stages()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op = 'INSERT' then
+        insert into public.pipeline_state (story_id, stage)
+        select new.story_id::text, stage
+        from unnest(array['relative_news', 'categories', 'image', 'terms']) as stage
+        on conflict (story_id, stage) do nothing;
+    elsif new.long is distinct from old.long then
+        insert into public.pipeline_state (story_id, stage)
+        values (new.story_id::text, 'terms')
+        on conflict (story_id, stage) do update
+            set status = 'pending', claimed_by = null, claimed_at = null, done_at = null, updated_at = now();
+    end if;
+    return new;
+end;
+$$;
+
+drop trigger if exists single_news_enqueue_pipeline on public.single_news;
+create trigger single_news_enqueue_pipeline after insert or update on public.single_news
+    for each row execute function public.enqueue_pipeline_stages();
+
+-- 既有資料：依各結果表判斷是否已完成（與原本各腳本的略過條件相同）
+insert into public.pipeline_state (story_id, stage, status, done_at)
+select s.story_id::text, v.stage,
+       case when v.done then 'done' else 'pending' end,
+       case when v.done then now() end
+from public.single_news s
+cross join lateral (values
+    ('relative_news', exists (select 1 from public.relative_news r where r.src_story_id = s.story_id)),
+    ('categories', (select count(*) from public.keywords_map k where k.story_id = s.story_id) >= 3),
+    ('image', exists (select 1 from public.generated_image g where g.story_id = s.story_id)),
+    ('terms', exists (select 1 from public.term_map t where t.story_id = s.story_id))
+) as v(stage, done)
+on conflict (story_id, stage) do nothing;
+
+-- 認領最多 p_limit 個待處理（或租約過期）的故事；p_story_ids 不為 null 時只認領其中的故事
+create or replace function public.claim_pipeline_stories(
+    p_stage text,
+    p_limit integer default 50,
+    p_worker text default null,
+    p_lease_seconds integer default 21600,
+    p_story_ids text[] default null
+)
+returns setof text
+language sql
+volatile
+as $$
+    update public.pipeline_state p
+    set status = 'claimed', claimed_by = p_worker, claimed_at = now(), updated_at = now()
+    from (
+        select story_id
+        from public.pipeline_state
+        where stage = p_stage
+          and (status = 'pending'
+               or (status = 'claimed' and claimed_at < now() - make_interval(secs => p_lease_seconds)))
+          and (p_story_ids is null or story_id = any(p_story_ids))
+        order by updated_at
+        limit p_limit
+        for update skip locked
+    ) c
+    where p.stage = p_stage and p.story_id = c.story_id
+    returning p.story_id;
+$$;
+
+-- 標記完成；認領期間被重新排入（status 已回到 pending）的故事不受影響
+create or replace function public.complete_pipeline_stories(p_stage text, p_story_ids text[])
+returns integer
+language sql
+volatile
+as $$
+    with done as (
+        update public.pipeline_state
+        set status = 'done', done_at = now(), claimed_by = null, claimed_at = null, updated_at = now()
+        where stage = p_stage and status = 'claimed' and story_id = any(p_story_ids)
+        returning 1
+    )
+    select count(*)::integer from done;
+$$;
+
+-- 處理失敗時放回佇列，下次執行再認領
+create or replace function public.release_pipeline_stories(p_stage text, p_story_ids text[])
+returns integer
+language sql
+volatile
+as $$
+    with released as (
+        update public.pipeline_state
+        set status = 'pending', claimed_by = null, claimed_at = null, updated_at = now()
+        where stage = p_stage and status = 'claimed' and story_id = any(p_story_ids)
+        returning 1
+    )
+    select count(*)::integer from released;
+$$;
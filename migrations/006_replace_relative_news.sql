@@ -0,0 +1,22 @@
+-- 單一故事的相關新聞整批改寫（Relative_News.py）
+--
+-- 刪除舊結果與寫入新結果在同一個函式（同一個交易）中完成：寫入失敗時刪除一併回滾，
+-- 重試也不會留下重複的 (src_story_id, dst_story_id)。
+-- p_rows 為 relative_news 資料列的 JSON 陣列，欄位型別沿用資料表定義。
+
+create or replace function public.replace_relative_news(p_src_story_id text, p_rows jsonb)
+returns integer
+language plpgsql
+volatile
+as $$
+declare
+    inserted integer;
+begin
+    delete from public.relative_news where src_story_id::text = p_src_story_id;
+    insert into public.relative_news (id, reason, src_story_id, dst_story_id)
+    select id, reason, src_story_id, dst_story_id
+    from jsonb_populate_recordset(null::public.relative_news, coalesce(p_rows, '[]'::jsonb));
+    get diagnostics inserted = row_count;
+    return inserted;
+end;
+$$;
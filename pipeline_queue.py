@@ -0,0 +1,109 @@
+"""下游工作的 pipeline_state 佇列（migrations/005）
+
+每個下游工作只認領自己階段待處理的 story_id，處理完標記完成、失敗放回佇列；
+不必再下載整張結果表（relative_news、keywords_map、generated_image、term_map）做反向比對，
+成本只和待處理的故事數有關，不隨歷史資料增加。
+
+    queue = PipelineQueue(STAGE_IMAGE)
+    story_ids = queue.claim_all(limit)
+    ...
+    queue.release(queue.complete_deleted(story_ids, read_ids))  # 讀不到 single_news 的故事
+    queue.complete(done_ids)
+    queue.release(failed_ids)
+"""
+import os
+import socket
+import logging
+from typing import Iterable, List, Optional
+
+from supabase_repo import TableRepo, get_client, execute
+
+logger = logging.getLogger(__name__)
+
+STAGE_RELATIVE_NEWS = "relative_news"
+STAGE_CATEGORIES = "categories"
+STAGE_IMAGE = "image"
+STAGE_TERMS = "terms"
+
+SOURCE_TABLE = "single_news"  # 各階段的故事都來自 single_news（migrations/005 的觸發器）
+
+CLAIM_BATCH_SIZE = 50
+# 租約需涵蓋一次完整執行；超過仍未完成的故事視為工作中斷，可再被認領（排程為每 12 小時一次）
+CLAIM_LEASE_SECONDS = int(os.getenv("PIPELINE_CLAIM_LEASE_SECONDS", 6 * 3600))
+
+
+class PipelineQueue:
+    """單一階段的認領、完成與放回"""
+
+    def __init__(self, stage: str, client=None, worker: Optional[str] = None,
+                 batch_size: int = CLAIM_BATCH_SIZE, lease_seconds: int = CLAIM_LEASE_SECONDS):
+        self.stage = stage
+        self._client = client
+        self.worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_client()
+        return self._client
+
+    def claim(self, limit: Optional[int] = None, story_ids: Optional[Iterable[str]] = None) -> List[str]:
+        """認領一批待處理的 story_id（最多 limit 或 batch_size 個）"""
+        params = {
+            "p_stage": self.stage,
+            "p_limit": limit or self.batch_size,
+            "p_worker": self.worker,
+            "p_lease_seconds": self.lease_seconds,
+            "p_story_ids": [str(story_id) for story_id in story_ids] if story_ids is not None else None,
+        }
+        rows = execute(self.client.rpc("claim_pipeline_stories", params)).data or []
+        # setof text 的回傳可能是純字串或 {"claim_pipeline_stories": ...}
+        return [row if isinstance(row, str) else next(iter(row.values())) for row in rows]
+
+    def claim_all(self, limit: Optional[int] = None, story_ids: Optional[Iterable[str]] = None) -> List[str]:
+        """分批認領直到沒有待處理的故事或達到 limit"""
+        story_ids = list(story_ids) if story_ids is not None else None
+        if story_ids is not None and not story_ids:
+            return []
+        claimed: List[str] = []
+        while limit is None or len(claimed) < limit:
+            size = self.batch_size if limit is None else min(self.batch_size, limit - len(claimed))
+            batch = self.claim(size, story_ids)
+            claimed.extend(batch)
+            if len(batch) < size:
+                break
+        logger.info(f"pipeline_state[{self.stage}]: 認領 {len(claimed)} 個待處理故事")
+        return claimed
+
+    def complete(self, story_ids: Iterable[str]) -> int:
+        story_ids = [str(story_id) for story_id in story_ids]
+        if not story_ids:
+            return 0
+        return execute(self.client.rpc("complete_pipeline_stories", {
+            "p_stage": self.stage, "p_story_ids": story_ids,
+        })).data or 0
+
+    def complete_deleted(self, story_ids: Iterable[str], found_story_ids: Iterable[str],
+                         table: str = SOURCE_TABLE) -> List[str]:
+        """認領到但沒讀到 table 資料列的故事：以 Supabase 確認已刪除的標記完成（否則會永遠被認領又放回），
+        回傳 Supabase 上仍存在（例如本機鏡像落後）、應放回佇列的 story_id"""
+        found = {str(story_id) for story_id in found_story_ids}
+        missing = [str(story_id) for story_id in story_ids if str(story_id) not in found]
+        if not missing:
+            return []
+        remote = {str(row["story_id"]) for row in TableRepo(table, self.client).select_in("story_id", "story_id", missing)}
+        deleted = [story_id for story_id in missing if story_id not in remote]
+        if deleted:
+            logger.warning(f"pipeline_state[{self.stage}]: {len(deleted)} 個故事在 {table} 中已不存在，直接標記完成")
+            self.complete(deleted)
+        return [story_id for story_id in missing if story_id in remote]
+
+    def release(self, story_ids: Iterable[str]) -> int:
+        story_ids = [str(story_id) for story_id in story_ids]
+        if not story_ids:
+            return 0
+        return execute(self.client.rpc("release_pipeline_stories", {
+            "p_stage": self.stage, "p_story_ids": story_ids,
+        })).data or 0
@@ -0,0 +1,88 @@
+"""以目前的抽取器重新處理頁面存檔，更新 cleaned_news，不必重新爬取
+
+爬蟲會把每個抓到的整頁 HTML 存在 page_archive/（見 test5_play.PageArchive）。
+抽取器或清洗提示改版後執行：
+  python reextract_archive.py [workers] [--clean] [--dry-run]
+
+workers 為平行處理的行程數，預設為 CPU 數；--clean 會再跑一次 Gemini 清洗；
+--dry-run 只統計抽取結果，不寫入資料庫。
+"""
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+from bs4 import BeautifulSoup
+
+import test5_play as crawler
+from supabase_repo import execute
+
+ARGS = [a for a in sys.argv[1:] if not a.startswith("--")]
+WORKERS = int(ARGS[0]) if ARGS else os.cpu_count() or 1
+RUN_CLEANING = "--clean" in sys.argv
+DRY_RUN = "--dry-run" in sys.argv
+
+
+def reextract_entry(entry):
+    """在 worker 行程中解壓並重新抽取一頁，回傳 (索引, 抽取結果)；失敗時結果為 None"""
+    try:
+        html = crawler.page_archive.read(entry)
+        soup = BeautifulSoup(html, "html.parser")
+        return entry, crawler.extract_article_content(soup, entry["final_url"], entry.get("media") or "")
+    except Exception as e:
+        print(f"重新抽取失败 {entry['final_url']}: {e}")
+        return entry, None
+
+
+def update_cleaned_news(entry, extracted):
+    """把重新抽取的內容寫回 cleaned_news，回傳是否有對應的文章"""
+    content = extracted["content"]
+    if RUN_CLEANING:
+        article = {"content": content, "extraction": extracted["extraction"]}
+        crawler.clean_data([{"articles": [article]}])
+        content = article["content"]
+    if not content or "[清洗失敗]" in content:
+        return False
+
+    raw_html_payload, raw_html_codec = crawler.compress_raw_html(extracted["raw_html"]) if extracted["raw_html"] else (None, None)
+    response = execute(crawler.supabase.table("cleaned_news").update({
+        "content": content,
+        "raw_html": raw_html_payload,
+        "raw_html_codec": raw_html_codec
+    }).eq("article_url", entry["final_url"]))
+    return bool(response.data)
+
+
+def main():
+    entries = crawler.page_archive.entries()
+    if not entries:
+        print(f"存档中没有页面: {crawler.PAGE_ARCHIVE_DIR}")
+        return
+
+    print(f"重新抽取 {len(entries)} 个页面（{WORKERS} 个行程）...")
+    started = time.time()
+    extracted_count = 0
+    updated_count = 0
+    empty_count = 0
+
+    with Pool(WORKERS) as pool:
+        for entry, extracted in pool.imap_unordered(reextract_entry, entries, chunksize=8):
+            if not extracted or not extracted["content"]:
+                empty_count += 1
+                continue
+            extracted_count += 1
+            if DRY_RUN:
+                continue
+            try:
+                if update_cleaned_news(entry, extracted):
+                    updated_count += 1
+            except Exception as e:
+                print(f"更新 cleaned_news 失败 {entry['final_url']}: {e}")
+
+    print("=" * 60)
+    print(f"抽取成功: {extracted_count}  无内容: {empty_count}  已更新 cleaned_news: {updated_count}")
+    print(f"耗时: {time.time() - started:.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()
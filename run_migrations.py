@@ -0,0 +1,120 @@
+"""依序套用 migrations/ 下的 SQL 並檢視熱門查詢的執行計畫
+
+需要直接連線 Postgres（Supabase 專案設定中的 connection string）：
+  SUPABASE_DB_URL=postgresql://... python run_migrations.py [--dry-run] [--explain]
+
+已套用的版本記錄在 public.schema_migrations；每個檔案在單一交易中執行，失敗時整個檔案回滾。
+--dry-run 只列出待套用的檔案；--explain 在套用後印出熱門查詢的 EXPLAIN。
+"""
+import os
+import sys
+
+from dotenv import load_dotenv
+
+try:
+    import psycopg
+    from psycopg import sql
+except ImportError:
+    print("請先安裝 psycopg：pip install 'psycopg[binary]'")
+    raise SystemExit(1)
+
+load_dotenv()
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+DB_URL = os.getenv("SUPABASE_DB_URL")
+DRY_RUN = "--dry-run" in sys.argv
+EXPLAIN = "--explain" in sys.argv
+
+# (名稱, 取樣本值的查詢, 要檢視的查詢)；樣本值以字面值代入，避免參數化查詢拿到泛用計畫
+HOT_QUERIES = [
+    ("stories 依 story_url 取最新",
+     "select story_url from public.stories limit 1",
+     "select * from public.stories where story_url = {} order by crawl_date desc limit 1"),
+    ("cleaned_news 依 article_url 查是否存在",
+     "select article_url from public.cleaned_news limit 1",
+     "select article_id from public.cleaned_news where article_url = {}"),
+    ("cleaned_news 依 story_id 取文章",
+     "select story_id from public.cleaned_news limit 1",
+     "select article_id, article_title, article_url, content, media from public.cleaned_news where story_id = {}"),
+    ("single_news 依 story_id",
+     "select story_id from public.single_news limit 1",
+     "select story_id from public.single_news where story_id = {}"),
+    ("term_map 依 (story_id, term)",
+     "select story_id from public.term_map limit 1",
+     "select story_id, term from public.term_map where story_id = {}"),
+    ("keywords_map 依 (story_id, keyword)",
+     "select story_id from public.keywords_map limit 1",
+     "select story_id, keyword from public.keywords_map where story_id = {}"),
+    ("generated_image 依 story_id",
+     "select story_id from public.generated_image limit 1",
+     "select story_id from public.generated_image where story_id = {}"),
+    ("relative_news 依 src_story_id",
+     "select src_story_id from public.relative_news limit 1",
+     "select src_story_id from public.relative_news where src_story_id = {}"),
+]
+
+
+def migration_files():
+    return sorted(name for name in os.listdir(MIGRATIONS_DIR) if name.endswith(".sql"))
+
+
+def applied_versions(conn):
+    conn.execute("""
+        create table if not exists public.schema_migrations (
+            version text primary key,
+            applied_at timestamptz not null default now()
+        )
+    """)
+    conn.commit()
+    return {row[0] for row in conn.execute("select version from public.schema_migrations")}
+
+
+def apply_migrations(conn):
+    done = applied_versions(conn)
+    pending = [name for name in migration_files() if name not in done]
+    if not pending:
+        print("没有待套用的 migration")
+        return
+    for name in pending:
+        if DRY_RUN:
+            print(f"待套用: {name}")
+            continue
+        with open(os.path.join(MIGRATIONS_DIR, name), "r", encoding="utf-8") as f:
+            statements = f.read()
+        print(f"套用 {name} ...")
+        with conn.transaction():
+            conn.execute(statements)
+            conn.execute("insert into public.schema_migrations (version) values (%s)", (name,))
+        print(f"   完成")
+
+
+def explain_hot_queries(conn):
+    print("\n" + "=" * 60)
+    print("热门查询执行计划")
+    for title, sample_query, query in HOT_QUERIES:
+        print(f"\n--- {title}")
+        try:
+            with conn.transaction():
+                row = conn.execute(sample_query).fetchone()
+                if not row:
+                    print("   (表中没有资料，略过)")
+                    continue
+                statement = sql.SQL("explain (analyze, buffers) " + query).format(sql.Literal(row[0]))
+                for (line,) in conn.execute(statement):
+                    print(f"   {line}")
+        except Exception as e:
+            print(f"   无法取得执行计划: {e}")
+
+
+def main():
+    if not DB_URL:
+        print("請設定 SUPABASE_DB_URL（Postgres connection string）")
+        raise SystemExit(1)
+    with psycopg.connect(DB_URL) as conn:
+        apply_migrations(conn)
+        if EXPLAIN:
+            explain_hot_queries(conn)
+
+
+if __name__ == "__main__":
+    main()
@@ -40,6 +40,13 @@ def run_scripts():
         else:
             logging.info(f"✅ {script} 執行完成")
 
+def resync_mirror():
+    """本機鏡像每天整表重新同步一次，補回增量同步可能漏掉的更新（見 local_mirror.py）"""
+    logging.info("▶ 本機鏡像整表重新同步 ...")
+    result = subprocess.run(["python", "local_mirror.py", "--full"])
+    if result.returncode != 0:
+        logging.error(f"❌ 本機鏡像整表重新同步出錯 (return code {result.returncode})")
+
 def main():
     """主函數"""
     logging.info("🟢 啟動，立即執行一次")
@@ -47,6 +54,7 @@ def main():
 
     # 每 12 小時排程
     schedule.every(12).hours.do(lambda: logging.info("🔁 排程觸發") or run_scripts())
+    schedule.every().day.at("03:00").do(resync_mirror)
 
     while True:
         schedule.run_pending()
@@ -0,0 +1,355 @@
+"""共用的 Supabase 資料存取層
+
+所有腳本（爬蟲、摘要、關鍵字、分類、圖片、相關新聞）都從這裡取得 client，
+同一個行程只建立一次連線池：PostgREST 請求走同一個 keep-alive 的 httpx 連線池，
+有安裝 h2 時使用 HTTP/2。另外提供：
+
+- TableRepo：每張表的查詢輔助（必填欄位清單的 select、exists、分批 insert/upsert）
+- TableRepo.iter_rows()：以 keyset 或 range() 分頁串流讀取，不受 PostgREST max-rows 截斷
+- execute()：對暫時性錯誤（連線中斷、逾時、5xx、429）自動重試
+- query_stats：依 (方法, 表名, 選取欄位) 統計請求數、延遲與回應位元組數，行程結束時寫入 log；
+  未指定欄位的 select=* 查詢會記錄警告
+"""
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import httpx
+from dotenv import load_dotenv
+from supabase import create_client, Client
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False  # 沒有 h2 時退回 HTTP/1.1 keep-alive
+
+logger = logging.getLogger(__name__)
+
+REST_TIMEOUT = float(os.getenv("SUPABASE_REST_TIMEOUT", 30))
+POOL_MAX_CONNECTIONS = 20
+POOL_KEEPALIVE_SECONDS = 60
+CONNECT_RETRIES = 3  # 連線層（DNS、TCP、TLS）失敗的重試次數
+QUERY_RETRIES = 3  # execute() 對暫時性錯誤的重試次數
+RETRY_BACKOFF_SECONDS = 1.0
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+DEFAULT_BATCH_SIZE = 500
+IN_FILTER_CHUNK_SIZE = 100  # in_() 的值放在 URL 上，分段避免超過長度限制
+# 分頁讀取每頁筆數；不超過 PostgREST 的 max-rows（Supabase 預設 1000）時每頁都是滿的
+PAGE_SIZE = int(os.getenv("SUPABASE_PAGE_SIZE", 1000))
+
+
+class QueryStats:
+    """以 (方法, 表名, 選取欄位) 累計請求數、總延遲與回應位元組數"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started: Dict[int, float] = {}
+        self._warned_wildcard = set()
+        self.stats = defaultdict(lambda: {"requests": 0, "seconds": 0.0, "bytes": 0})
+
+    @staticmethod
+    def _key(request: httpx.Request):
+        path = request.url.path
+        table = path
+        for prefix in ("/rest/v1/rpc/", "/rest/v1/"):
+            if prefix in path:
+                table = path.split(prefix, 1)[1].split("/")[0] or "?"
+                break
+        return request.method, table, request.url.params.get("select", "")
+
+    def on_request(self, request: httpx.Request):
+        method, table, columns = self._key(request)
+        wildcard = method == "GET" and columns.strip() in ("", "*") and "/rpc/" not in request.url.path
+        with self._lock:
+            self._started[id(request)] = time.perf_counter()
+            if wildcard and table not in self._warned_wildcard:
+                self._warned_wildcard.add(table)
+                logger.warning(f"{table} 的查詢沒有指定欄位（select=*），會下載整列資料")
+
+    def on_response(self, response: httpx.Response):
+        response.read()
+        request = response.request
+        with self._lock:
+            started = self._started.pop(id(request), None)
+            entry = self.stats[self._key(request)]
+            entry["requests"] += 1
+            entry["bytes"] += len(response.content)
+            if started is not None:
+                entry["seconds"] += time.perf_counter() - started
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                f"{method} {table}" + (f" [{columns}]" if columns else ""): dict(entry)
+                for (method, table, columns), entry in self.stats.items()
+            }
+
+    def log_summary(self):
+        snapshot = self.snapshot()
+        if not snapshot:
+            return
+        logger.info("Supabase 查詢統計:")
+        for key, entry in sorted(snapshot.items(), key=lambda kv: kv[1]["seconds"], reverse=True):
+            avg_ms = entry["seconds"] / entry["requests"] * 1000 if entry["requests"] else 0.0
+            logger.info(f"  {key}: {entry['requests']} 次, 平均 {avg_ms:.0f} ms, 共 {entry['bytes']} bytes")
+
+
+query_stats = QueryStats()
+atexit.register(query_stats.log_summary)
+
+_clients: Dict[tuple, Client] = {}
+_clients_lock = threading.Lock()
+
+
+def _pooled_session(base_url: str, headers) -> httpx.Client:
+    """PostgREST 共用的連線池"""
+    return httpx.Client(
+        base_url=base_url,
+        headers=headers,
+        timeout=REST_TIMEOUT,
+        # 指定 transport 時 Client 的 limits/http2 會被忽略，連線池設定必須放在 transport 上
+        transport=httpx.HTTPTransport(
+            http2=HTTP2_AVAILABLE,
+            retries=CONNECT_RETRIES,
+            limits=httpx.Limits(
+                max_connections=POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=POOL_MAX_CONNECTIONS,
+                keepalive_expiry=POOL_KEEPALIVE_SECONDS,
+            ),
+        ),
+        event_hooks={"request": [query_stats.on_request], "response": [query_stats.on_response]},
+    )
+
+
+def get_client(url: Optional[str] = None, key: Optional[str] = None) -> Client:
+    """取得共用的 Supabase client（同一組 URL/Key 在行程內只建立一次）"""
+    load_dotenv()
+    url = url or os.getenv("SUPABASE_URL")
+    key = key or os.getenv("SUPABASE_KEY")
+    if not url or not key:
+        raise ValueError("請設定 SUPABASE_URL 和 SUPABASE_KEY 環境變數")
+
+    with _clients_lock:
+        client = _clients.get((url, key))
+        if client is None:
+            client = create_client(url, key)
+            # 換掉 postgrest 預設的 session，所有 table()/rpc() 請求都走共用連線池
+            postgrest = client.postgrest
+            old_session = postgrest.session
+            postgrest.session = _pooled_session(str(old_session.base_url), old_session.headers)
+            old_session.close()
+            _clients[(url, key)] = client
+            logger.info(f"Supabase 連線池初始化 ({'HTTP/2' if HTTP2_AVAILABLE else 'HTTP/1.1'})")
+        return client
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (httpx.TransportError, httpx.TimeoutException)):
+        return True
+    code = getattr(error, "code", None)
+    try:
+        return int(code) in RETRYABLE_STATUS
+    except (TypeError, ValueError):
+        return False
+
+
+def execute(query, retries: int = QUERY_RETRIES):
+    """執行 PostgREST 查詢，暫時性錯誤以指數退避重試"""
+    for attempt in range(retries + 1):
+        try:
+            return query.execute()
+        except Exception as e:
+            if attempt >= retries or not _is_retryable(e):
+                raise
+            delay = RETRY_BACKOFF_SECONDS * 2 ** attempt
+            logger.warning(f"Supabase 查詢失敗，{delay:.0f} 秒後重試 ({attempt + 1}/{retries}): {e}")
+            time.sleep(delay)
+
+
+def require_columns(columns: str) -> str:
+    """查詢一律要列出欄位，避免下載整列（例如 cleaned_news 的 content 與 raw_html）"""
+    names = [name.strip() for name in columns.split(",")]
+    if not all(names) or "*" in names:
+        raise ValueError(f"查詢必須明確列出欄位，不能使用 {columns!r}")
+    return columns
+
+
+def _range_pages(fetch: Callable[[int], List[Dict[str, Any]]], page_size: int,
+                 prefetch: int = 0) -> Iterator[List[Dict[str, Any]]]:
+    """以 offset 逐頁呼叫 fetch(offset)，直到拿到空頁
+
+    prefetch > 0 時同時預取後面幾頁。遇到不滿的一頁（最後一頁，或伺服器 max-rows 小於 page_size）
+    就停止預取，從實際讀到的位置改為逐頁讀取，避免跳過資料。
+    """
+    offset = 0
+    if prefetch > 0:
+        with ThreadPoolExecutor(max_workers=prefetch + 1) as pool:
+            window = deque((start, pool.submit(fetch, start))
+                           for start in range(0, (prefetch + 1) * page_size, page_size))
+            next_start = (prefetch + 1) * page_size
+            while True:
+                start, future = window.popleft()
+                rows = future.result()
+                if len(rows) < page_size:
+                    for _, pending in window:
+                        pending.cancel()
+                    if not rows:
+                        return
+                    yield rows
+                    offset = start + len(rows)
+                    break
+                yield rows
+                window.append((next_start, pool.submit(fetch, next_start)))
+                next_start += page_size
+    while True:
+        rows = fetch(offset)
+        if not rows:
+            return
+        yield rows
+        offset += len(rows)
+
+
+def batched(rows: Sequence[Dict[str, Any]], size: int = DEFAULT_BATCH_SIZE) -> Iterable[List[Dict[str, Any]]]:
+    for start in range(0, len(rows), size):
+        yield list(rows[start:start + size])
+
+
+class TableRepo:
+    """單一資料表的查詢輔助，欄位清單一律由呼叫端明確指定"""
+
+    def __init__(self, name: str, client: Optional[Client] = None):
+        self.name = name
+        self._client = client
+
+    @property
+    def client(self) -> Client:
+        if self._client is None:
+            self._client = get_client()
+        return self._client
+
+    def query(self):
+        return self.client.table(self.name)
+
+    def _filtered(self, columns: str, filters: Dict[str, Any]):
+        query = self.query().select(require_columns(columns))
+        for column, value in filters.items():
+            if isinstance(value, (list, tuple, set)):
+                query = query.in_(column, list(value))
+            else:
+                query = query.eq(column, value)
+        return query
+
+    def iter_pages(self, columns: str, order_by: str, page_size: int = PAGE_SIZE, keyset: bool = False,
+                   prefetch: int = 0, **filters) -> Iterator[List[Dict[str, Any]]]:
+        """分頁讀取，每次產出一頁
+
+        order_by 為逗號分隔的排序欄位，必須能決定唯一順序。keyset=True 時 order_by 須為
+        columns 中的單一唯一欄位，以 > 上一頁最後一個值翻頁（不受資料量影響，但無法預取）；
+        否則以 range() 翻頁，prefetch 為同時預取的頁數。filters 的值為 list/tuple/set 時以 in_ 比對。
+        """
+        order_columns = [column.strip() for column in order_by.split(",") if column.strip()]
+        if keyset:
+            if len(order_columns) != 1 or order_columns[0] not in [c.strip() for c in columns.split(",")]:
+                raise ValueError("keyset 分頁需要 columns 中的單一唯一排序欄位")
+            key = order_columns[0]
+            last = None
+            while True:
+                query = self._filtered(columns, filters)
+                if last is not None:
+                    query = query.gt(key, last)
+                rows = execute(query.order(key).limit(page_size)).data or []
+                if not rows:
+                    return
+                yield rows
+                last = rows[-1][key]
+
+        def fetch(offset: int) -> List[Dict[str, Any]]:
+            query = self._filtered(columns, filters)
+            for column in order_columns:
+                query = query.order(column)
+            return execute(query.range(offset, offset + page_size - 1)).data or []
+
+        yield from _range_pages(fetch, page_size, prefetch)
+
+    def iter_rows(self, columns: str, order_by: str, page_size: int = PAGE_SIZE, keyset: bool = False,
+                  prefetch: int = 0, **filters) -> Iterator[Dict[str, Any]]:
+        """逐筆串流讀取整個結果，參數同 iter_pages"""
+        for page in self.iter_pages(columns, order_by, page_size, keyset, prefetch, **filters):
+            yield from page
+
+    def select(self, columns: str, **eq) -> List[Dict[str, Any]]:
+        """單次查詢，超過伺服器 max-rows 的部分會被截斷；可能很多筆時改用 iter_rows"""
+        query = self.query().select(require_columns(columns))
+        for column, value in eq.items():
+            query = query.eq(column, value)
+        return execute(query).data or []
+
+    def first(self, columns: str, order_by: Optional[str] = None, desc: bool = False,
+              **eq) -> Optional[Dict[str, Any]]:
+        """依 order_by 排序後的第一筆，沒有資料時回傳 None"""
+        query = self.query().select(require_columns(columns))
+        for column, value in eq.items():
+            query = query.eq(column, value)
+        if order_by:
+            query = query.order(order_by, desc=desc)
+        rows = execute(query.limit(1)).data
+        return rows[0] if rows else None
+
+    def select_in(self, columns: str, column: str, values: Iterable[Any],
+                  chunk_size: int = IN_FILTER_CHUNK_SIZE, order_by: Optional[str] = None) -> List[Dict[str, Any]]:
+        """column 在 values 之中的資料列，values 分段查詢，每段再分頁讀取
+
+        order_by 預設為全部選取欄位，適用於欄位組合唯一的小欄位查詢（例如 story_id,term）。
+        """
+        values = list(values)
+        rows: List[Dict[str, Any]] = []
+        for start in range(0, len(values), chunk_size):
+            rows.extend(self.iter_rows(columns, order_by or columns, **{column: values[start:start + chunk_size]}))
+        return rows
+
+    def exists(self, key_column: str, **eq) -> bool:
+        """只取一個鍵欄位確認是否存在"""
+        query = self.query().select(require_columns(key_column))
+        for column, value in eq.items():
+            query = query.eq(column, value)
+        return bool(execute(query.limit(1)).data)
+
+    def insert_many(self, rows: Sequence[Dict[str, Any]], batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+        """分批寫入，回傳寫入筆數"""
+        written = 0
+        for batch in batched(rows, batch_size):
+            execute(self.query().insert(batch))
+            written += len(batch)
+        return written
+
+    def upsert_many(self, rows: Sequence[Dict[str, Any]], on_conflict: str,
+                    batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+        """依 on_conflict 欄位分批 upsert，回傳寫入筆數"""
+        written = 0
+        for batch in batched(rows, batch_size):
+            execute(self.query().upsert(batch, on_conflict=on_conflict))
+            written += len(batch)
+        return written
+
+    def update(self, values: Dict[str, Any], **eq) -> List[Dict[str, Any]]:
+        query = self.query().update(values)
+        for column, value in eq.items():
+            query = query.eq(column, value)
+        return execute(query).data or []
+
+
+stories = TableRepo("stories")
+cleaned_news = TableRepo("cleaned_news")
+single_news = TableRepo("single_news")
+term = TableRepo("term")
+term_map = TableRepo("term_map")
+keywords = TableRepo("keywords")
+keywords_map = TableRepo("keywords_map")
+generated_image = TableRepo("generated_image")
+relative_news = TableRepo("relative_news")
@@ -12,7 +12,7 @@ import time
 import datetime as dt
 from datetime import datetime, timedelta
 import requests
-from supabase import create_client, Client
+from supabase import Client
 import uuid
 import os
 import json
@@ -26,7 +26,8 @@ from google.genai import types
 import shutil
 import logging
 # Supabase imports
-from supabase import create_client, Client
+import supabase_repo
+from supabase_repo import get_client
 from dotenv import load_dotenv
 from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
 
@@ -41,8 +42,11 @@ driver_bin = os.environ.get("CHROMEDRIVER_BIN")
 SUPABASE_URL = os.getenv("SUPABASE_URL")  # 替換為你的 Supabase URL
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")  # 替換為你的 Supabase API Key
 
-# 初始化 Supabase 客戶端
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# 初始化 Supabase 客戶端（共用連線池）
+supabase: Client = get_client(SUPABASE_URL, SUPABASE_KEY)
+
+# 比對故事時只需要這些欄位；文章存在性檢查只取鍵欄位，不下載 content
+STORY_LOOKUP_COLUMNS = "story_id,story_url,story_title,category,crawl_date"
 
 api_key = os.getenv("GEMINI_API_KEY")
 if not api_key:
@@ -662,13 +666,14 @@ def check_story_exists_in_supabase(story_url, category, article_datetime="", art
     """
     try:
         # 1. 檢查 story_url 是否存在，按 crawl_date 降序排列取最新的
-        story_response = supabase.table("stories").select("*").eq("story_url", story_url).order("crawl_date", desc=True).limit(1).execute()
+        existing_story = supabase_repo.stories.first(
+            STORY_LOOKUP_COLUMNS, order_by="crawl_date", desc=True, story_url=story_url
+        )
 
-        if not story_response.data:
+        if not existing_story:
             # 故事不存在，需要創建新故事
             return False, "create_new_story", None, "新故事"
         
-        existing_story = story_response.data[0]
         story_id = existing_story["story_id"]
         existing_crawl_date = existing_story["crawl_date"]
         
@@ -708,9 +713,7 @@ def check_story_exists_in_supabase(story_url, category, article_datetime="", art
                     
                     # 4. 檢查文章URL是否已存在
                     if article_url:
-                        article_response = supabase.table("cleaned_news").select("article_id").eq("article_url", article_url).execute()
-                        
-                        if article_response.data:
+                        if supabase_repo.cleaned_news.exists("article_id", article_url=article_url):
                             # 文章已存在，跳過
                             return True, "skip", existing_story, f"文章已存在於故事 {story_id}"
                         else:
@@ -749,7 +752,7 @@ def save_story_to_supabase(story_data):
         }
         
         # 使用 upsert 來避免重複插入
-        response = supabase.table("stories").upsert(story_record, on_conflict="story_id").execute()
+        response = supabase_repo.execute(supabase.table("stories").upsert(story_record, on_conflict="story_id"))
         print(f"   ✅ 故事已保存到資料庫: {story_data['story_id']}")
         return True
         
@@ -773,14 +776,13 @@ def save_article_to_supabase(article_data, story_id):
             
         # 使用 upsert 來避免重複插入
         article_url = article_data["article_url"]
-        existing_article = supabase.table("cleaned_news").select("article_id").eq("article_url", article_url).execute()
-        if existing_article.data:
+        if supabase_repo.cleaned_news.exists("article_id", article_url=article_url):
             print(f"   ⚠️ 文章已存在，跳過保存: {article_data['article_id']}")
             return True
         elif not article_data["content"] or "[清洗失敗]" in article_data["content"] or "請提供" in article_data["content"]:
             print(f"   ⚠️ 文章內容無效，跳過保存: {article_data['article_id']}")
             return True
-        response = supabase.table("cleaned_news").upsert(article_record, on_conflict="article_id").execute()
+        response = supabase_repo.execute(supabase.table("cleaned_news").upsert(article_record, on_conflict="article_id"))
         print(f"   ✅ 文章已保存到資料庫: {article_data['article_id']}")
         return True
         
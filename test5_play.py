@@ -1,35 +1,54 @@
 
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, Comment, Tag
 import time
 import datetime as dt
 from datetime import datetime, timedelta
 import requests
-from supabase import create_client, Client
+from supabase import Client
 import uuid
 import os
 import json
 import random
 import re
+import heapq
+import math
+import hashlib
 from urllib.parse import urljoin, urlparse
 from collections import defaultdict
 from dateutil import parser
 from google import genai
 from google.genai import types
 import shutil
+import threading
+import itertools
+import io
+import gzip
+import base64
+import xml.etree.ElementTree as ET
+from email.utils import parsedate_to_datetime
 from dotenv import load_dotenv
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # 沒有 zstandard 時原始 HTML 改用 gzip 壓縮
+
 load_dotenv()  # 這行會讀 .env 檔
 
 # Supabase imports
-from supabase import create_client, Client
+import supabase_repo
+from supabase_repo import get_client
 
 # Supabase 配置
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-# 初始化 Supabase 客戶端
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# 初始化 Supabase 客戶端（共用連線池）
+supabase: Client = get_client(SUPABASE_URL, SUPABASE_KEY)
+
+# 比對故事時只需要這些欄位；文章存在性檢查只取鍵欄位，不下載 content
+STORY_LOOKUP_COLUMNS = "story_id,story_url,story_title,category,crawl_date"
 
 api_key = os.getenv("GEMINI_API_KEY")
 if not api_key:
@@ -40,6 +59,617 @@ try:
 except Exception as e:
     raise ValueError(f"無法初始化 Gemini Client，請檢查 API 金鑰：{e}")
 
+CRAWLER_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
+
+# 故事探索後端："feed" 先用主題 RSS，取不到再回退瀏覽器；"browser" 只用瀏覽器
+STORY_DISCOVERY_MODE = os.getenv("STORY_DISCOVERY_MODE", "feed")
+FEED_REQUEST_TIMEOUT = 10  # 秒
+TAIPEI_TZ = dt.timezone(timedelta(hours=8))
+
+# Playwright storage_state 快照，新 context 直接帶入登入狀態，省去每次的 cookies 暖機
+STORAGE_STATE_PATH = os.getenv("STORAGE_STATE_PATH", "storage_state.json")
+STORAGE_STATE_MAX_AGE = 12 * 60 * 60  # 快照最長使用時間（秒）
+STORAGE_STATE_REFRESH_MARGIN = 60 * 60  # 距離失效不足此秒數時在背景更新
+
+RAW_HTML_ZSTD_LEVEL = 10  # cleaned_news.raw_html 的 zstd 壓縮等級
+
+# 每個抓到的整頁 HTML 以內容雜湊壓縮存檔，抽取器或清洗提示改版時可重新抽取而不必重爬
+PAGE_ARCHIVE_DIR = os.getenv("PAGE_ARCHIVE_DIR", "page_archive")
+
+# 爬蟲指標輸出（每行一筆 JSON 事件）
+CRAWLER_METRICS_PATH = os.getenv("CRAWLER_METRICS_PATH", "outputs/metrics/crawler_metrics.jsonl")
+
+# HAR 錄製/重播："record" 把每個 context 與 HTTP 請求的流量存成 HAR；
+# "replay" 所有請求改由 HAR 回應，完全離線，用於基準測試
+CRAWLER_HAR_MODE = os.getenv("CRAWLER_HAR_MODE", "")
+CRAWLER_HAR_DIR = os.getenv("CRAWLER_HAR_DIR", "har_archives")
+CRAWLER_HAR_RUN = os.getenv("CRAWLER_HAR_RUN", "")  # 重播的錄製批次，預設為最新一批
+BLOCKED_RESOURCE_TYPES = ["image", "stylesheet", "font", "media"]
+
+# Google 驗證頁（/sorry）斷路器
+GOOGLE_BREAKER_THRESHOLD = 2  # 連續遇到幾次驗證頁就跳脫
+GOOGLE_BREAKER_BASE_COOLDOWN = 60  # 第一次跳脫的冷卻秒數，之後每次加倍
+GOOGLE_BREAKER_MAX_COOLDOWN = 30 * 60
+# 出版商封鎖/付費牆偵測：導航後先看狀態碼、標題與前段文字，命中就讓該網域冷卻
+BLOCK_STATUS_CODES = {401, 403, 429, 451}
+BLOCK_PAGE_MARKERS = {
+    "您的網路已遭到停止訪問本網站的權利": "access_denied",
+    "Access Denied": "access_denied",
+    "Attention Required! | Cloudflare": "captcha",
+    "Just a moment...": "captcha",
+    "請完成安全驗證": "captcha",
+    "訂閱後即可閱讀": "paywall",
+    "付費會員專屬": "paywall",
+}
+BLOCK_PROBE_CHARS = 3000  # 文字探測只讀頁面前段
+DOMAIN_BLOCK_COOLDOWN = 15 * 60  # 秒
+
+# 抓取失敗的文章（分類後）寫入死信佇列，在主迴圈結束後或下一次執行時重試
+DEAD_LETTER_PATH = os.getenv("DEAD_LETTER_PATH", "dead_letters.json")
+DEAD_LETTER_MAX_ATTEMPTS = 3
+# 單篇文章在同一次抓取內的嘗試次數；預設不在主迴圈重試，失敗直接交給死信佇列
+ARTICLE_FETCH_ATTEMPTS = max(1, int(os.getenv("ARTICLE_FETCH_ATTEMPTS", 1)))
+
+# 所有 worker 合計對 Google News 頁面的最小請求間隔（秒）
+GOOGLE_MIN_REQUEST_INTERVAL = 2.0
+
+# Google News 各分類的主題頁
+NEWS_CATEGORIES = {
+    "Politics": "https://news.google.com/topics/CAAqJQgKIh9DQkFTRVFvSUwyMHZNRFZ4ZERBU0JYcG9MVlJYS0FBUAE?hl=zh-TW&gl=TW&ceid=TW%3Azh-Hant",
+    "Taiwan News": "https://news.google.com/topics/CAAqJQgKIh9DQkFTRVFvSUwyMHZNRFptTXpJU0JYcG9MVlJYS0FBUAE?hl=zh-TW&gl=TW&ceid=TW%3Azh-Hant",
+    "International News": "https://news.google.com/topics/CAAqKggKIiRDQkFTRlFvSUwyMHZNRGx1YlY4U0JYcG9MVlJYR2dKVVZ5Z0FQAQ?hl=zh-TW&gl=TW&ceid=TW%3Azh-Hant",
+    "Science & Technology": "https://news.google.com/topics/CAAqLAgKIiZDQkFTRmdvSkwyMHZNR1ptZHpWbUVnVjZhQzFVVnhvQ1ZGY29BQVAB?hl=zh-TW&gl=TW&ceid=TW%3Azh-Hant",
+    "Lifestyle & Consumer": "https://news.google.com/topics/CAAqJggKIiBDQkFTRWdvSkwyMHZNREUwWkhONEVnVjZhQzFVVnlnQVAB?hl=zh-TW&gl=TW&ceid=TW%3Azh-Hant",
+    "Sports": "https://news.google.com/topics/CAAqKggKIiRDQkFTRlFvSUwyMHZNRFp1ZEdvU0JYcG9MVlJYR2dKVVZ5Z0FQAQ?hl=zh-TW&gl=TW&ceid=TW%3Azh-Hant",
+    "Entertainment": "https://news.google.com/topics/CAAqKggKIiRDQkFTRlFvSUwyMHZNREpxYW5RU0JYcG9MVlJYR2dKVVZ5Z0FQAQ?hl=zh-TW&gl=TW&ceid=TW%3Azh-Hant",
+    "Business & Finance": "https://news.google.com/topics/CAAqKggKIiRDQkFTRlFvSUwyMHZNRGx6TVdZU0JYcG9MVlJYR2dKVVZ5Z0FQAQ?hl=zh-TW&gl=TW&ceid=TW%3Azh-Hant",
+    "Health & Wellness": "https://news.google.com/topics/CAAqJQgKIh9DQkFTRVFvSUwyMHZNR3QwTlRFU0JYcG9MVlJYS0FBUAE?hl=zh-TW&gl=TW&ceid=TW%3Azh-Hant"
+}
+
+# 爬取預算：整次執行共用的牆鐘時間與頁面數上限，取代固定的故事/文章數量
+CRAWL_TIME_BUDGET_SECONDS = int(os.getenv("CRAWL_TIME_BUDGET_SECONDS", 3 * 60 * 60))
+CRAWL_PAGE_BUDGET = int(os.getenv("CRAWL_PAGE_BUDGET", 800))
+STORY_PHASE_SHARE = 0.3  # 每個分類的預算中，步驟 2（故事頁）最多可使用的比例
+STORY_PAGE_WORKERS = int(os.getenv("STORY_PAGE_WORKERS", 3))  # 步驟 2 同時處理的故事頁數
+
+# 分類權重，影響預算分配與排序分數
+CATEGORY_WEIGHTS = {
+    "Politics": 1.0,
+    "Taiwan News": 1.0,
+    "International News": 1.0,
+    "Science & Technology": 1.0,
+    "Lifestyle & Consumer": 1.0,
+    "Sports": 1.0,
+    "Entertainment": 1.0,
+    "Business & Finance": 1.0,
+    "Health & Wellness": 1.0
+}
+RECENCY_HALF_LIFE_HOURS = 12  # 新鮮度分數每過幾小時減半
+
+# 單篇文章的硬期限（導航、等待、重試與抽取合計）
+ARTICLE_DEADLINE_SECONDS = 30
+# 網域抓取統計（逾時次數等），跨執行保存，用於降低慢網域的排序
+DOMAIN_STATS_PATH = os.getenv("DOMAIN_STATS_PATH", "domain_stats.json")
+SLOW_DOMAIN_PENALTY = 0.8
+# 各網域哪個選擇器抽出有效內文的統計，跨執行保存，成功過的選擇器下次優先嘗試
+SELECTOR_STATS_PATH = os.getenv("SELECTOR_STATS_PATH", "selector_stats.json")
+SELECTOR_RANKINGS_PATH = os.getenv("SELECTOR_RANKINGS_PATH", "outputs/metrics/selector_rankings.json")
+MIN_VALID_CONTENT_CHARS = 200  # 抽出的純文字少於此長度視為選擇器沒選中內文
+# 選擇器都沒命中時以文字密度挑選內文區塊，取代整個 body
+DENSITY_NOISE_TAGS = ["script", "style", "noscript", "nav", "header", "footer", "aside", "form"]
+DENSITY_MIN_PARAGRAPH_CHARS = 25
+DENSITY_TOP_CANDIDATES = 5  # 只對原始分數最高的幾個區塊計算連結密度
+# 存檔前移除的非內文節點與屬性
+SANITIZE_REMOVE_TAGS = {
+    "script", "style", "noscript", "template", "svg", "iframe", "object", "embed",
+    "form", "button", "input", "select", "link", "meta", "ins"
+}
+SANITIZE_KEEP_ATTRS = {"href", "src", "alt", "title", "datetime", "colspan", "rowspan"}
+SANITIZE_AD_PATTERN = re.compile(r"(^|[-_\s])(ad|ads|advert|advertisement|banner|sponsor|promo|dfp|gpt)([-_\s]|$)", re.I)
+
+# Google News 文章連結 -> 出版商最終網址 的快取
+REDIRECT_CACHE_PATH = os.getenv("REDIRECT_CACHE_PATH", "redirect_cache.json")
+
+# 故事頁文章列表指紋（story_url -> 上次完整處理時的指紋），未變的故事整個跳過
+STORY_FINGERPRINT_PATH = os.getenv("STORY_FINGERPRINT_PATH", "story_fingerprints.json")
+STORY_PROBE_TIMEOUT = 10  # 秒
+
+# Google News 故事頁的文章元素
+STORY_ARTICLE_CLASS = "MQsxIb xTewfe tXImLc R7GTQ keNKEd keNKEd VkAdve GU7x0c JMJvke q4atFc"
+STORY_ARTICLE_LINK_CLASS = "DY5T1d RZIKme"
+STORY_ARTICLE_TIME_CLASS = "WW6dff uQIVzc Sksgp slhocf"
+
+_metrics_lock = threading.Lock()
+
+def emit_metric(event, **fields):
+    """寫出一筆爬蟲指標事件"""
+    record = {"event": event, "ts": datetime.now().isoformat(timespec="seconds"), **fields}
+    try:
+        with _metrics_lock:
+            os.makedirs(os.path.dirname(CRAWLER_METRICS_PATH) or ".", exist_ok=True)
+            with open(CRAWLER_METRICS_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"写入指标失败: {e}")
+
+def is_google_url(url):
+    """判斷網址是否會打到 Google（News 轉址或驗證頁）"""
+    host = urlparse(url).netloc
+    return host == "google.com" or host.endswith(".google.com")
+
+def is_google_throttle_url(url):
+    return bool(url) and url.startswith("https://www.google.com/sorry/")
+
+class GoogleCircuitBreaker:
+    """所有 worker 共用的 Google 節流斷路器
+
+    連續遇到 GOOGLE_BREAKER_THRESHOLD 次驗證頁或「流量有異常」就跳脫，
+    冷卻期間所有前往 Google 的導航都會暫停；冷卻時間每次跳脫加倍。
+    冷卻結束後的第一個請求若再被擋，立即重新跳脫；成功則完全復原。
+    """
+
+    def __init__(self, threshold=GOOGLE_BREAKER_THRESHOLD,
+                 base_cooldown=GOOGLE_BREAKER_BASE_COOLDOWN, max_cooldown=GOOGLE_BREAKER_MAX_COOLDOWN):
+        self.threshold = threshold
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+        self.failures = 0  # 自上次成功後的連續節流次數
+        self.consecutive_trips = 0
+        self.total_trips = 0
+        self.open_until = 0.0
+
+    def remaining(self):
+        """距離冷卻結束的秒數，0 表示可以前往 Google"""
+        with self._lock:
+            return max(0.0, self.open_until - time.time())
+
+    def is_open(self):
+        return self.remaining() > 0
+
+    def record_throttle(self, url, reason):
+        """記錄一次 Google 節流回應，達到門檻時跳脫"""
+        with self._lock:
+            self.failures += 1
+            half_open = self.consecutive_trips > 0
+            emit_metric("google_throttle", url=url, reason=reason, failures=self.failures)
+            if self.failures < self.threshold and not half_open:
+                return
+            if time.time() < self.open_until:
+                # 冷卻中的其他 worker 回報的節流，不重複跳脫
+                return
+
+            self.consecutive_trips += 1
+            self.total_trips += 1
+            self.failures = 0
+            cooldown = min(self.base_cooldown * (2 ** (self.consecutive_trips - 1)), self.max_cooldown)
+            self.open_until = time.time() + cooldown
+            print(f"   Google 节流断路器跳脱 (第 {self.consecutive_trips} 次)，冷却 {cooldown} 秒")
+            emit_metric("google_breaker_trip", reason=reason, url=url,
+                        consecutive_trips=self.consecutive_trips, total_trips=self.total_trips,
+                        cooldown_seconds=cooldown)
+
+    def record_success(self):
+        """前往 Google 的請求成功，重置計數"""
+        with self._lock:
+            self.failures = 0
+            if self.consecutive_trips and time.time() >= self.open_until:
+                emit_metric("google_breaker_reset", consecutive_trips=self.consecutive_trips)
+                self.consecutive_trips = 0
+
+    def wait_until_closed(self):
+        """冷卻中就暫停到冷卻結束"""
+        remaining = self.remaining()
+        if remaining > 0:
+            print(f"   Google 节流冷却中，暂停 {remaining:.0f} 秒")
+            time.sleep(remaining)
+
+google_breaker = GoogleCircuitBreaker()
+
+class GoogleRateLimiter:
+    """所有 worker 共用的 Google News 請求節奏，依序發放間隔 min_interval 的時段"""
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+google_rate_limiter = GoogleRateLimiter(GOOGLE_MIN_REQUEST_INTERVAL)
+
+class DomainCooldown:
+    """遇到封鎖頁或付費牆的出版商網域，在冷卻期間內不再送出請求"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self._until = {}
+        self._lock = threading.Lock()
+
+    def block(self, domain, reason):
+        with self._lock:
+            self._until[domain] = time.time() + self.seconds
+        emit_metric("domain_blocked", domain=domain, reason=reason, cooldown_seconds=self.seconds)
+
+    def is_cooling(self, domain):
+        with self._lock:
+            return bool(domain) and self._until.get(domain, 0) > time.time()
+
+domain_cooldown = DomainCooldown(DOMAIN_BLOCK_COOLDOWN)
+
+def load_json_state(path, default=None):
+    """讀取跨執行保存的 JSON 狀態檔，不存在或損毀時回傳 default"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {} if default is None else default
+    except Exception as e:
+        print(f"读取状态档 {path} 失败: {e}")
+        return {} if default is None else default
+
+def save_json_state(path, data):
+    """寫入 JSON 狀態檔（先寫暫存檔再替換）"""
+    try:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"保存状态档 {path} 失败: {e}")
+
+redirect_cache = load_json_state(REDIRECT_CACHE_PATH)
+story_fingerprints = load_json_state(STORY_FINGERPRINT_PATH)
+domain_stats = load_json_state(DOMAIN_STATS_PATH, {"domains": {}, "media_domains": {}})
+_domain_stats_lock = threading.Lock()
+selector_stats = load_json_state(SELECTOR_STATS_PATH)
+_selector_stats_lock = threading.Lock()
+
+class ArticleDeadlineExceeded(Exception):
+    """單篇文章超過硬期限"""
+
+class ArticleDeadline:
+    """單篇文章的硬期限，提供夾在剩餘時間內的逾時值與等待"""
+
+    def __init__(self, seconds):
+        self.expires_at = time.time() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.time())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self):
+        if self.expired():
+            raise ArticleDeadlineExceeded()
+
+    def timeout_ms(self, cap_ms):
+        """Playwright 用的逾時（毫秒），不超過剩餘時間"""
+        return max(1, int(min(cap_ms, self.remaining() * 1000)))
+
+    def sleep(self, seconds):
+        time.sleep(min(seconds, self.remaining()))
+
+class CrawlBudget:
+    """爬取預算：牆鐘時間與頁面數的上限
+
+    split() 切出的子預算同時受自己與上層預算限制，花費的頁面也會計入上層。
+    """
+
+    def __init__(self, seconds, pages, parent=None):
+        self.deadline = time.time() + seconds
+        self.pages = pages
+        self.pages_used = 0
+        self.parent = parent
+        self._lock = threading.Lock()
+
+    def remaining_seconds(self):
+        remaining = self.deadline - time.time()
+        if self.parent:
+            remaining = min(remaining, self.parent.remaining_seconds())
+        return max(0.0, remaining)
+
+    def remaining_pages(self):
+        with self._lock:
+            remaining = self.pages - self.pages_used
+        if self.parent:
+            remaining = min(remaining, self.parent.remaining_pages())
+        return max(0, remaining)
+
+    def exhausted(self):
+        return self.remaining_seconds() <= 0 or self.remaining_pages() <= 0
+
+    def spend_page(self, count=1):
+        with self._lock:
+            self.pages_used += count
+        if self.parent:
+            self.parent.spend_page(count)
+
+    def split(self, fraction):
+        """切出目前剩餘預算的一部分"""
+        return CrawlBudget(
+            self.remaining_seconds() * fraction,
+            max(1, int(self.remaining_pages() * fraction)),
+            parent=self
+        )
+
+class CrawlFrontier:
+    """以分數排序的爬取佇列，分數越高越先處理，同分時維持加入順序"""
+
+    def __init__(self):
+        self._heap = []
+        self._counter = 0
+
+    def push(self, item, score):
+        heapq.heappush(self._heap, (-score, self._counter, item))
+        self._counter += 1
+
+    def pop(self):
+        return heapq.heappop(self._heap)[2]
+
+    def drain(self):
+        """依優先順序取出全部項目"""
+        items = []
+        while self._heap:
+            items.append(self.pop())
+        return items
+
+    def __len__(self):
+        return len(self._heap)
+
+def normalize_story_url(url):
+    """去掉 query 與結尾斜線，讓不同分類頁帶出的同一個故事得到相同的鍵"""
+    parsed = urlparse(url)
+    return f"{parsed.netloc}{parsed.path.rstrip('/')}"
+
+class StoryRegistry:
+    """整次執行共用的故事登記表
+
+    同一個故事叢集常同時出現在多個分類（例如 Politics 與 Taiwan News）。
+    第一個認領的分類負責爬取，其餘分類只記錄到 categories 對應表。
+    """
+
+    def __init__(self):
+        self.owners = {}
+        self.categories = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def claim(self, story_info):
+        """回傳此分類是否應爬取該故事；已被認領時只記錄分類對應"""
+        key = normalize_story_url(story_info["url"])
+        category = story_info["category"]
+        with self._lock:
+            if category not in self.categories[key]:
+                self.categories[key].append(category)
+            if key in self.owners:
+                return False
+            self.owners[key] = category
+            return True
+
+    def owner(self, story_info):
+        return self.owners.get(normalize_story_url(story_info["url"]))
+
+    def shared_stories(self):
+        """出現在多個分類的故事：{故事鍵: [分類...]}，第一個為負責爬取的分類"""
+        return {key: cats for key, cats in self.categories.items() if len(cats) > 1}
+
+def _recency_score(published):
+    """發布時間越近分數越高（0~1，依 RECENCY_HALF_LIFE_HOURS 指數衰減）"""
+    age_hours = max(0.0, (datetime.now() - published).total_seconds() / 3600)
+    return 0.5 ** (age_hours / RECENCY_HALF_LIFE_HOURS)
+
+def score_story(story_info):
+    """故事頁的優先分數：新鮮度 × 分類權重
+
+    RSS 來源有發布時間；瀏覽器來源沒有，改以在主題頁上的排序位置估計。
+    """
+    weight = CATEGORY_WEIGHTS.get(story_info["category"], 1.0)
+    published = story_info.get("published")
+    if published:
+        recency = _recency_score(published)
+    else:
+        recency = 1.0 / (1 + 0.1 * (story_info["index"] - 1))
+    return weight * recency
+
+def score_article(article_info, unseen_in_story):
+    """文章的優先分數：(文章新鮮度 + 故事未爬文章數) × 分類權重
+
+    新文章越多的故事越值得花瀏覽器時間，log 讓單一大故事不會壓過所有其他故事；
+    常逾時的出版商再乘上 domain_priority_factor 折扣。
+    """
+    weight = CATEGORY_WEIGHTS.get(article_info["story_category"], 1.0)
+    try:
+        recency = _recency_score(parser.parse(article_info["article_datetime"]))
+    except (ValueError, TypeError, OverflowError):
+        recency = 0.5
+    return weight * (recency + math.log1p(unseen_in_story)) * domain_priority_factor(article_info)
+
+class HarRecorder:
+    """錄製模式：決定每個 context 的 HAR 路徑，並記錄 requests 發出的 HTTP 流量"""
+
+    def __init__(self, run_dir):
+        self.run_dir = run_dir
+        self._lock = threading.Lock()
+        self._context_count = 0
+        self._http_entries = []
+
+    def next_context_path(self):
+        with self._lock:
+            self._context_count += 1
+            os.makedirs(self.run_dir, exist_ok=True)
+            return os.path.join(self.run_dir, f"context_{self._context_count:04d}.har")
+
+    def record_http(self, response, elapsed_ms):
+        """把一次 requests 回應寫進 http.har（每次整份重寫，筆數不多）"""
+        entry = {
+            "startedDateTime": datetime.now(TAIPEI_TZ).isoformat(),
+            "time": elapsed_ms,
+            "request": {
+                "method": response.request.method,
+                "url": response.request.url,
+                "httpVersion": "HTTP/1.1",
+                "headers": [{"name": k, "value": v} for k, v in response.request.headers.items()],
+                "queryString": [],
+                "cookies": [],
+                "headersSize": -1,
+                "bodySize": 0
+            },
+            "response": {
+                "status": response.status_code,
+                "statusText": response.reason or "",
+                "httpVersion": "HTTP/1.1",
+                "headers": [{"name": k, "value": v} for k, v in response.headers.items()],
+                "cookies": [],
+                "content": {
+                    "size": len(response.content),
+                    "mimeType": response.headers.get("Content-Type", ""),
+                    "text": base64.b64encode(response.content).decode("ascii"),
+                    "encoding": "base64"
+                },
+                "redirectURL": "",
+                "headersSize": -1,
+                "bodySize": len(response.content)
+            },
+            "cache": {},
+            "timings": {"send": 0, "wait": elapsed_ms, "receive": 0},
+            # requests 會自動跟隨轉址，記下最終網址供重播時還原 response.url
+            "_final_url": response.url
+        }
+        with self._lock:
+            self._http_entries.append(entry)
+            os.makedirs(self.run_dir, exist_ok=True)
+            har = {"log": {"version": "1.2", "creator": {"name": "crawler_integrity", "version": "1.0"},
+                           "entries": self._http_entries}}
+            with open(os.path.join(self.run_dir, "http.har"), "w", encoding="utf-8") as f:
+                json.dump(har, f, ensure_ascii=False)
+        return entry
+
+class HarReplayIndex:
+    """重播模式：載入一批 HAR，依 (method, url) 回應
+
+    同一網址被請求多次時依錄製順序輪流回應，確保每次重播結果一致。
+    """
+
+    def __init__(self, run_dir):
+        self.run_dir = run_dir
+        self._entries = defaultdict(list)
+        self._served = defaultdict(int)
+        self._lock = threading.Lock()
+        for filename in sorted(os.listdir(run_dir)):
+            if not filename.endswith(".har"):
+                continue
+            with open(os.path.join(run_dir, filename), "r", encoding="utf-8") as f:
+                har = json.load(f)
+            for entry in har.get("log", {}).get("entries", []):
+                request = entry.get("request", {})
+                self._entries[(request.get("method", "GET"), request.get("url"))].append(entry)
+        print(f"HAR 重播: 从 {run_dir} 载入 {sum(len(v) for v in self._entries.values())} 笔回应")
+
+    def lookup(self, method, url):
+        with self._lock:
+            entries = self._entries.get((method, url))
+            if not entries:
+                return None
+            entry = entries[self._served[(method, url)] % len(entries)]
+            self._served[(method, url)] += 1
+            return entry
+
+def _har_entry_body(entry):
+    content = entry.get("response", {}).get("content", {})
+    text = content.get("text") or ""
+    if content.get("encoding") == "base64":
+        return base64.b64decode(text)
+    return text.encode("utf-8")
+
+class HarHttpResponse:
+    """以 HAR 記錄組出的 HTTP 回應，介面與 http_get 用到的 requests.Response 子集相同"""
+
+    def __init__(self, url, entry):
+        response = entry.get("response", {})
+        self.url = entry.get("_final_url", url)
+        self.status_code = response.get("status", 0)
+        self.headers = {h["name"]: h["value"] for h in response.get("headers", [])}
+        self.content = _har_entry_body(entry)
+        self.raw = io.BytesIO(self.content)
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}")
+
+def _latest_har_run(har_dir):
+    runs = sorted(d for d in os.listdir(har_dir) if os.path.isdir(os.path.join(har_dir, d)))
+    if not runs:
+        raise FileNotFoundError(f"{har_dir} 中没有任何 HAR 录制批次")
+    return os.path.join(har_dir, runs[-1])
+
+har_recorder = None
+har_replay = None
+if CRAWLER_HAR_MODE == "record":
+    har_recorder = HarRecorder(os.path.join(CRAWLER_HAR_DIR, datetime.now().strftime("%Y%m%d_%H%M%S")))
+    print(f"HAR 录制模式: {har_recorder.run_dir}")
+elif CRAWLER_HAR_MODE == "replay":
+    har_replay = HarReplayIndex(
+        os.path.join(CRAWLER_HAR_DIR, CRAWLER_HAR_RUN) if CRAWLER_HAR_RUN else _latest_har_run(CRAWLER_HAR_DIR)
+    )
+
+def http_get(url, headers=None, timeout=10, stream=False):
+    """不經瀏覽器的 HTTP GET，錄製/重播模式下一併寫入或讀取 HAR
+
+    stream=True 時可用 response.raw 串流讀取（已處理 gzip 解碼）。
+    """
+    if har_replay:
+        entry = har_replay.lookup("GET", url)
+        if entry is None:
+            raise requests.ConnectionError(f"HAR 中没有 {url} 的记录")
+        return HarHttpResponse(url, entry)
+
+    started = time.time()
+    response = requests.get(url, headers=headers, timeout=timeout, stream=stream and not har_recorder)
+    if har_recorder:
+        entry = har_recorder.record_http(response, int((time.time() - started) * 1000))
+        return HarHttpResponse(url, entry)
+    if stream:
+        response.raw.decode_content = True
+    return response
+
+def _har_replay_route(route):
+    """重播模式的 context route：從 HAR 回應，找不到記錄的請求直接中止"""
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES:
+        route.abort()
+        return
+    entry = har_replay.lookup(request.method, request.url)
+    if entry is None:
+        route.abort()
+        return
+    response = entry.get("response", {})
+    # 內容已解碼，不能沿用原本的壓縮與長度標頭
+    headers = {
+        h["name"]: h["value"] for h in response.get("headers", [])
+        if h["name"].lower() not in ("content-encoding", "content-length", "transfer-encoding")
+    }
+    route.fulfill(status=response.get("status", 200), headers=headers, body=_har_entry_body(entry))
+
+def close_browser(browser):
+    """先關閉所有 context 再關閉 browser，錄製模式下 HAR 才會完整寫出"""
+    try:
+        for context in browser.contexts:
+            context.close()
+    except Exception:
+        pass
+    browser.close()
+
 def clean_data(data):
     for i, article in enumerate(data):
             print(f"正在處理第 {i+1} 篇文章...")
@@ -47,10 +677,13 @@ def clean_data(data):
                 for j, sub_article in enumerate(article["articles"]):
                     print(f"   正在處理第 {j+1} 篇子文章...")
 
-                    # (1) 去除 HTML
-                    raw_content = sub_article.get("content", "")
-                    soup = BeautifulSoup(raw_content, "html.parser")
-                    cleaned_text = soup.get_text(separator="\n", strip=True)
+                    # JSON-LD articleBody 已是乾淨內文，不需再清洗
+                    if sub_article.get("extraction") == "json-ld":
+                        print("   內文來自 JSON-LD，跳過 Gemini 清洗")
+                        continue
+
+                    # (1) 內容在抓取時已抽取為純文字
+                    cleaned_text = sub_article.get("content", "")
                     print(cleaned_text)
 
                     # (2) 使用 Gemini API 去除雜訊
@@ -92,8 +725,11 @@ def clean_data(data):
 
     return data
 
-def create_robust_browser(playwright, headless: bool = True):
-    """創建一個更穩健的 Playwright Browser"""
+def create_robust_browser(playwright, headless: bool = True, storage_state=None):
+    """創建一個更穩健的 Playwright Browser
+
+    storage_state 為 Playwright storage_state 快照路徑，提供時 context 一建立就帶有登入狀態。
+    """
     try:
         # 設定瀏覽器選項
         browser_args = [
@@ -102,7 +738,7 @@ def create_robust_browser(playwright, headless: bool = True):
             "--disable-dev-shm-usage",
             "--disable-web-security",
             "--disable-features=VizDisplayCompositor",
-            "--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36",
+            f"--user-agent={CRAWLER_USER_AGENT}",
             "--disable-blink-features=AutomationControlled",
             "--disable-background-timer-throttling",
             "--disable-backgrounding-occluded-windows",
@@ -131,12 +767,16 @@ def create_robust_browser(playwright, headless: bool = True):
         )
         
         # 創建上下文
-        context = browser.new_context(
-            viewport={"width": 1920, "height": 1080} if not headless else {"width": 1280, "height": 720},
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36",
-            locale="zh-TW",
-            timezone_id="Asia/Taipei"
-        )
+        context_options = {
+            "viewport": {"width": 1920, "height": 1080} if not headless else {"width": 1280, "height": 720},
+            "user_agent": CRAWLER_USER_AGENT,
+            "locale": "zh-TW",
+            "timezone_id": "Asia/Taipei",
+            "storage_state": storage_state
+        }
+        if har_recorder:
+            context_options["record_har_path"] = har_recorder.next_context_path()
+        context = browser.new_context(**context_options)
         
         # 添加初始化腳本，防止被偵測為自動化
         context.add_init_script("""
@@ -153,11 +793,15 @@ def create_robust_browser(playwright, headless: bool = True):
             });
         """)
         
-        # 阻擋某些資源類型以提升效能
-        context.route("**/*", lambda route: (
-            route.abort() if route.request.resource_type in ["image", "stylesheet", "font", "media"] 
-            else route.continue_()
-        ))
+        if har_replay:
+            # 重播模式：所有請求都由 HAR 回應
+            context.route("**/*", _har_replay_route)
+        else:
+            # 阻擋某些資源類型以提升效能
+            context.route("**/*", lambda route: (
+                route.abort() if route.request.resource_type in BLOCKED_RESOURCE_TYPES
+                else route.continue_()
+            ))
         
         return browser, context
         
@@ -165,8 +809,141 @@ def create_robust_browser(playwright, headless: bool = True):
         print(f"創建 Playwright Browser 失敗: {e}")
         raise
 
+def _build_story_record(index, title, full_link, category, published=None):
+    """查詢資料庫並組出 story_links 中的一筆故事紀錄
+
+    published 為故事的發布時間（台北時間），只有 RSS 來源提供，用於排序。
+    """
+    should_skip, action_type, story_data, skip_reason = check_story_exists_in_supabase(
+        full_link, category, "", ""
+    )
+
+    print(f"   處理故事 {index}: {full_link}")
+    print(f"   檢查結果: {skip_reason}")
+
+    # 根據action_type決定story_id
+    if action_type == "add_to_existing_story" and story_data:
+        story_id = story_data["story_id"]
+    else:
+        story_id = str(uuid.uuid4())
+
+    print(f"{index}. [{category}] {title}")
+    print(f"   故事ID: {story_id}")
+    print(f"   {full_link}")
+    print(f"   處理類型: {action_type}")
+
+    return {
+        "index": index,
+        "story_id": story_id,
+        "title": title,
+        "url": full_link,
+        "category": category,
+        "action_type": action_type,
+        "existing_story_data": story_data,
+        "published": published
+    }
+
+def _topic_feed_url(main_url):
+    """把 Google News 主題頁網址轉成對應的 RSS 網址，非主題頁回傳 None"""
+    parsed = urlparse(main_url)
+    if not parsed.path.startswith("/topics/"):
+        return None
+    return f"{parsed.scheme}://{parsed.netloc}/rss{parsed.path}?{parsed.query}"
+
+def _story_url_from_feed_description(description, main_url):
+    """從 RSS item 的 description 中找出「完整報導」的故事連結
+
+    RSS 裡的連結帶有 oc 等額外參數，這裡統一改成與主題頁相同的 query，
+    讓同一個故事不論由哪個後端發現，在 stories.story_url 中都是同一個網址。
+    """
+    if not description:
+        return None
+    desc_soup = BeautifulSoup(description, "html.parser")
+    for link in desc_soup.find_all("a", href=True):
+        path = urlparse(link["href"]).path
+        if path.startswith("/stories/"):
+            query = urlparse(main_url).query
+            return f"https://news.google.com{path}" + (f"?{query}" if query else "")
+    return None
+
+def get_main_story_links_from_feed(main_url, category):
+    """步驟 1 (輕量版): 以 HTTP 取得主題 RSS，串流解析出故事連結
+
+    回傳格式與 get_main_story_links 相同；取不到任何故事時回傳空列表，
+    由呼叫端決定是否回退到瀏覽器。
+    """
+    story_links = []
+    feed_url = _topic_feed_url(main_url)
+    if not feed_url:
+        return story_links
+
+    print(f"正在以 RSS 抓取 {category} 領域的主要故事連結...")
+
+    try:
+        response = http_get(
+            feed_url,
+            headers={"User-Agent": CRAWLER_USER_AGENT},
+            timeout=FEED_REQUEST_TIMEOUT,
+            stream=True
+        )
+        response.raise_for_status()
+
+        seen_urls = set()
+        item_count = 0
+        for event, elem in ET.iterparse(response.raw, events=("end",)):
+            if elem.tag != "item":
+                continue
+            item_count += 1
+            try:
+                title = (elem.findtext("title") or "").strip()
+                source = (elem.findtext("source") or "").strip()
+                if source and title.endswith(f" - {source}"):
+                    title = title[:-len(f" - {source}")].strip()
+
+                full_link = _story_url_from_feed_description(elem.findtext("description"), main_url)
+                if not full_link or full_link in seen_urls:
+                    continue
+                seen_urls.add(full_link)
+
+                published = None
+                pub_date = elem.findtext("pubDate")
+                if pub_date:
+                    try:
+                        # 與文章時間一致，轉成不帶時區的台北時間
+                        published = parsedate_to_datetime(pub_date).astimezone(TAIPEI_TZ).replace(tzinfo=None)
+                    except (TypeError, ValueError):
+                        pass
+
+                story_links.append(_build_story_record(len(story_links) + 1, title, full_link, category, published))
+            except Exception as e:
+                print(f"處理 RSS 項目 {item_count} 時出錯: {e}")
+            finally:
+                # 釋放已處理的節點，避免整份 feed 留在記憶體中
+                elem.clear()
+
+        print(f"RSS 共 {item_count} 個項目，其中 {len(story_links)} 個帶有故事連結")
+
+    except (requests.RequestException, ET.ParseError) as e:
+        print(f"抓取 RSS 失敗: {e}")
+
+    return story_links
+
 def get_main_story_links(main_url, category):
-    """步驟 1: 從主頁抓取所有主要故事連結"""
+    """步驟 1: 從主頁抓取所有主要故事連結
+
+    預設先走 RSS 輕量後端，取不到故事時才回退到瀏覽器渲染主題頁。
+    """
+    if STORY_DISCOVERY_MODE == "feed":
+        story_links = get_main_story_links_from_feed(main_url, category)
+        if story_links:
+            print(f"\n總共收集到 {len(story_links)} 個 {category} 領域需要處理的主要故事連結")
+            return story_links
+        print("RSS 沒有取得故事連結，改用瀏覽器抓取")
+
+    return get_main_story_links_from_browser(main_url, category)
+
+def get_main_story_links_from_browser(main_url, category):
+    """步驟 1 (瀏覽器版): 渲染主題頁並抓取所有主要故事連結"""
     story_links = []
     
     with sync_playwright() as p:
@@ -205,34 +982,7 @@ def get_main_story_links(main_url, category):
                             else:
                                 full_link = "https://news.google.com" + href
                             
-                            # 檢查資料庫
-                            should_skip, action_type, story_data, skip_reason = check_story_exists_in_supabase(
-                                full_link, category, "", ""
-                            )
-                            
-                            print(f"   處理故事 {i}: {href}")
-                            print(f"   檢查結果: {skip_reason}")
-                            
-                            # 根據action_type決定story_id
-                            if action_type == "add_to_existing_story" and story_data:
-                                story_id = story_data["story_id"]
-                            else:
-                                story_id = str(uuid.uuid4())
-                            
-                            story_links.append({
-                                "index": i,
-                                "story_id": story_id,
-                                "title": title,
-                                "url": full_link,
-                                "category": category,
-                                "action_type": action_type,
-                                "existing_story_data": story_data
-                            })
-                            
-                            print(f"{i}. [{category}] {title}")
-                            print(f"   故事ID: {story_id}")
-                            print(f"   {full_link}")
-                            print(f"   處理類型: {action_type}")
+                            story_links.append(_build_story_record(i, title, full_link, category))
                             
                 except Exception as e:
                     print(f"處理故事區塊 {i} 時出錯: {e}")
@@ -246,189 +996,586 @@ def get_main_story_links(main_url, category):
             print(f"抓取主要故事連結時出錯: {e}")
         finally:
             try:
-                browser.close()
+                close_browser(browser)
             except:
                 pass
     
     return story_links
 
-def get_article_links_from_story(story_info):
-    """步驟 2: 進入每個故事頁面，找出所有 article 下的文章連結和相關信息"""
-    article_links = []
-    
-    with sync_playwright() as p:
+def story_listing_fingerprint(soup):
+    """以故事頁所有文章的連結與時間計算指紋，列表沒有文章時回傳 None"""
+    entries = []
+    for article in soup.find_all("article", class_=STORY_ARTICLE_CLASS):
+        link = article.find("a", class_=STORY_ARTICLE_LINK_CLASS)
+        time_element = article.find(class_=STORY_ARTICLE_TIME_CLASS)
+        href = link.get("href", "") if link else ""
+        timestamp = time_element.get("datetime", "") if time_element else ""
+        entries.append(f"{href}|{timestamp}")
+    if not entries:
+        return None
+    return hashlib.sha1("\n".join(sorted(entries)).encode("utf-8")).hexdigest()
+
+def probe_story_fingerprint(story_url):
+    """不開瀏覽器，直接以 HTTP 取得故事頁並計算列表指紋；無法判斷時回傳 None
+
+    探測同樣是對 Google News 的請求，與開啟故事頁一樣先等斷路器關閉、再經 google_rate_limiter 排隊。
+    """
+    google_breaker.wait_until_closed()
+    google_rate_limiter.wait()
+    try:
+        response = http_get(
+            story_url,
+            headers={"User-Agent": CRAWLER_USER_AGENT, "Accept-Language": "zh-TW,zh;q=0.9"},
+            timeout=STORY_PROBE_TIMEOUT
+        )
+        if is_google_throttle_url(response.url):
+            google_breaker.record_throttle(story_url, "story_probe_sorry")
+            return None
+        if response.status_code != 200:
+            return None
+        return story_listing_fingerprint(BeautifulSoup(response.text, "html.parser"))
+    except requests.RequestException as e:
+        print(f"   故事列表探测失败: {e}")
+        return None
+
+def story_listing_unchanged(story_info):
+    """故事列表與上次完整處理時相同則回傳 True"""
+    stored = story_fingerprints.get(story_info['url'])
+    if not stored:
+        return False
+    probed = probe_story_fingerprint(story_info['url'])
+    return probed is not None and probed == stored.get("fingerprint")
+
+def get_article_links_from_story(story_info, page=None):
+    """步驟 2: 進入每個故事頁面，找出所有 article 下的文章連結和相關信息
+
+    文章列表指紋與上次相同的故事直接跳過，不開瀏覽器、也不逐篇查詢資料庫。
+    本次解析到的指紋放在 story_info['listing_fingerprint']，由呼叫端在故事處理完後保存。
+    page 為分頁池提供的分頁；未提供時自行開一個瀏覽器。
+    """
+    if story_listing_unchanged(story_info):
+        print(f"\n故事 {story_info['index']} 文章列表未变化，跳过: {story_info['title']}")
+        return []
+
+    if page is not None:
+        return _scrape_story_page(story_info, page)
+
+    with sync_playwright() as p:
+        browser = None
+        try:
+            browser, context = create_robust_browser(p, headless=True)
+            return _scrape_story_page(story_info, context.new_page())
+        except Exception as e:
+            print(f"處理故事時出錯: {e}")
+            return []
+        finally:
+            try:
+                close_browser(browser)
+            except:
+                pass
+
+def _scrape_story_page(story_info, page):
+    """在指定分頁載入故事頁並解析文章連結"""
+    article_links = []
+
+    try:
+        print(f"\n正在處理故事 {story_info['index']}: [{story_info['category']}] {story_info['title']}")
+        print(f"   故事ID: {story_info['story_id']}")
+        
+        # 取得現有故事的 crawl_date (如果有的話)
+        existing_story_data = story_info.get('existing_story_data')
+        cutoff_date = None
+        if existing_story_data and existing_story_data.get('crawl_date'):
+            try:
+                cutoff_date_str = existing_story_data['crawl_date']
+                if isinstance(cutoff_date_str, str):
+                    try:
+                        cutoff_date = parser.parse(cutoff_date_str)
+                    except:
+                        cutoff_date = datetime.strptime(cutoff_date_str, "%Y/%m/%d %H:%M")
+                print(f"   只處理 {cutoff_date_str} 之後的文章")
+            except Exception as e:
+                print(f"   解析 cutoff_date 時出錯: {e}")
+        
+        google_breaker.wait_until_closed()
+        google_rate_limiter.wait()
+        page.goto(story_info['url'])
+        time.sleep(random.randint(3, 6))
+
+        if is_google_throttle_url(page.url):
+            print(f"   故事页面遇到 Google 验证页面")
+            google_breaker.record_throttle(story_info['url'], "story_page_sorry")
+            return article_links
+        google_breaker.record_success()
+        
+        content = page.content()
+        soup = BeautifulSoup(content, "html.parser")
+        story_info['listing_fingerprint'] = story_listing_fingerprint(soup)
+        article_elements = soup.find_all("article", class_=STORY_ARTICLE_CLASS)
+        
+        print(f"   找到 {len(article_elements)} 個 article 元素")
+        
+        processed_count = 0
+        candidates = []  # (標題, 連結, 媒體, 時間)
+        
+        for j, article in enumerate(article_elements, start=1):
+            try:
+                h4_element = article.find("h4", class_="ipQwMb ekueJc RD0gLb")
+                
+                if h4_element:
+                    link = h4_element.find("a", class_=STORY_ARTICLE_LINK_CLASS)
+                    
+                    if link:
+                        href = link.get("href")
+                        link_text = link.text.strip()
+                        
+                        media_element = article.find("a", class_="wEwyrc")
+                        media = media_element.text.strip() if media_element else "未知來源"
+
+                        # 跳過特定媒體
+                        if media in ["MSN", "自由時報", "chinatimes.com", "中時電子報", 
+                                     "中時新聞網", "上報Up Media", "點新聞", "香港文匯網", 
+                                     "天下雜誌", "自由健康網", "知新聞", "SUPERMOTO8", 
+                                     "警政時報", "大紀元", "新唐人電視台", "arch-web.com.tw",
+                                     "韓聯社", "公視新聞網PNN", "優分析UAnalyze", "AASTOCKS.com",
+                                     "KSD 韓星網", "商周", "自由財經", "鉅亨號",
+                                     "wownews.tw", "utravel.com.hk", "更生新聞網", "香港電台",
+                                     "citytimes.tw"]:
+                            continue
+
+                        time_element = article.find(class_=STORY_ARTICLE_TIME_CLASS)
+                        article_datetime = "未知時間"
+                        
+                        if time_element and time_element.get("datetime"):
+                            dt_str = time_element.get("datetime")
+                            dt_obj = datetime.fromisoformat(dt_str.replace("Z", "+00:00"))
+                            article_datetime_obj = dt_obj + timedelta(hours=8)
+                            article_datetime = article_datetime_obj.strftime("%Y/%m/%d %H:%M:%S")
+                            
+                            # 檢查文章時間是否在 cutoff_date 之後
+                            if cutoff_date and article_datetime_obj <= cutoff_date:
+                                print(f"     跳過舊文章: {link_text}")
+                                print(f"        文章時間: {article_datetime} <= 截止時間: {cutoff_date}")
+                                continue
+                        
+                        if href:
+                            if href.startswith("./"):
+                                full_href = "https://news.google.com" + href[1:]
+                            else:
+                                full_href = "https://news.google.com" + href
+                            
+                            candidates.append((link_text, full_href, media, article_datetime))
+                            
+            except Exception as e:
+                print(f"     處理文章元素 {j} 時出錯: {e}")
+                continue
+
+        # 整個故事的文章一次送資料庫判斷是否需要處理
+        decisions = classify_story_links(
+            [(story_info['url'], full_href, article_datetime) for _, full_href, _, article_datetime in candidates],
+            story_info['category']
+        )
+        for (link_text, full_href, media, article_datetime), decision in zip(candidates, decisions):
+            should_skip, action_type, story_data, skip_reason = decision
+
+            if should_skip and action_type == "skip":
+                print(f"     跳過文章: {link_text}")
+                print(f"        原因: {skip_reason}")
+                continue
+            
+            article_links.append({
+                "story_id": story_info['story_id'],
+                "story_title": story_info['title'],
+                "story_category": story_info['category'],
+                "story_url": story_info['url'],
+                "article_index": processed_count + 1,
+                "article_title": link_text,
+                "article_url": full_href,
+                "media": media,
+                "article_datetime": article_datetime,
+                "action_type": action_type,
+                "existing_story_data": story_data
+            })
+            
+            processed_count += 1
+            print(f"     {processed_count}. {link_text}")
+            print(f"        媒體: {media}")
+            print(f"        時間: {article_datetime}")
+            print(f"        處理類型: {action_type}")
+            print(f"        {full_href}")
+        
+        if processed_count == 0 and cutoff_date:
+            print(f"   此故事沒有 {cutoff_date} 之後的新文章")
+        
+    except Exception as e:
+        print(f"處理故事時出錯: {e}")
+
+    return article_links
+
+# 預設的內文選擇器順序（沒有該網域的統計時依此順序嘗試）
+CONTENT_TARGET_IDS = [
+    'text ivu-mt', 'content-box', 'text', 'boxTitle',
+    'news-detail-content', 'story', 'article-content__editor', 'article-body',
+    'artical-content', 'article_text', 'newsText'
+]
+CONTENT_TARGET_CLASSES = [
+    'articleBody clearfix', 'text boxTitle', 'text ivu-mt', 'paragraph', 'atoms',
+    'news-box-text border', 'newsLeading', 'text'
+]
+DEFAULT_CONTENT_SELECTORS = (
+    ["tag:article", "tag:artical"]
+    + [f"id:{target_id}" for target_id in CONTENT_TARGET_IDS]
+    + [f"class:{target_class}" for target_class in CONTENT_TARGET_CLASSES]
+)
+
+def _select_content(soup, selector):
+    """依 "tag:"、"id:"、"class:" 形式的選擇器找出內文元素"""
+    kind, _, value = selector.partition(":")
+    if kind == "tag":
+        return soup.find(value)
+    if kind == "id":
+        return soup.find('div', id=value)
+    if kind == "class":
+        return soup.find('div', class_=value)
+    return None
+
+def ranked_content_selectors(domain):
+    """該網域成功過的選擇器依成功率排在前面，其餘依預設順序"""
+    stats = selector_stats.get(domain, {}) if domain else {}
+    learned = sorted(
+        (selector for selector, counts in stats.items() if counts["hits"] > counts["misses"]),
+        key=lambda selector: stats[selector]["misses"] - stats[selector]["hits"]
+    )
+    return learned + [selector for selector in DEFAULT_CONTENT_SELECTORS if selector not in learned]
+
+def densest_content_block(soup):
+    """文字密度抽取（readability 的段落計分法）
+
+    走訪一次所有段落：夠長的段落依長度與逗號數計分，分數加給父元素、一半加給祖父元素；
+    最後以 (1 - 連結密度) 折扣，挑出分數最高的區塊。沒有候選時回傳 None。
+    """
+    scores = {}
+    elements = {}
+    for paragraph in soup.find_all("p"):
+        if paragraph.find_parent(DENSITY_NOISE_TAGS):
+            continue
+        text = paragraph.get_text(strip=True)
+        if len(text) < DENSITY_MIN_PARAGRAPH_CHARS:
+            continue
+        score = 1 + text.count("，") + text.count(",") + min(len(text) / 100, 3)
+        parent = paragraph.parent
+        grandparent = parent.parent if parent else None
+        for element, share in ((parent, 1.0), (grandparent, 0.5)):
+            if element is None or element.name in (None, "[document]", "html"):
+                continue
+            key = id(element)
+            elements[key] = element
+            scores[key] = scores.get(key, 0.0) + score * share
+
+    best, best_score = None, 0.0
+    for key in sorted(scores, key=scores.get, reverse=True)[:DENSITY_TOP_CANDIDATES]:
+        element = elements[key]
+        text_length = len(element.get_text(strip=True))
+        if not text_length:
+            continue
+        link_length = sum(len(a.get_text(strip=True)) for a in element.find_all("a"))
+        adjusted = scores[key] * (1 - link_length / text_length)
+        if adjusted > best_score:
+            best, best_score = element, adjusted
+    return best
+
+def find_content_element(soup, domain, media, skipped=None):
+    """回傳 (選擇器, 元素)
+
+    命中但文字不足 MIN_VALID_CONTENT_CHARS 的選擇器會繼續往下試，並記入 skipped；
+    都不夠長時以文字密度挑選區塊，再退回第一個命中的短元素，最後才是 body。
+    """
+    short_match = None
+    for selector in ranked_content_selectors(domain):
+        # Now 新聞的 <article> 不是內文
+        if selector == "tag:article" and media == 'Now 新聞':
+            continue
+        try:
+            element = _select_content(soup, selector)
+        except Exception:
+            continue
+        if not element:
+            continue
+        if len(element.get_text(strip=True)) >= MIN_VALID_CONTENT_CHARS:
+            return selector, element
+        if skipped is not None:
+            skipped.append(selector)
+        short_match = short_match or (selector, element)
+    block = densest_content_block(soup)
+    if block is not None:
+        return "density", block
+    if short_match:
+        return short_match
+    return "tag:body", soup.body
+
+def record_selector_outcome(domain, selector, valid):
+    """記錄選擇器在該網域是否抽出有效內文（文字密度與退回 body 的情況不列入）"""
+    if not domain or selector in ("density", "tag:body"):
+        return
+    with _selector_stats_lock:
+        counts = selector_stats.setdefault(domain, {}).setdefault(selector, {"hits": 0, "misses": 0})
+        counts["hits" if valid else "misses"] += 1
+
+def export_selector_rankings():
+    """輸出各網域選擇器排名供人工檢視"""
+    rankings = {}
+    for domain in sorted(selector_stats):
+        rankings[domain] = [
+            {"selector": selector, **selector_stats[domain][selector]}
+            for selector in ranked_content_selectors(domain)
+            if selector in selector_stats[domain]
+        ]
+    os.makedirs(os.path.dirname(SELECTOR_RANKINGS_PATH) or ".", exist_ok=True)
+    save_json_state(SELECTOR_RANKINGS_PATH, rankings)
+    return rankings
+
+STRUCTURED_ARTICLE_TYPES = {"NewsArticle", "Article", "ReportageNewsArticle", "AnalysisNewsArticle", "BlogPosting"}
+
+def _iter_json_ld_objects(data):
+    """展開 JSON-LD 的列表與 @graph，逐一產生物件"""
+    if isinstance(data, list):
+        for item in data:
+            yield from _iter_json_ld_objects(item)
+    elif isinstance(data, dict):
+        yield data
+        if "@graph" in data:
+            yield from _iter_json_ld_objects(data["@graph"])
+
+def _meta_content(soup, *names):
+    """依序查 <meta property=...> / <meta name=...>，回傳第一個有值的 content"""
+    for name in names:
+        tag = soup.find("meta", attrs={"property": name}) or soup.find("meta", attrs={"name": name})
+        if tag and tag.get("content"):
+            return tag["content"].strip()
+    return None
+
+def extract_structured_article(soup):
+    """快速路徑：從 JSON-LD NewsArticle 取出 articleBody
+
+    articleBody 已是出版商提供的乾淨內文，取得時不需跑選擇器，也不需送 Gemini 清洗。
+    JSON-LD 缺少 datePublished 時以 OpenGraph 的 article:published_time 補齊。
+    沒有足夠長的 articleBody 時回傳 None，交給一般抽取流程。
+    """
+    for script in soup.find_all("script", type="application/ld+json"):
+        try:
+            data = json.loads(script.string or "")
+        except (TypeError, ValueError):
+            continue
+        for obj in _iter_json_ld_objects(data):
+            types_ = obj.get("@type")
+            types_ = set(types_) if isinstance(types_, list) else {types_}
+            body = obj.get("articleBody")
+            if not (types_ & STRUCTURED_ARTICLE_TYPES) or not isinstance(body, str):
+                continue
+            # 部分網站的 articleBody 內含 HTML 標籤或跳脫字元
+            body = BeautifulSoup(body, "html.parser").get_text(separator="\n", strip=True).replace("\x00", "")
+            if len(body) < MIN_VALID_CONTENT_CHARS:
+                continue
+            return {
+                "body": body,
+                "date_published": obj.get("datePublished") or _meta_content(soup, "article:published_time"),
+                "raw": str(script).replace("\x00", "")
+            }
+    return None
+
+def _structured_datetime(value):
+    """把 datePublished 轉成與故事頁相同格式的台北時間字串，無法解析時回傳 None"""
+    try:
+        published = parser.parse(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    if published.tzinfo:
+        published = published.astimezone(TAIPEI_TZ).replace(tzinfo=None)
+    return published.strftime("%Y/%m/%d %H:%M:%S")
+
+def _block_marker(text):
+    """回傳文字中命中的封鎖/付費牆原因，沒有時回傳 None"""
+    for marker, reason in BLOCK_PAGE_MARKERS.items():
+        if marker in text:
+            return reason
+    return None
+
+def detect_block_page(page, response, final_url):
+    """導航後的廉價封鎖偵測：狀態碼、頁面標題、body 前段文字，不需解析整頁"""
+    if response is not None and urlparse(response.url).netloc == urlparse(final_url).netloc:
+        if response.status in BLOCK_STATUS_CODES:
+            return f"http_{response.status}"
+    try:
+        reason = _block_marker(page.title())
+        if reason:
+            return reason
+        probe = page.evaluate(
+            "(n) => (document.body && document.body.innerText || '').slice(0, n)", BLOCK_PROBE_CHARS
+        )
+        return _block_marker(probe or "")
+    except Exception:
+        return None
+
+def _fail(article_info, reason):
+    """記錄失敗原因（timeout / blocked / empty_content / navigation_error）後回傳 None"""
+    article_info['failure_reason'] = reason
+    return None
+
+sanitize_stats = defaultdict(lambda: {"pages": 0, "bytes_before": 0, "bytes_after": 0})
+_sanitize_stats_lock = threading.Lock()
+
+def _is_ad_container(tag):
+    names = " ".join(tag.get("class") or []) + " " + (tag.get("id") or "")
+    return bool(SANITIZE_AD_PATTERN.search(names))
+
+def sanitize_content_soup(content_soup):
+    """一次走訪移除 script/style/廣告容器/SVG 等非內文節點與註解，其餘元素只保留必要屬性
+
+    選中的內文元素本身（文件最上層的元素）不做廣告比對，避免類別名稱碰巧命中時整篇被移除。
+    """
+    stack = [content_soup]
+    while stack:
+        node = stack.pop()
+        is_root = node is content_soup and isinstance(content_soup, BeautifulSoup)
+        for child in list(node.children):
+            if isinstance(child, Comment):
+                child.extract()
+            elif isinstance(child, Tag):
+                if child.name in SANITIZE_REMOVE_TAGS or (not is_root and _is_ad_container(child)):
+                    child.decompose()
+                    continue
+                child.attrs = {k: v for k, v in child.attrs.items() if k in SANITIZE_KEEP_ATTRS}
+                stack.append(child)
+    return content_soup
+
+def report_sanitize_savings(domain, before, after):
+    """累計每個網域清理前後的 HTML 大小"""
+    with _sanitize_stats_lock:
+        stats = sanitize_stats[domain]
+        stats["pages"] += 1
+        stats["bytes_before"] += before
+        stats["bytes_after"] += after
+    emit_metric("html_sanitized", domain=domain, bytes_before=before, bytes_after=after)
+
+def extract_article_content(soup, final_url, media):
+    """從整頁解析結果抽出內文
+
+    先看 JSON-LD 結構化內文，沒有時才試該網域以往成功的選擇器，再依預設順序。
+    回傳 content（純文字）、raw_html（選中的片段）、extraction、selector、
+    skipped_selectors（命中但內文過短而略過的選擇器）與 date_published；
+    抓取時與 reextract_archive.py 重新抽取時共用。
+    """
+    structured = extract_structured_article(soup)
+    if structured:
+        print(f"   使用 JSON-LD 内文 ({len(structured['body'])} 字)，跳过选择器与 Gemini 清洗")
+        return {
+            "content": structured["body"],
+            "raw_html": structured["raw"],
+            "extraction": "json-ld",
+            "selector": None,
+            "date_published": structured["date_published"]
+        }
+
+    skipped_selectors = []
+    selector, content_element = find_content_element(soup, urlparse(final_url).netloc, media, skipped_selectors)
+    body_content = ""
+    raw_html = ""
+    if content_element:
         try:
-            browser, context = create_robust_browser(p, headless=True)
-            page = context.new_page()
-            
-            print(f"\n正在處理故事 {story_info['index']}: [{story_info['category']}] {story_info['title']}")
-            print(f"   故事ID: {story_info['story_id']}")
-            
-            # 取得現有故事的 crawl_date (如果有的話)
-            existing_story_data = story_info.get('existing_story_data')
-            cutoff_date = None
-            if existing_story_data and existing_story_data.get('crawl_date'):
-                try:
-                    cutoff_date_str = existing_story_data['crawl_date']
-                    if isinstance(cutoff_date_str, str):
-                        try:
-                            cutoff_date = parser.parse(cutoff_date_str)
-                        except:
-                            cutoff_date = datetime.strptime(cutoff_date_str, "%Y/%m/%d %H:%M")
-                    print(f"   只處理 {cutoff_date_str} 之後的文章")
-                except Exception as e:
-                    print(f"   解析 cutoff_date 時出錯: {e}")
-            
-            page.goto(story_info['url'])
-            time.sleep(random.randint(3, 6))
-            
-            content = page.content()
-            soup = BeautifulSoup(content, "html.parser")
-            article_elements = soup.find_all("article", class_="MQsxIb xTewfe tXImLc R7GTQ keNKEd keNKEd VkAdve GU7x0c JMJvke q4atFc")
+            content_soup = BeautifulSoup(str(content_element), "html.parser")
             
-            print(f"   找到 {len(article_elements)} 個 article 元素")
+            excluded_divs = content_soup.find_all('div', class_='paragraph moreArticle')
+            for div in excluded_divs:
+                div.decompose()
             
-            processed_count = 0
+            excluded_p_classes = [
+                'mb-module-gap read-more-vendor break-words leading-[1.4] text-px20 lg:text-px18 lg:leading-[1.8] text-batcave __web-inspector-hide-shortcut__',
+                'mb-module-gap read-more-editor break-words leading-[1.4] text-px20 lg:text-px18 lg:leading-[1.8] text-batcave'
+            ]
             
-            for j, article in enumerate(article_elements, start=1):
-                try:
-                    if processed_count >= 15:
-                        break
-                    
-                    h4_element = article.find("h4", class_="ipQwMb ekueJc RD0gLb")
-                    
-                    if h4_element:
-                        link = h4_element.find("a", class_="DY5T1d RZIKme")
-                        
-                        if link:
-                            href = link.get("href")
-                            link_text = link.text.strip()
-                            
-                            media_element = article.find("a", class_="wEwyrc")
-                            media = media_element.text.strip() if media_element else "未知來源"
-
-                            # 跳過特定媒體
-                            if media in ["MSN", "自由時報", "chinatimes.com", "中時電子報", 
-                                         "中時新聞網", "上報Up Media", "點新聞", "香港文匯網", 
-                                         "天下雜誌", "自由健康網", "知新聞", "SUPERMOTO8", 
-                                         "警政時報", "大紀元", "新唐人電視台", "arch-web.com.tw",
-                                         "韓聯社", "公視新聞網PNN", "優分析UAnalyze", "AASTOCKS.com",
-                                         "KSD 韓星網", "商周", "自由財經", "鉅亨號",
-                                         "wownews.tw", "utravel.com.hk", "更生新聞網", "香港電台",
-                                         "citytimes.tw"]:
-                                continue
+            for p_class in excluded_p_classes:
+                excluded_ps = content_soup.find_all('p', class_=p_class)
+                for p in excluded_ps:
+                    p.decompose()
 
-                            time_element = article.find(class_="WW6dff uQIVzc Sksgp slhocf")
-                            article_datetime = "未知時間"
-                            
-                            if time_element and time_element.get("datetime"):
-                                dt_str = time_element.get("datetime")
-                                dt_obj = datetime.fromisoformat(dt_str.replace("Z", "+00:00"))
-                                article_datetime_obj = dt_obj + timedelta(hours=8)
-                                article_datetime = article_datetime_obj.strftime("%Y/%m/%d %H:%M:%S")
-                                
-                                # 檢查文章時間是否在 cutoff_date 之後
-                                if cutoff_date and article_datetime_obj <= cutoff_date:
-                                    print(f"     跳過舊文章: {link_text}")
-                                    print(f"        文章時間: {article_datetime} <= 截止時間: {cutoff_date}")
-                                    continue
-                            
-                            if href:
-                                if href.startswith("./"):
-                                    full_href = "https://news.google.com" + href[1:]
-                                else:
-                                    full_href = "https://news.google.com" + href
-                                
-                                # 檢查文章是否需要處理
-                                should_skip, action_type, story_data, skip_reason = check_story_exists_in_supabase(
-                                    story_info['url'], story_info['category'], article_datetime, full_href
-                                )
-                                
-                                if should_skip and action_type == "skip":
-                                    print(f"     跳過文章: {link_text}")
-                                    print(f"        原因: {skip_reason}")
-                                    continue
-                                
-                                article_links.append({
-                                    "story_id": story_info['story_id'],
-                                    "story_title": story_info['title'],
-                                    "story_category": story_info['category'],
-                                    "story_url": story_info['url'],
-                                    "article_index": processed_count + 1,
-                                    "article_title": link_text,
-                                    "article_url": full_href,
-                                    "media": media,
-                                    "article_datetime": article_datetime,
-                                    "action_type": action_type,
-                                    "existing_story_data": story_data
-                                })
-                                
-                                processed_count += 1
-                                print(f"     {processed_count}. {link_text}")
-                                print(f"        媒體: {media}")
-                                print(f"        時間: {article_datetime}")
-                                print(f"        處理類型: {action_type}")
-                                print(f"        {full_href}")
-                                
-                except Exception as e:
-                    print(f"     處理文章元素 {j} 時出錯: {e}")
-                    continue
+            bytes_before = len(str(content_soup).encode("utf-8"))
+            sanitize_content_soup(content_soup)
+            report_sanitize_savings(urlparse(final_url).netloc, bytes_before, len(str(content_soup).encode("utf-8")))
             
-            if processed_count == 0 and cutoff_date:
-                print(f"   此故事沒有 {cutoff_date} 之後的新文章")
+            # 主要欄位只存抽取出的純文字，原始 HTML 另外壓縮保存
+            raw_html = str(content_soup).replace("\x00", "")
+            body_content = content_soup.get_text(separator="\n", strip=True).replace("\x00", "")
             
         except Exception as e:
-            print(f"處理故事時出錯: {e}")
-        finally:
-            try:
-                browser.close()
-            except:
-                pass
-    
-    return article_links
+            print(f"   内容清理时出错: {e}")
+            body_content = ""
+            raw_html = ""
+    else:
+        print(f"   未找到可用的内容")
 
-def get_final_content(article_info, page):
-    """步驟 3: 跳轉到原始網站並抓取內容 - 使用 Playwright (修正版本)"""
-    MAX_RETRIES = 2
+    return {
+        "content": body_content,
+        "raw_html": raw_html,
+        "extraction": "selector",
+        "selector": selector,
+        "skipped_selectors": [skipped for skipped in skipped_selectors if skipped != selector],
+        "date_published": None
+    }
+
+def _fetch_final_content(article_info, page, deadline):
+    """get_final_content 的實際抓取流程，所有等待與重試都受 deadline 限制"""
+    MAX_RETRIES = ARTICLE_FETCH_ATTEMPTS  # 重试仍受同一个 deadline 限制
     TIMEOUT = 15000  # 15秒 (Playwright使用毫秒)
     
     for attempt in range(MAX_RETRIES):
+        deadline.check()
         try:
             print(f"   尝试第 {attempt + 1} 次访问...")
             
-            # 设定页面超时
-            page.set_default_timeout(TIMEOUT)
+            # 设定页面超时（不超过期限剩余时间；之后沿用默认超时的调用前会再收紧）
+            page.set_default_timeout(deadline.timeout_ms(TIMEOUT))
+
+            # 已知转址结果时直接前往出版商，不经过 Google
+            target_url = redirect_cache.get(article_info['article_url'], article_info['article_url'])
+            if target_url != article_info['article_url']:
+                print(f"   使用已缓存的转址: {target_url}")
+            elif is_google_url(target_url) and google_breaker.is_open():
+                # 冷却等待发生在期限开始之前；重试时又遇到冷却就直接放弃，不占用期限
+                print(f"   Google 节流冷却中，放弃本次尝试")
+                return _fail(article_info, "blocked")
             
+            nav_response = None
             try:
                 # 使用 wait_until 参数确保页面完全加载
-                page.goto(article_info['article_url'], timeout=TIMEOUT, wait_until='domcontentloaded')
+                nav_response = page.goto(target_url, timeout=deadline.timeout_ms(TIMEOUT), wait_until='domcontentloaded')
                 
                 # 等待页面稳定
                 try:
                     # 等待网络空闲，确保页面完全加载
-                    page.wait_for_load_state('networkidle', timeout=10000)
+                    page.wait_for_load_state('networkidle', timeout=deadline.timeout_ms(10000))
                 except PlaywrightTimeoutError:
                     # 如果网络空闲超时，至少等待DOM加载完成
-                    page.wait_for_load_state('domcontentloaded', timeout=5000)
+                    page.wait_for_load_state('domcontentloaded', timeout=deadline.timeout_ms(5000))
                     
             except PlaywrightTimeoutError:
                 print(f"   页面加载超时，尝试继续...")
                 # 即使超时也尝试获取内容
                 try:
-                    page.wait_for_load_state('domcontentloaded', timeout=3000)
+                    page.wait_for_load_state('domcontentloaded', timeout=deadline.timeout_ms(3000))
                 except:
                     pass
             except Exception as e:
                 print(f"   页面导航错误: {e}")
                 if attempt < MAX_RETRIES - 1:
                     print(f"   {TIMEOUT//4000} 秒后重试...")
-                    time.sleep(TIMEOUT//4000)
+                    deadline.sleep(TIMEOUT//4000)
                     continue
                 else:
-                    return None
+                    return _fail(article_info, "navigation_error")
             
             # 额外等待确保页面稳定
-            time.sleep(random.randint(2, 4))
+            deadline.sleep(random.randint(2, 4))
+            deadline.check()
             
             try:
                 skip_patterns = [
@@ -470,7 +1617,7 @@ def get_final_content(article_info, page):
                         except Exception as url_error:
                             if "navigating" in str(url_error).lower():
                                 print(f"   页面仍在导航，等待获取URL... (第 {url_attempts + 1} 次)")
-                                time.sleep(1)
+                                deadline.sleep(1)
                                 url_attempts += 1
                             else:
                                 print(f"   获取URL时出错: {url_error}")
@@ -486,23 +1633,35 @@ def get_final_content(article_info, page):
                     print(f"   URL处理异常: {e}")
                     final_url = article_info['article_url']
                 
-                if final_url.startswith("https://www.google.com/sorry/index?continue=https://news.google.com/read"):
-                    print(f"   遇到 Google 验证页面，尝试刷新...")
-                    try:
-                        page.reload()
-                        time.sleep(random.randint(2, 4))
-                        final_url = page.url
-                    except:
-                        print(f"   刷新失败")
-                        return None
-                        
-                elif any(final_url.startswith(pattern) for pattern in skip_patterns):
+                if is_google_throttle_url(final_url):
+                    # 交给断路器统一冷却，下一次尝试会在冷却结束后才前往 Google
+                    print(f"   遇到 Google 验证页面")
+                    google_breaker.record_throttle(article_info['article_url'], "sorry_page")
+                    if attempt < MAX_RETRIES - 1:
+                        continue
+                    return _fail(article_info, "blocked")
+
+                if is_google_url(target_url) and not is_google_url(final_url):
+                    google_breaker.record_success()
+                    redirect_cache[article_info['article_url']] = final_url
+
+                if any(final_url.startswith(pattern) for pattern in skip_patterns):
                     print(f"   跳过连结: {final_url}")
                     return None
                 
             except Exception as e:
                 print(f"   获取 URL 时出错: {e}")
                 final_url = article_info['article_url']
+
+            # 解析整页之前先做封锁/付费墙探测，命中时该网域剩余文章延后处理
+            if not is_google_url(final_url):
+                page.set_default_timeout(deadline.timeout_ms(TIMEOUT))
+                block_reason = detect_block_page(page, nav_response, final_url)
+                if block_reason:
+                    blocked_domain = urlparse(final_url).netloc
+                    print(f"   {blocked_domain} 遇到封锁/付费墙 ({block_reason})，网域冷却 {DOMAIN_BLOCK_COOLDOWN} 秒")
+                    domain_cooldown.block(blocked_domain, block_reason)
+                    return _fail(article_info, "blocked")
             
             try:
                 # 检查页面状态，确保没有在导航中
@@ -519,7 +1678,7 @@ def get_final_content(article_info, page):
                     except Exception as url_error:
                         if "navigating" in str(url_error).lower():
                             print(f"   页面仍在导航中，等待... (第 {wait_attempt + 1} 次)")
-                            time.sleep(1)
+                            deadline.sleep(1)
                             wait_attempt += 1
                         else:
                             print(f"   页面状态检查错误: {url_error}")
@@ -529,7 +1688,7 @@ def get_final_content(article_info, page):
                     print(f"   页面导航超时，尝试强制获取内容")
                 
                 # 等待一小段时间确保页面完全渲染
-                time.sleep(2)
+                deadline.sleep(2)
                 
                 # 尝试多次获取页面内容，直到成功
                 html = None
@@ -538,6 +1697,7 @@ def get_final_content(article_info, page):
                 
                 while content_attempts < max_content_attempts and html is None:
                     try:
+                        page.set_default_timeout(deadline.timeout_ms(TIMEOUT))
                         html = page.content()
                         if html and len(html) > 100:
                             break
@@ -546,7 +1706,7 @@ def get_final_content(article_info, page):
                     except Exception as content_error:
                         if "navigating" in str(content_error).lower():
                             print(f"   页面仍在变化中，等待... (内容获取第 {content_attempts + 1} 次)")
-                            time.sleep(2)
+                            deadline.sleep(2)
                             content_attempts += 1
                         else:
                             print(f"   获取页面内容错误: {content_error}")
@@ -557,98 +1717,51 @@ def get_final_content(article_info, page):
                     if attempt < MAX_RETRIES - 1:
                         continue
                     else:
-                        return None
+                        return _fail(article_info, "empty_content")
                         
                 soup = BeautifulSoup(html, "html.parser")
             except Exception as e:
                 print(f"   解析页面时出错: {e}")
                 if "navigating" in str(e).lower():
                     print(f"   页面仍在导航中，等待后重试...")
-                    time.sleep(3)
+                    deadline.sleep(3)
                     if attempt < MAX_RETRIES - 1:
                         continue
-                return None
+                return _fail(article_info, "navigation_error")
 
-            # 内容提取逻辑（保持原有逻辑）
-            content_to_clean = None
-            article_tag = soup.find('article')
-            if article_tag and article_info['media'] != 'Now 新聞':
-                content_to_clean = str(article_tag)
-            elif soup.find('artical'):
-                article_tag = soup.find('artical')
-                content_to_clean = str(article_tag)
-            else:
-                target_ids = [
-                    'text ivu-mt', 'content-box', 'text', 'boxTitle', 
-                    'news-detail-content', 'story', 'article-content__editor', 'article-body', 
-                    'artical-content', 'article_text', 'newsText'
-                ]
-                
-                div_by_id = None
-                for target_id in target_ids:
-                    try:
-                        div_by_id = soup.find('div', id=target_id)
-                        if div_by_id:
-                            break
-                    except Exception as e:
-                        continue
-                
-                if div_by_id:
-                    content_to_clean = str(div_by_id)
-                else:
-                    target_classes = ['articleBody clearfix', 'text boxTitle','text ivu-mt', 'paragraph', 'atoms', 
-                                      'news-box-text border', 'newsLeading', 'text']
+            page_archive.put(html, final_url, article_info)
 
-                    div_by_class = None
-                    for target_class in target_classes:
-                        try:
-                            div_by_class = soup.find('div', class_=target_class)
-                            if div_by_class:
-                                break
-                        except Exception as e:
-                            continue
-                    
-                    if div_by_class:
-                        content_to_clean = str(div_by_class)
-                    else:
-                        if soup.body:
-                            content_to_clean = str(soup.body)
+            content_domain = urlparse(final_url).netloc
+            extracted = extract_article_content(soup, final_url, article_info['media'])
+            body_content = extracted["content"]
+            raw_html = extracted["raw_html"]
+            article_datetime = article_info.get('article_datetime', '未知时间')
+            if article_datetime in ("未知時間", "未知时间") and extracted["date_published"]:
+                article_datetime = _structured_datetime(extracted["date_published"]) or article_datetime
 
-            if content_to_clean:
-                try:
-                    content_soup = BeautifulSoup(content_to_clean, "html.parser")
-                    
-                    excluded_divs = content_soup.find_all('div', class_='paragraph moreArticle')
-                    for div in excluded_divs:
-                        div.decompose()
-                    
-                    excluded_p_classes = [
-                        'mb-module-gap read-more-vendor break-words leading-[1.4] text-px20 lg:text-px18 lg:leading-[1.8] text-batcave __web-inspector-hide-shortcut__',
-                        'mb-module-gap read-more-editor break-words leading-[1.4] text-px20 lg:text-px18 lg:leading-[1.8] text-batcave'
-                    ]
-                    
-                    for p_class in excluded_p_classes:
-                        excluded_ps = content_soup.find_all('p', class_=p_class)
-                        for p in excluded_ps:
-                            p.decompose()
-                    
-                    body_content = str(content_soup)
-                    body_content = body_content.replace("\x00", "").replace("\r", "").replace("\n", "")
-                    body_content = body_content.replace('"', '\\"')
-                    
-                except Exception as e:
-                    print(f"   内容清理时出错: {e}")
-                    body_content = ""
-            else:
-                body_content = ""
-                print(f"   未找到可用的内容")
+            # 命中但內文過短而略過的選擇器記為失敗，排名下次就會往後移
+            for skipped_selector in extracted.get("skipped_selectors", ()):
+                record_selector_outcome(content_domain, skipped_selector, False)
+            if extracted["selector"]:
+                record_selector_outcome(content_domain, extracted["selector"], len(body_content) >= MIN_VALID_CONTENT_CHARS)
                 
             article_id = str(uuid.uuid4())
 
-            if ("您的網路已遭到停止訪問本網站的權利。" in body_content or 
-                "我們的系統偵測到您的電腦網路送出的流量有異常情況。" in body_content):
+            if "我們的系統偵測到您的電腦網路送出的流量有異常情況。" in body_content:
+                print(f"   文章 {article_id} 遇到流量异常验证，无法访问")
+                google_breaker.record_throttle(article_info['article_url'], "unusual_traffic")
+                return _fail(article_info, "blocked")
+
+            # 通用標記只比對標題與前段文字，避免正文引用到這些字句時被誤判為封鎖頁
+            page_title = soup.title.get_text() if soup.title else ""
+            block_reason = _block_marker(page_title) or _block_marker(body_content[:BLOCK_PROBE_CHARS])
+            if block_reason:
                 print(f"   文章 {article_id} 被封锁，无法访问")
-                return None
+                domain_cooldown.block(content_domain, block_reason)
+                return _fail(article_info, "blocked")
+
+            if not body_content:
+                return _fail(article_info, "empty_content")
 
             return {
                 "story_id": article_info['story_id'],
@@ -662,20 +1775,24 @@ def get_final_content(article_info, page):
                 "final_url": final_url,
                 "media": article_info.get('media', '未知来源'),
                 "content": body_content,
-                "article_datetime": article_info.get('article_datetime', '未知时间'),
+                "raw_html": raw_html,
+                "extraction": extracted["extraction"],
+                "article_datetime": article_datetime,
                 "action_type": article_info.get('action_type', 'process'),
                 "existing_story_data": article_info.get('existing_story_data')
             }
             
+        except ArticleDeadlineExceeded:
+            raise
         except Exception as e:
             print(f"   第 {attempt + 1} 次尝试失败: {e}")
             if attempt < MAX_RETRIES - 1:
                 print(f"   {TIMEOUT//2000} 秒后重试...")
-                time.sleep(TIMEOUT//2000)
+                deadline.sleep(TIMEOUT//2000)
             else:
                 print(f"   已达到最大重试次数，放弃该文章")
     
-    return None
+    return _fail(article_info, "navigation_error")
 
 def check_story_exists_in_supabase(story_url, category, article_datetime="", article_url=""):
     """
@@ -690,15 +1807,20 @@ def check_story_exists_in_supabase(story_url, category, article_datetime="", art
     Returns:
         tuple: (should_skip, action_type, story_data, skip_reason)
     """
+    if har_replay:
+        # 重播模式完全離線，一律視為新故事，讓每次重播的流程一致
+        return False, "create_new_story", None, "HAR 重播模式"
+
     try:
         # 1. 检查 story_url 是否存在，按 crawl_date 降序排列取最新的
-        story_response = supabase.table("stories").select("*").eq("story_url", story_url).order("crawl_date", desc=True).limit(1).execute()
+        existing_story = supabase_repo.stories.first(
+            STORY_LOOKUP_COLUMNS, order_by="crawl_date", desc=True, story_url=story_url
+        )
 
-        if not story_response.data:
+        if not existing_story:
             # 故事不存在，需要创建新故事
             return False, "create_new_story", None, "新故事"
         
-        existing_story = story_response.data[0]
         story_id = existing_story["story_id"]
         existing_crawl_date = existing_story["crawl_date"]
         
@@ -738,9 +1860,7 @@ def check_story_exists_in_supabase(story_url, category, article_datetime="", art
                     
                     # 4. 检查文章URL是否已存在
                     if article_url:
-                        article_response = supabase.table("cleaned_news").select("article_id").eq("article_url", article_url).execute()
-                        
-                        if article_response.data:
+                        if supabase_repo.cleaned_news.exists("article_id", article_url=article_url):
                             # 文章已存在，跳过
                             return True, "skip", existing_story, f"文章已存在于故事 {story_id}"
                         else:
@@ -764,6 +1884,34 @@ def check_story_exists_in_supabase(story_url, category, article_datetime="", art
         print(f"   检查Supabase时出错: {e}")
         return False, "create_new_story", None, f"数据库检查错误: {e}"
 
+def classify_story_links(links, category):
+    """一次判斷多個 (story_url, article_url, article_datetime) 的處理方式
+
+    呼叫資料庫函式 classify_story_links（migrations/001_classify_story_links.sql），
+    整批只需一次往返；回傳與 links 同順序的 (should_skip, action_type, story_data, skip_reason)。
+    函式尚未部署或呼叫失敗時，退回逐筆 check_story_exists_in_supabase。
+    """
+    if not links:
+        return []
+    if not har_replay:
+        try:
+            payload = [
+                {"story_url": story_url, "article_url": article_url or "", "article_datetime": article_datetime or ""}
+                for story_url, article_url, article_datetime in links
+            ]
+            rows = supabase_repo.execute(supabase.rpc("classify_story_links", {"links": payload})).data or []
+            if len(rows) == len(links):
+                rows.sort(key=lambda row: row["idx"])
+                return [(row["should_skip"], row["action_type"], row["story"], row["reason"]) for row in rows]
+            print(f"   classify_story_links 回传 {len(rows)} 笔（预期 {len(links)} 笔），改为逐笔检查")
+        except Exception as e:
+            print(f"   classify_story_links 调用失败，改为逐笔检查: {e}")
+
+    return [
+        check_story_exists_in_supabase(story_url, category, article_datetime, article_url)
+        for story_url, article_url, article_datetime in links
+    ]
+
 def save_story_to_supabase(story_data):
     """
     保存故事到 Supabase stories 表
@@ -778,7 +1926,7 @@ def save_story_to_supabase(story_data):
         }
         
         # 使用 upsert 来避免重复插入
-        response = supabase.table("stories").upsert(story_record, on_conflict="story_id").execute()
+        response = supabase_repo.execute(supabase.table("stories").upsert(story_record, on_conflict="story_id"))
         print(f"   故事已保存到数据库: {story_data['story_id']}")
         return True
         
@@ -787,9 +1935,275 @@ def save_story_to_supabase(story_data):
         return False
 
 
+def article_domain(article_info):
+    """文章出版商的網域；尚未解析過轉址時用媒體名稱對應到上次見過的網域"""
+    cached = redirect_cache.get(article_info['article_url'])
+    if cached:
+        return urlparse(cached).netloc
+    return domain_stats["media_domains"].get(article_info.get('media', ''))
+
+def record_domain_outcome(article_info, domain, elapsed, timed_out):
+    """記錄每個網域的抓取次數、逾時次數與耗時"""
+    if not domain:
+        return
+    with _domain_stats_lock:
+        stats = domain_stats["domains"].setdefault(domain, {"fetches": 0, "timeouts": 0, "total_seconds": 0.0})
+        stats["fetches"] += 1
+        stats["total_seconds"] = round(stats["total_seconds"] + elapsed, 2)
+        if timed_out:
+            stats["timeouts"] += 1
+        media = article_info.get('media')
+        if media and not is_google_url(f"https://{domain}/"):
+            domain_stats["media_domains"][media] = domain
+    if timed_out:
+        emit_metric("article_deadline_exceeded", domain=domain, media=article_info.get('media'),
+                    article_url=article_info['article_url'], elapsed_seconds=round(elapsed, 2))
+
+def domain_priority_factor(article_info):
+    """慢網域的排序折扣：逾時率越高折扣越大（最多降到 1 - SLOW_DOMAIN_PENALTY）"""
+    domain = article_domain(article_info)
+    stats = domain_stats["domains"].get(domain) if domain else None
+    if not stats:
+        return 1.0
+    # 加上先驗次數平滑，少量樣本不會一次就把網域打入冷宮
+    timeout_rate = stats["timeouts"] / (stats["fetches"] + 2)
+    return 1.0 - SLOW_DOMAIN_PENALTY * timeout_rate
+
+def get_final_content(article_info, page):
+    """步驟 3: 跳轉到原始網站並抓取內容 - 使用 Playwright (修正版本)
+
+    整篇文章（導航、等待、重試、抽取）共用一個 ARTICLE_DEADLINE_SECONDS 的硬期限，
+    逾時就中止導航並放棄該文章，逾時紀錄會降低該網域之後的排序。
+    """
+    # 节流冷却的等待不计入文章期限
+    if article_info['article_url'] not in redirect_cache and is_google_url(article_info['article_url']):
+        google_breaker.wait_until_closed()
+
+    article_info.pop('failure_reason', None)
+    deadline = ArticleDeadline(ARTICLE_DEADLINE_SECONDS)
+    started = time.time()
+    timed_out = False
+    try:
+        result = _fetch_final_content(article_info, page, deadline)
+    except ArticleDeadlineExceeded:
+        result = None
+    if result is None and deadline.expired():
+        timed_out = True
+        article_info['failure_reason'] = "timeout"
+        print(f"   超过 {ARTICLE_DEADLINE_SECONDS} 秒期限，放弃该文章")
+        try:
+            # 取消仍在进行的导航，避免拖到下一篇文章
+            page.goto("about:blank", timeout=3000)
+        except Exception:
+            pass
+
+    domain = urlparse(result["final_url"]).netloc if result else None
+    if not domain:
+        try:
+            current_url = page.url
+            if current_url and not current_url.startswith("about:") and not is_google_url(current_url):
+                domain = urlparse(current_url).netloc
+        except Exception:
+            pass
+    record_domain_outcome(article_info, domain or article_domain(article_info), time.time() - started, timed_out)
+    return result
+
+class DeadLetterQueue:
+    """抓取失敗文章的持久化佇列，以 Google News 文章網址為鍵
+
+    每筆記錄失敗原因與累計次數，達 DEAD_LETTER_MAX_ATTEMPTS 次就放棄。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = load_json_state(path)
+        self._lock = threading.Lock()
+
+    def add(self, article_info, reason):
+        article_url = article_info['article_url']
+        with self._lock:
+            entry = self.entries.get(article_url) or {"attempts": 0}
+            entry["attempts"] += 1
+            entry["reason"] = reason
+            entry["last_failed_at"] = datetime.now().isoformat(timespec="seconds")
+            entry["article"] = {k: v for k, v in article_info.items() if k != 'failure_reason'}
+            if entry["attempts"] >= DEAD_LETTER_MAX_ATTEMPTS:
+                self.entries.pop(article_url, None)
+                print(f"   已失败 {entry['attempts']} 次 ({reason})，不再重试")
+            else:
+                self.entries[article_url] = entry
+                print(f"   失败原因: {reason}，已放入死信队列 (第 {entry['attempts']} 次)")
+        emit_metric("article_dead_letter", article_url=article_url, reason=reason,
+                    attempts=entry["attempts"], dropped=entry["attempts"] >= DEAD_LETTER_MAX_ATTEMPTS)
+
+    def remove(self, article_url):
+        with self._lock:
+            self.entries.pop(article_url, None)
+
+    def pending(self, category):
+        """該分類待重試的文章（依最早失敗的順序）"""
+        with self._lock:
+            entries = [e for e in self.entries.values() if e["article"].get('story_category') == category]
+        return [e["article"] for e in sorted(entries, key=lambda e: e["last_failed_at"])]
+
+    def save(self):
+        with self._lock:
+            save_json_state(self.path, self.entries)
+
+dead_letters = DeadLetterQueue(DEAD_LETTER_PATH)
+
+def _refresh_dead_letter(article_info):
+    """重新確認死信文章的故事狀態；已存進資料庫的文章回傳 None"""
+    should_skip, action_type, story_data, skip_reason = check_story_exists_in_supabase(
+        article_info['story_url'], article_info['story_category'],
+        article_info.get('article_datetime', ''), article_info['article_url']
+    )
+    if should_skip and action_type == "skip":
+        return None
+    article_info = dict(article_info, action_type=action_type, existing_story_data=story_data)
+    if story_data:
+        article_info['story_id'] = story_data["story_id"]
+    return article_info
+
+def retry_dead_letters(category, page, budget, attempted_urls):
+    """主迴圈結束後，把該分類死信佇列中的文章（本次與先前執行失敗的）各重試一次
+
+    attempted_urls 為本次主迴圈處理過的文章網址；不在其中的是先前執行留下的，重試前先確認故事狀態。
+    """
+    recovered = []
+    retry_articles = dead_letters.pending(category)
+    if not retry_articles or not page:
+        return recovered
+
+    print(f"\n重试死信队列中的 {len(retry_articles)} 篇 {category} 文章")
+    for article_info in retry_articles:
+        if budget.exhausted():
+            print(f"   爬取预算用尽，其余死信留待下次执行")
+            break
+        if domain_cooldown.is_cooling(article_domain(article_info)):
+            continue
+        if article_info['article_url'] not in attempted_urls:
+            # 先前执行留下的文章：确认仍需处理并更新故事状态
+            article_info = _refresh_dead_letter(article_info)
+            if article_info is None:
+                continue
+        budget.spend_page()
+
+        print(f"\n重试文章: {article_info['article_title']}")
+        article_content = get_final_content(article_info, page)
+        if article_content:
+            dead_letters.remove(article_info['article_url'])
+            recovered.append(article_content)
+            print(f"   重试成功")
+        elif article_info.get('failure_reason'):
+            dead_letters.add(article_info, article_info['failure_reason'])
+        time.sleep(random.randint(2, 4))
+
+    print(f"死信重试完成: 成功 {len(recovered)}/{len(retry_articles)} 篇")
+    return recovered
+
+def compress_bytes(data):
+    """壓縮位元組，回傳 (壓縮後位元組, 壓縮格式)；有安裝 zstandard 時使用 zstd，否則 gzip"""
+    if zstandard:
+        return zstandard.ZstdCompressor(level=RAW_HTML_ZSTD_LEVEL).compress(data), "zstd"
+    return gzip.compress(data, compresslevel=9), "gzip"
+
+def decompress_bytes(data, codec):
+    """還原 compress_bytes 的結果"""
+    if codec == "zstd":
+        if not zstandard:
+            raise RuntimeError("需要安装 zstandard 才能解压 zstd 格式的数据")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+def compress_raw_html(html):
+    """壓縮原始 HTML，回傳 (base64 文字, 壓縮格式)"""
+    data, codec = compress_bytes(html.encode("utf-8"))
+    return base64.b64encode(data).decode("ascii"), codec
+
+def decompress_raw_html(payload, codec):
+    """還原 compress_raw_html 的結果"""
+    return decompress_bytes(base64.b64decode(payload), codec).decode("utf-8")
+
+class PageArchive:
+    """抓取頁面的本地存檔：內容以 sha256 定址、壓縮存放，index.jsonl 記錄 (最終網址, 抓取時間) -> 雜湊"""
+
+    def __init__(self, root):
+        self.root = root
+        self.index_path = os.path.join(root, "index.jsonl")
+        self._lock = threading.Lock()
+
+    def _object_path(self, digest, codec):
+        suffix = "zst" if codec == "zstd" else "gz"
+        return os.path.join(self.root, "objects", digest[:2], f"{digest}.html.{suffix}")
+
+    def put(self, html, final_url, article_info):
+        """存入一頁 HTML，相同內容只存一份；失敗只記錄不影響爬取"""
+        try:
+            data = html.encode("utf-8")
+            digest = hashlib.sha256(data).hexdigest()
+            codec = "zstd" if zstandard else "gzip"
+            path = self._object_path(digest, codec)
+            if not os.path.exists(path):
+                compressed, codec = compress_bytes(data)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(compressed)
+                os.replace(tmp_path, path)
+            entry = {
+                "final_url": final_url,
+                "fetched_at": datetime.now().isoformat(timespec="seconds"),
+                "sha256": digest,
+                "codec": codec,
+                "bytes": len(data),
+                "google_news_url": article_info['article_url'],
+                "media": article_info.get('media'),
+                "story_id": article_info.get('story_id')
+            }
+            with self._lock:
+                with open(self.index_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"   页面存档失败: {e}")
+
+    def entries(self):
+        """每個最終網址最新的一筆索引"""
+        latest = {}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        latest[entry["final_url"]] = entry
+        except FileNotFoundError:
+            pass
+        return list(latest.values())
+
+    def read(self, entry):
+        with open(self._object_path(entry["sha256"], entry["codec"]), "rb") as f:
+            return decompress_bytes(f.read(), entry["codec"]).decode("utf-8")
+
+page_archive = PageArchive(PAGE_ARCHIVE_DIR)
+
+def legacy_storage_bytes(raw_html):
+    """舊格式（整段 HTML 去換行、跳脫引號後直接存 content）的位元組數"""
+    return len(raw_html.replace("\r", "").replace("\n", "").replace('"', '\\"').encode("utf-8"))
+
+def report_storage_savings(article_id, legacy_size, article_record):
+    """與舊格式比較，回報每筆省下的位元組"""
+    stored_size = len((article_record["content"] or "").encode("utf-8")) + len(article_record["raw_html"] or "")
+    saved = legacy_size - stored_size
+    ratio = saved / legacy_size * 100 if legacy_size else 0.0
+    print(f"   存储大小: {stored_size} bytes (旧格式 {legacy_size} bytes，节省 {saved} bytes / {ratio:.1f}%)")
+    emit_metric("article_storage", article_id=article_id, legacy_bytes=legacy_size,
+                stored_bytes=stored_size, saved_bytes=saved, codec=article_record["raw_html_codec"])
+
 def save_article_to_supabase(article_data, story_id):
     """
     保存文章到 Supabase cleaned_news 表
+
+    content 為清洗後的純文字；raw_html 是分組時已壓縮的 base64（raw_html_codec 記錄壓縮格式），直接寫入。
     """
     try:
         article_record = {
@@ -797,23 +2211,25 @@ def save_article_to_supabase(article_data, story_id):
             "article_title": article_data["article_title"],
             "article_url": article_data["article_url"],
             "content": article_data["content"],
+            "raw_html": article_data.get("raw_html"),
+            "raw_html_codec": article_data.get("raw_html_codec"),
             "media": article_data["media"],
             "story_id": story_id
         }
         
-        # 使用 upsert 来避免重复插入
-        article_url = article_data["article_url"]
-        existing_article = supabase.table("cleaned_news").select("article_id").eq("article_url", article_url).execute()
-        
-        if existing_article.data:
-            print(f"   文章已存在，跳过保存: {article_data['article_id']}")
-            return True
-        elif not article_data["content"] or "[清洗失败]" in article_data["content"] or "请提供" in article_data["content"]:
+        if not article_data["content"] or "[清洗失败]" in article_data["content"] or "请提供" in article_data["content"]:
             print(f"   文章内容无效，跳过保存: {article_data['article_id']}")
             return True
-            
-        response = supabase.table("cleaned_news").upsert(article_record, on_conflict="article_id").execute()
+
+        # article_url 有唯一约束（migrations/002），已存在的文章直接略过，不必先查询
+        response = supabase_repo.execute(supabase.table("cleaned_news").upsert(
+            article_record, on_conflict="article_url", ignore_duplicates=True
+        ))
+        if not response.data:
+            print(f"   文章已存在，跳过保存: {article_data['article_id']}")
+            return True
         print(f"   文章已保存到数据库: {article_data['article_id']}")
+        report_storage_savings(article_data["article_id"], article_data.get("legacy_bytes", 0), article_record)
         return True
         
     except Exception as e:
@@ -985,6 +2401,9 @@ def group_articles_by_story_and_time(processed_articles, time_window_days=3):
             grouped_articles = []
             for article_idx, item in enumerate(group, 1):
                 article = item['article']
+                # 故事資料只帶壓縮後的原始 HTML，不把未壓縮的片段複製進每篇文章
+                raw_html = article.get("raw_html") or ""
+                raw_html_payload, raw_html_codec = compress_raw_html(raw_html) if raw_html else (None, None)
                 grouped_articles.append({
                     "article_id": article["id"],
                     "article_title": article["article_title"],
@@ -993,6 +2412,10 @@ def group_articles_by_story_and_time(processed_articles, time_window_days=3):
                     "article_url": article["final_url"],
                     "media": article["media"],
                     "content": article["content"],
+                    "raw_html": raw_html_payload,
+                    "raw_html_codec": raw_html_codec,
+                    "legacy_bytes": legacy_storage_bytes(raw_html),
+                    "extraction": article.get("extraction", "selector"),
                     "original_datetime": article.get("article_datetime", "未知时间")
                 })
             
@@ -1136,11 +2559,115 @@ def save_stories_to_json(stories, filename):
         print(f"保存文件时出错: {e}")
         return False
     
-def process_news_pipeline(main_url, category):
+def scrape_story_pages(story_frontier, story_budget, registry):
+    """步驟 2: 以分頁池並行處理故事頁
+
+    每個 worker 執行緒各自持有一個瀏覽器（Playwright 同步 API 不能跨執行緒共用），
+    依優先順序從 story_frontier 取故事、每個故事開一個分頁；對 Google 的請求由
+    google_rate_limiter 統一控制節奏。結果依取出順序合併，與 worker 數量無關。
+    處理時出錯的故事放回佇列重試一次，仍失敗就不列入 scraped_stories（不更新指紋，下次執行再爬）。
+
+    回傳 (all_article_links, scraped_stories, skipped_shared)。
+    """
+    results = {}
+    frontier_lock = threading.Lock()
+    order = itertools.count()
+    skipped_shared = 0
+    requeued = set()
+
+    def next_story():
+        nonlocal skipped_shared
+        with frontier_lock:
+            while story_frontier and not story_budget.exhausted():
+                story_info = story_frontier.pop()
+                # 放回重試的故事已由此分類認領過
+                if story_info['url'] not in requeued and not registry.claim(story_info):
+                    skipped_shared += 1
+                    print(f"故事已由 {registry.owner(story_info)} 分类处理，跳过: {story_info['title']}")
+                    continue
+                story_budget.spend_page()
+                return next(order), story_info
+            return None
+
+    def worker():
+        with sync_playwright() as p:
+            browser = None
+            try:
+                browser, context = create_robust_browser(p, headless=True)
+                while True:
+                    item = next_story()
+                    if item is None:
+                        break
+                    story_order, story_info = item
+                    try:
+                        page = context.new_page()
+                        try:
+                            results[story_order] = (story_info, get_article_links_from_story(story_info, page))
+                        finally:
+                            page.close()
+                    except Exception as e:
+                        with frontier_lock:
+                            retry = story_info['url'] not in requeued
+                            if retry:
+                                requeued.add(story_info['url'])
+                                story_frontier.push(story_info, score_story(story_info))
+                        print(f"故事页处理失败{'，放回队列重试' if retry else '，本次放弃'}: {story_info['title']} ({e})")
+                        if not browser.is_connected():
+                            raise
+            except Exception as e:
+                print(f"故事页 worker 出错: {e}")
+            finally:
+                try:
+                    close_browser(browser)
+                except:
+                    pass
+
+    worker_count = max(1, min(STORY_PAGE_WORKERS, len(story_frontier)))
+    threads = [threading.Thread(target=worker, name=f"story-worker-{n}") for n in range(worker_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    all_article_links = []
+    scraped_stories = []
+    for story_order in sorted(results):
+        story_info, article_links = results[story_order]
+        all_article_links.extend(article_links)
+        scraped_stories.append(story_info)
+    return all_article_links, scraped_stories, skipped_shared
+
+def save_story_fingerprints(stories, unfinished_story_urls):
+    """保存已完整處理的故事列表指紋
+
+    因預算用盡而還有文章沒處理的故事不更新指紋，下次執行才不會被誤判為未變化。
+    """
+    updated = 0
+    for story_info in stories:
+        fingerprint = story_info.get('listing_fingerprint')
+        if not fingerprint or story_info['url'] in unfinished_story_urls:
+            continue
+        story_fingerprints[story_info['url']] = {
+            "fingerprint": fingerprint,
+            "updated_at": datetime.now().isoformat(timespec="seconds")
+        }
+        updated += 1
+    if updated:
+        save_json_state(STORY_FINGERPRINT_PATH, story_fingerprints)
+        print(f"已更新 {updated} 个故事的文章列表指纹")
+
+def process_news_pipeline(main_url, category, budget=None, registry=None):
     """
     完整的新聞處理管道 - 修正的 Playwright 版本
+
+    budget 為此分類可用的 CrawlBudget；故事與文章依優先分數處理，直到預算用完。
+    registry 為整次執行共用的 StoryRegistry，已被其他分類認領的故事不再重複爬取。
     """
     print(f"开始处理 {category} 分类的新闻...")
+    if budget is None:
+        budget = CrawlBudget(CRAWL_TIME_BUDGET_SECONDS, CRAWL_PAGE_BUDGET)
+    if registry is None:
+        registry = StoryRegistry()
     
     # 步驟1: 獲取所有故事連結
     story_links = get_main_story_links(main_url, category)
@@ -1148,15 +2675,31 @@ def process_news_pipeline(main_url, category):
         print("没有找到任何故事连结")
         return []
     
-    # 步驟2: 處理每個故事，獲取所有文章連結
-    all_article_links = []
-    for story_info in story_links[:10]:
-        article_links = get_article_links_from_story(story_info)
-        all_article_links.extend(article_links)
+    # 步驟2: 依新鮮度處理故事，獲取所有文章連結（最多使用 STORY_PHASE_SHARE 的預算）
+    story_frontier = CrawlFrontier()
+    for story_info in story_links:
+        story_frontier.push(story_info, score_story(story_info))
+
+    story_budget = budget.split(STORY_PHASE_SHARE)
+    all_article_links, scraped_stories, skipped_shared = scrape_story_pages(story_frontier, story_budget, registry)
+    if skipped_shared:
+        print(f"\n{skipped_shared} 个故事已在其他分类处理过")
+    if story_frontier:
+        print(f"\n故事阶段预算用尽，跳过 {len(story_frontier)} 个优先度较低的故事")
     
     if not all_article_links:
         print("没有找到任何文章连结")
+        save_story_fingerprints(scraped_stories, set())
         return []
+
+    # 依文章新鮮度與所屬故事的新文章數排序
+    unseen_per_story = defaultdict(int)
+    for article_info in all_article_links:
+        unseen_per_story[article_info['story_url']] += 1
+    article_frontier = CrawlFrontier()
+    for article_info in all_article_links:
+        article_frontier.push(article_info, score_article(article_info, unseen_per_story[article_info['story_url']]))
+    all_article_links = article_frontier.drain()
     
     print(f"\n总共收集到 {len(all_article_links)} 篇文章待处理")
     
@@ -1167,14 +2710,17 @@ def process_news_pipeline(main_url, category):
     page = None
     consecutive_failures = 0  # 連續失敗計數
     max_consecutive_failures = 3  # 最大連續失敗次數
+    unfinished_story_urls = set()  # 因預算用盡而有文章未處理的故事
+    # 網域冷卻中的文章移到佇列尾端再試一次，仍在冷卻就留給下一次執行
+    article_queue = list(all_article_links)
+    deferred_urls = set()
+    attempted_urls = set()
     
     def create_fresh_browser_and_page():
         """創建新的 browser 和 page 實例"""
         try:
             with sync_playwright() as p:
-                browser, context = create_robust_browser(p, headless=True)
-                page = context.new_page()
-                initialize_page_with_cookies(page)
+                browser, context, page = new_crawler_session(p)
                 return browser, context, page
         except Exception as e:
             print(f"   创建新 Browser/Page 失败: {e}")
@@ -1183,17 +2729,32 @@ def process_news_pipeline(main_url, category):
     # 初始化 browser 和 page
     try:
         with sync_playwright() as p:
-            browser, context = create_robust_browser(p, headless=True)
-            page = context.new_page()
-            initialize_page_with_cookies(page)
+            browser, context, page = new_crawler_session(p)
             
             if not page:
                 print("无法创建初始 Page，终止处理")
                 return []
             
             try:
-                for i, article_info in enumerate(all_article_links, 1):
-                    print(f"\n处理文章 {i}/{len(all_article_links)}: {article_info['article_title']}")
+                for i, article_info in enumerate(article_queue, 1):
+                    if budget.exhausted():
+                        print(f"\n爬取预算用尽，跳过剩余 {len(article_queue) - i + 1} 篇优先度较低的文章")
+                        unfinished_story_urls.update(a['story_url'] for a in article_queue[i - 1:])
+                        break
+
+                    cooling_domain = article_domain(article_info)
+                    if domain_cooldown.is_cooling(cooling_domain):
+                        if article_info['article_url'] in deferred_urls:
+                            print(f"\n{cooling_domain} 仍在冷却，留待下次执行: {article_info['article_title']}")
+                            unfinished_story_urls.add(article_info['story_url'])
+                        else:
+                            print(f"\n{cooling_domain} 冷却中，延后处理: {article_info['article_title']}")
+                            deferred_urls.add(article_info['article_url'])
+                            article_queue.append(article_info)
+                        continue
+                    budget.spend_page()
+
+                    print(f"\n处理文章 {i}/{len(article_queue)}: {article_info['article_title']}")
                     
                     # 检查 page 是否仍然有效
                     try:
@@ -1227,23 +2788,33 @@ def process_news_pipeline(main_url, category):
                         except:
                             pass
                         
-                        browser, context = create_robust_browser(p, headless=True)
-                        page = context.new_page()
-                        initialize_page_with_cookies(page)
+                        browser, context, page = new_crawler_session(p)
                         
                         if not page:
-                            print(f"   无法重新创建 Page，跳过剩余 {len(all_article_links) - i + 1} 篇文章")
+                            print(f"   无法重新创建 Page，跳过剩余 {len(article_queue) - i + 1} 篇文章")
                             break
                     
                     article_content = get_final_content(article_info, page)
+                    attempted_urls.add(article_info['article_url'])
                     
                     if article_content:
                         final_articles.append(article_content)
+                        dead_letters.remove(article_info['article_url'])
                         print(f"   成功获取内容")
                         consecutive_failures = 0  # 重置連續失敗計數
+
+                    elif not article_info.get('failure_reason'):
+                        # 略过的连结（skip_patterns）不算失败
+                        pass
+
+                    elif domain_cooldown.is_cooling(article_domain(article_info)):
+                        # 被出版商封锁不是浏览器的问题，不计入连续失败，交给死信队列在冷却后重试
+                        print(f"   网域已进入冷却")
+                        dead_letters.add(article_info, article_info['failure_reason'])
                         
                     else:
                         print(f"   无法获取内容")
+                        dead_letters.add(article_info, article_info['failure_reason'])
                         consecutive_failures += 1
                         
                         # 检查是否需要重新创建 page
@@ -1257,28 +2828,19 @@ def process_news_pipeline(main_url, category):
                             except:
                                 pass
                             
-                            browser, context = create_robust_browser(p, headless=True)
-                            page = context.new_page()
-                            initialize_page_with_cookies(page)
+                            browser, context, page = new_crawler_session(p)
                             
                             if not page:
-                                print(f"   无法重新创建 Page，跳过剩余 {len(all_article_links) - i + 1} 篇文章")
+                                print(f"   无法重新创建 Page，跳过剩余 {len(article_queue) - i + 1} 篇文章")
                                 break
                             
                             consecutive_failures = 0  # 重置計數
                             print(f"   Browser/Page 重新创建完成")
-                            
-                            # 可选：重新尝试当前文章
-                            print(f"   重新尝试处理当前文章...")
-                            article_content = get_final_content(article_info, page)
-                            if article_content:
-                                final_articles.append(article_content)
-                                print(f"   重新尝试成功")
-                            else:
-                                print(f"   重新尝试仍然失败")
                     
                     # 随机延迟
                     time.sleep(random.randint(2, 4))
+
+                final_articles.extend(retry_dead_letters(category, page, budget, attempted_urls))
                     
             except KeyboardInterrupt:
                 print(f"\n用户中断处理")
@@ -1298,6 +2860,10 @@ def process_news_pipeline(main_url, category):
                     if browser:
                         browser.close()
                     print(f"   Playwright 清理完成")
+                    save_json_state(REDIRECT_CACHE_PATH, redirect_cache)
+                    save_json_state(DOMAIN_STATS_PATH, domain_stats)
+                    save_json_state(SELECTOR_STATS_PATH, selector_stats)
+                    dead_letters.save()
                 except Exception as e:
                     print(f"   Playwright 清理时出现问题: {e}")
     
@@ -1306,12 +2872,42 @@ def process_news_pipeline(main_url, category):
         return []
     
     print(f"\n文章内容获取完成: 成功 {len(final_articles)}/{len(all_article_links)} 篇")
+    save_story_fingerprints(scraped_stories, unfinished_story_urls)
     
     # 步驟4: 按故事和時間分組
     final_stories = group_articles_by_story_and_time(final_articles, time_window_days=3)
     
     return final_stories
 
+def load_playwright_cookies(path="cookies.json"):
+    """讀取匯出的 cookies.json 並轉換為 Playwright 格式"""
+    with open(path, "r", encoding="utf-8") as f:
+        cookies = json.load(f)
+
+    # 转换 cookies 格式为 Playwright 格式
+    playwright_cookies = []
+    for cookie in cookies:
+        playwright_cookie = {
+            "name": cookie.get("name"),
+            "value": cookie.get("value"),
+            "domain": cookie.get("domain", ".google.com"),
+            "path": cookie.get("path", "/"),
+        }
+
+        # 添加可选字段（瀏覽器擴充套件匯出的過期時間欄位為 expirationDate）
+        if "expires" in cookie:
+            playwright_cookie["expires"] = cookie["expires"]
+        elif "expirationDate" in cookie:
+            playwright_cookie["expires"] = cookie["expirationDate"]
+        if "httpOnly" in cookie:
+            playwright_cookie["httpOnly"] = cookie["httpOnly"]
+        if "secure" in cookie:
+            playwright_cookie["secure"] = cookie["secure"]
+
+        playwright_cookies.append(playwright_cookie)
+
+    return playwright_cookies
+
 def initialize_page_with_cookies(page):
     """初始化 Playwright Page 并加载 cookies"""
     try:
@@ -1321,28 +2917,7 @@ def initialize_page_with_cookies(page):
         
         # 尝试加载 cookies
         try:
-            with open("cookies.json", "r", encoding="utf-8") as f:
-                cookies = json.load(f)
-            
-            # 转换 cookies 格式为 Playwright 格式
-            playwright_cookies = []
-            for cookie in cookies:
-                playwright_cookie = {
-                    "name": cookie.get("name"),
-                    "value": cookie.get("value"),
-                    "domain": cookie.get("domain", ".google.com"),
-                    "path": cookie.get("path", "/"),
-                }
-                
-                # 添加可选字段
-                if "expires" in cookie:
-                    playwright_cookie["expires"] = cookie["expires"]
-                if "httpOnly" in cookie:
-                    playwright_cookie["httpOnly"] = cookie["httpOnly"]
-                if "secure" in cookie:
-                    playwright_cookie["secure"] = cookie["secure"]
-                    
-                playwright_cookies.append(playwright_cookie)
+            playwright_cookies = load_playwright_cookies()
             
             # 添加 cookies 到页面上下文
             page.context.add_cookies(playwright_cookies)
@@ -1356,6 +2931,106 @@ def initialize_page_with_cookies(page):
     except Exception as e:
         print(f"初始化 Page cookies 时出错: {e}")
 
+_storage_state_refresh_lock = threading.Lock()
+
+def _storage_state_expires_at(path=STORAGE_STATE_PATH):
+    """回傳快照的失效時間 (epoch 秒)，取快照年齡上限與 Google cookies 最早過期時間的較小者"""
+    expires_at = os.path.getmtime(path) + STORAGE_STATE_MAX_AGE
+    with open(path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    for cookie in state.get("cookies", []):
+        cookie_expires = cookie.get("expires", -1)
+        # -1 為 session cookie，不影響快照有效期
+        if cookie_expires and cookie_expires > 0 and "google." in cookie.get("domain", ""):
+            expires_at = min(expires_at, cookie_expires)
+    return expires_at
+
+def save_storage_state(playwright, path=STORAGE_STATE_PATH):
+    """以 cookies.json 暖機一次，並把 context 狀態寫成 storage_state 快照"""
+    browser = None
+    try:
+        # 沿用舊快照（若有），讓伺服器端更新過的 cookies 延續下去
+        previous_state = path if os.path.exists(path) else None
+        browser, context = create_robust_browser(playwright, headless=True, storage_state=previous_state)
+        page = context.new_page()
+        initialize_page_with_cookies(page)
+        # 重新載入一次，讓 Google 回寫最新的 cookies
+        page.goto("https://news.google.com/")
+
+        # 先寫到暫存檔再替換，避免其他 context 讀到寫到一半的快照
+        tmp_path = f"{path}.tmp"
+        context.storage_state(path=tmp_path)
+        os.replace(tmp_path, path)
+        print(f"storage_state 快照已更新: {path}")
+        return True
+    except Exception as e:
+        print(f"更新 storage_state 快照失败: {e}")
+        return False
+    finally:
+        try:
+            if browser:
+                close_browser(browser)
+        except:
+            pass
+
+def _refresh_storage_state_worker():
+    """背景執行緒：用獨立的 Playwright 實例更新快照"""
+    try:
+        with sync_playwright() as p:
+            save_storage_state(p)
+    finally:
+        _storage_state_refresh_lock.release()
+
+def refresh_storage_state_in_background():
+    """在背景更新快照；已有更新在進行時直接略過"""
+    if not _storage_state_refresh_lock.acquire(blocking=False):
+        return
+    threading.Thread(target=_refresh_storage_state_worker, daemon=True).start()
+
+def get_storage_state(playwright):
+    """取得可用的 storage_state 快照路徑
+
+    快照不存在或已失效時同步重建一次；快接近失效時照常回傳，並在背景更新。
+    無法建立快照時回傳 None，由呼叫端退回舊的 cookies 暖機流程。
+    """
+    try:
+        if os.path.exists(STORAGE_STATE_PATH):
+            remaining = _storage_state_expires_at() - time.time()
+            if remaining > 0:
+                if remaining < STORAGE_STATE_REFRESH_MARGIN:
+                    print(f"storage_state 快照將在 {remaining / 60:.0f} 分钟后失效，背景更新中")
+                    refresh_storage_state_in_background()
+                return STORAGE_STATE_PATH
+            print("storage_state 快照已失效，重新建立")
+        else:
+            print("找不到 storage_state 快照，建立新的快照")
+    except Exception as e:
+        print(f"读取 storage_state 快照时出错: {e}")
+
+    # 同步重建時也要與背景更新互斥，避免兩邊同時寫檔
+    with _storage_state_refresh_lock:
+        try:
+            # 等待期間背景更新可能已經寫好新快照
+            if os.path.exists(STORAGE_STATE_PATH) and _storage_state_expires_at() > time.time():
+                return STORAGE_STATE_PATH
+        except Exception:
+            pass
+        if save_storage_state(playwright):
+            return STORAGE_STATE_PATH
+    return None
+
+def new_crawler_session(playwright):
+    """建立帶有登入狀態的 browser/context/page
+
+    優先使用 storage_state 快照，context 建立後不需再暖機；沒有快照時退回 cookies 暖機。
+    """
+    storage_state = get_storage_state(playwright)
+    browser, context = create_robust_browser(playwright, headless=True, storage_state=storage_state)
+    page = context.new_page()
+    if not storage_state:
+        initialize_page_with_cookies(page)
+    return browser, context, page
+
 def main():
     """
     主函數 - 新聞爬蟲的入口點
@@ -1365,17 +3040,7 @@ def main():
     print("="*80)
 
     # 配置需要處理的新聞分類
-    news_categories = {
-        "Politics": "https://news.google.com/topics/CAAqJQgKIh9DQkFTRVFvSUwyMHZNRFZ4ZERBU0JYcG9MVlJYS0FBUAE?hl=zh-TW&gl=TW&ceid=TW%3Azh-Hant",
-        "Taiwan News": "https://news.google.com/topics/CAAqJQgKIh9DQkFTRVFvSUwyMHZNRFptTXpJU0JYcG9MVlJYS0FBUAE?hl=zh-TW&gl=TW&ceid=TW%3Azh-Hant",
-        "International News": "https://news.google.com/topics/CAAqKggKIiRDQkFTRlFvSUwyMHZNRGx1YlY4U0JYcG9MVlJYR2dKVVZ5Z0FQAQ?hl=zh-TW&gl=TW&ceid=TW%3Azh-Hant",
-        "Science & Technology": "https://news.google.com/topics/CAAqLAgKIiZDQkFTRmdvSkwyMHZNR1ptZHpWbUVnVjZhQzFVVnhvQ1ZGY29BQVAB?hl=zh-TW&gl=TW&ceid=TW%3Azh-Hant",
-        "Lifestyle & Consumer": "https://news.google.com/topics/CAAqJggKIiBDQkFTRWdvSkwyMHZNREUwWkhONEVnVjZhQzFVVnlnQVAB?hl=zh-TW&gl=TW&ceid=TW%3Azh-Hant",
-        "Sports": "https://news.google.com/topics/CAAqKggKIiRDQkFTRlFvSUwyMHZNRFp1ZEdvU0JYcG9MVlJYR2dKVVZ5Z0FQAQ?hl=zh-TW&gl=TW&ceid=TW%3Azh-Hant",
-        "Entertainment": "https://news.google.com/topics/CAAqKggKIiRDQkFTRlFvSUwyMHZNREpxYW5RU0JYcG9MVlJYR2dKVVZ5Z0FQAQ?hl=zh-TW&gl=TW&ceid=TW%3Azh-Hant",
-        "Business & Finance": "https://news.google.com/topics/CAAqKggKIiRDQkFTRlFvSUwyMHZNRGx6TVdZU0JYcG9MVlJYR2dKVVZ5Z0FQAQ?hl=zh-TW&gl=TW&ceid=TW%3Azh-Hant",
-        "Health & Wellness": "https://news.google.com/topics/CAAqJQgKIh9DQkFTRVFvSUwyMHZNR3QwTlRFU0JYcG9MVlJYS0FBUAE?hl=zh-TW&gl=TW&ceid=TW%3Azh-Hant"
-    }
+    news_categories = NEWS_CATEGORIES
 
     
     # 可以選擇處理特定分類或全部分類
@@ -1385,9 +3050,11 @@ def main():
     
     all_final_stories = []
     start_time = time.time()
+    run_budget = CrawlBudget(CRAWL_TIME_BUDGET_SECONDS, CRAWL_PAGE_BUDGET)
+    story_registry = StoryRegistry()
     
     try:
-        for category in selected_categories:
+        for category_idx, category in enumerate(selected_categories):
             if category not in news_categories:
                 print(f"未知的分类: {category}")
                 continue
@@ -1397,8 +3064,16 @@ def main():
             print(f"开始处理分类: {category}")
             print(f"{'='*60}")
             
+            if run_budget.exhausted():
+                print(f"爬取预算已用尽，跳过分类: {category}")
+                continue
+
+            # 依分類權重把剩餘預算分給尚未處理的分類
+            remaining_weight = sum(CATEGORY_WEIGHTS.get(c, 1.0) for c in selected_categories[category_idx:])
+            category_budget = run_budget.split(CATEGORY_WEIGHTS.get(category, 1.0) / remaining_weight)
+
             # 处理该分类的新闻
-            category_stories = process_news_pipeline(news_categories[category], category)
+            category_stories = process_news_pipeline(news_categories[category], category, category_budget, story_registry)
             
             if category_stories:
                 all_final_stories.extend(category_stories)
@@ -1440,6 +3115,24 @@ def main():
         
         print(f"   总文章数: {total_articles}")
         print(f"   总耗时: {total_duration:.2f} 秒 ({total_duration/60:.1f} 分钟)")
+        print(f"   使用页面数: {run_budget.pages_used}/{CRAWL_PAGE_BUDGET}")
+        print(f"   Google 节流断路器跳脱次数: {google_breaker.total_trips}")
+
+        if sanitize_stats:
+            print(f"   HTML 清理（依节省量排序）:")
+            ranked = sorted(sanitize_stats.items(), key=lambda kv: kv[1]["bytes_after"] - kv[1]["bytes_before"])
+            for domain, stats in ranked[:10]:
+                reduction = (1 - stats["bytes_after"] / stats["bytes_before"]) * 100 if stats["bytes_before"] else 0.0
+                print(f"      {domain}: {stats['pages']} 页 {stats['bytes_before']} -> {stats['bytes_after']} bytes (-{reduction:.1f}%)")
+
+        selector_rankings = export_selector_rankings()
+        print(f"   选择器排名已输出: {SELECTOR_RANKINGS_PATH} ({len(selector_rankings)} 个网域)")
+
+        shared_stories = story_registry.shared_stories()
+        print(f"   跨分类重复的故事数: {len(shared_stories)}")
+        for story_key, story_categories in shared_stories.items():
+            emit_metric("story_categories", story=story_key, owner=story_categories[0],
+                        categories=story_categories)
         
         # 保存数据
         if all_final_stories: